@@ -0,0 +1,201 @@
+import json
+import os
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from metrics import SQLITE_QUERY_SECONDS
+from storage import decode_message
+
+# ---------- Settings ----------
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "5000"))
+# Rows per import transaction; also the most rows held in memory at once.
+IMPORT_TRANSACTION_ROWS = int(os.environ.get("IMPORT_TRANSACTION_ROWS", "50000"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GZIP_MEDIA_TYPE = "application/gzip"
+
+ROLES = frozenset({"user", "assistant"})
+
+Row = Tuple[int, int, str, str, str]  # (id, user_id, role, message, created_at)
+
+
+# ---------- Export ----------
+def iter_messages(
+    pool, user_id: Optional[int] = None, after_id: int = 0, page_size: int = EXPORT_PAGE_SIZE
+) -> Iterator[Row]:
+    """
+    Every message (or every message of one user) with id > after_id, in
+    id order. Pages through the table with a keyset cursor, one short
+    read per page, so memory stays at one page however large the export.
+    Rows added while it runs are included up to the last page.
+    """
+    if user_id is None:
+        sql = """
+            SELECT id, user_id, role, message, created_at FROM messages
+            WHERE id > ? ORDER BY id LIMIT ?
+        """
+    else:
+        sql = """
+            SELECT id, user_id, role, message, created_at FROM messages
+            WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+        """
+
+    while True:
+        params = (after_id, page_size) if user_id is None else (user_id, after_id, page_size)
+        with SQLITE_QUERY_SECONDS.time("export_page"), pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1][0]
+
+
+def to_ndjson(rows: Iterable[Row], lines_per_chunk: int = 500) -> Iterator[bytes]:
+    """
+    One JSON object per line, handed out a few hundred lines at a time.
+    """
+    chunk: List[str] = []
+    for id_, user_id, role, message, created_at in rows:
+        chunk.append(json.dumps(
+            {"id": id_, "user_id": user_id, "role": role, "message": decode_message(message), "created_at": created_at},
+            ensure_ascii=False,
+        ))
+        if len(chunk) >= lines_per_chunk:
+            yield ("\n".join(chunk) + "\n").encode()
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Compress a byte stream into a .gz stream as it goes.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_ndjson(pool, user_id: Optional[int] = None, gzip: bool = False) -> Iterator[bytes]:
+    chunks = to_ndjson(iter_messages(pool, user_id))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+# ---------- Import ----------
+class MessageImporter:
+    """
+    Bulk-load NDJSON lines as written by export_ndjson(). Rows are
+    buffered and inserted with one executemany per transaction of
+    transaction_rows rows, so memory is bounded by that buffer.
+
+    With user_id set, every row goes to that user whatever the file says.
+    With keep_ids, rows keep their ids and ids already present are
+    skipped, so re-running a restore is harmless; otherwise rows get new
+    ids (after the existing ones, in file order).
+
+    feed() raises ValueError naming the bad line; rows of transactions
+    already committed stay imported (see .imported).
+    """
+
+    def __init__(self, pool, user_id: Optional[int] = None, keep_ids: bool = False,
+                 transaction_rows: int = IMPORT_TRANSACTION_ROWS):
+        self.pool = pool
+        self.user_id = user_id
+        self.keep_ids = keep_ids
+        self.transaction_rows = transaction_rows
+        self._rows: List[tuple] = []
+        self._line_no = 0
+
+        self.imported = 0
+        self.skipped = 0
+        self.transactions = 0
+
+    def feed(self, lines: Iterable):
+        for line in lines:
+            self._line_no += 1
+            if not line.strip():
+                continue
+            self._rows.append(self._parse(line))
+            if len(self._rows) >= self.transaction_rows:
+                self.flush()
+
+    def close(self):
+        self.flush()
+
+    def _parse(self, line) -> tuple:
+        try:
+            record = json.loads(line)
+            user_id = self.user_id if self.user_id is not None else int(record["user_id"])
+            role = record["role"]
+            message = record["message"]
+            if role not in ROLES or not isinstance(message, str):
+                raise ValueError("role must be user or assistant and message a string")
+            created_at = record.get("created_at")
+            if self.keep_ids:
+                return (int(record["id"]), user_id, role, message, created_at)
+            return (user_id, role, message, created_at)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"line {self._line_no}: {e!r}") from None
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        with SQLITE_QUERY_SECONDS.time("import_transaction"), self.pool.connection() as conn:
+            if self.keep_ids:
+                cursor = conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO messages (id, user_id, role, message, created_at)
+                    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                    """,
+                    rows,
+                )
+            else:
+                cursor = conn.executemany(
+                    """
+                    INSERT INTO messages (user_id, role, message, created_at)
+                    VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                    """,
+                    rows,
+                )
+        self.imported += cursor.rowcount
+        self.skipped += len(rows) - cursor.rowcount
+        self.transactions += 1
+
+    def stats(self) -> dict:
+        return {"imported": self.imported, "skipped": self.skipped, "transactions": self.transactions}
+
+
+class LineBuffer:
+    """
+    Cuts a byte stream that arrives in chunks (an upload, optionally
+    gzip-compressed) into lines, holding at most one partial line.
+    """
+
+    def __init__(self, gzip: bool = False):
+        self._decompressor = zlib.decompressobj(wbits=31) if gzip else None
+        self._rest = b""
+
+    def push(self, chunk: bytes) -> List[bytes]:
+        if self._decompressor is not None:
+            chunk = self._decompressor.decompress(chunk)
+        return self._split(chunk)
+
+    def finish(self) -> List[bytes]:
+        lines = []
+        if self._decompressor is not None:
+            lines = self._split(self._decompressor.flush())
+            if not self._decompressor.eof:
+                raise ValueError("truncated gzip stream")
+        if self._rest:
+            lines.append(self._rest)
+            self._rest = b""
+        return lines
+
+    def _split(self, data: bytes) -> List[bytes]:
+        lines = (self._rest + data).split(b"\n")
+        self._rest = lines.pop()
+        return lines
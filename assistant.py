@@ -0,0 +1,717 @@
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import metrics
+from metrics import ASSISTANT_CALLS, ASSISTANT_ERRORS, ASSISTANT_STAGE_SECONDS
+from ratelimit import ConcurrencyLimiter, RateLimited, SharedTokenBucketLimiter, TokenBucketLimiter
+from resilience import STATE_VALUES, CircuitBreaker, CircuitOpen, Upstream, is_transient
+from shared_state import SHARED_STATE_PATH, shared_state
+from singleflight import SingleFlight
+from storage import claim_user_thread, get_user_thread, replace_user_thread
+
+# ---------- Settings ----------
+ASSISTANT_ID = os.environ.get("ASSISTANT_ID", "asst_55iZs4Uxtgt0JmWxJwYWYOMD")
+
+# Point this at a local fake server to exercise the pipeline offline.
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+
+# Max assistant runs in flight across the deployment; up to MAX_QUEUE extra
+# callers wait (at most QUEUE_TIMEOUT seconds) for a slot, the rest are
+# refused. Each of the WEB_CONCURRENCY workers gets an equal share of both.
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+MAX_CONCURRENCY = int(os.environ.get("ASSISTANT_MAX_CONCURRENCY", "200"))
+MAX_QUEUE = int(os.environ.get("ASSISTANT_MAX_QUEUE", "400"))
+
+# Upstream run budget across the deployment (0 = unlimited), to stay inside
+# the account's quota instead of failing everyone once it is spent. With
+# SHARED_STATE_PATH set, all workers draw on one bucket in the shared store.
+UPSTREAM_RUNS_PER_MINUTE = float(os.environ.get("ASSISTANT_RUNS_PER_MINUTE", "0"))
+UPSTREAM_BURST = float(os.environ.get("ASSISTANT_RUNS_BURST", "20"))
+
+# Per-stage timeouts in seconds.
+QUEUE_TIMEOUT = float(os.environ.get("ASSISTANT_QUEUE_TIMEOUT", "30"))
+THREAD_TIMEOUT = float(os.environ.get("ASSISTANT_THREAD_TIMEOUT", "15"))
+API_TIMEOUT = float(os.environ.get("ASSISTANT_API_TIMEOUT", "15"))
+MESSAGES_TIMEOUT = float(os.environ.get("ASSISTANT_MESSAGES_TIMEOUT", "15"))
+
+# How long a request waits for its run before handing back a pending token
+# (and, when streaming, the longest gap allowed between events).
+RUN_TIMEOUT = float(os.environ.get("ASSISTANT_RUN_TIMEOUT", "60"))
+
+# Run polling: start fast, back off towards the max interval.
+POLL_INITIAL_INTERVAL = float(os.environ.get("ASSISTANT_POLL_INITIAL_MS", "250")) / 1000
+POLL_MAX_INTERVAL = float(os.environ.get("ASSISTANT_POLL_MAX_MS", "2000")) / 1000
+POLL_BACKOFF = float(os.environ.get("ASSISTANT_POLL_BACKOFF", "1.5"))
+
+# Circuit breaker: after CIRCUIT_MIN_CALLS calls, open when at least
+# CIRCUIT_FAILURE_RATIO of the last CIRCUIT_WINDOW failed transiently, and
+# fail fast for CIRCUIT_OPEN_SECONDS before letting a trial call through.
+CIRCUIT_FAILURE_RATIO = float(os.environ.get("ASSISTANT_CIRCUIT_FAILURE_RATIO", "0.5"))
+CIRCUIT_WINDOW = int(os.environ.get("ASSISTANT_CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.environ.get("ASSISTANT_CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("ASSISTANT_CIRCUIT_OPEN_SECONDS", "30"))
+
+# Attempts per API call for transient errors (timeouts, 429, 5xx), with
+# jittered exponential backoff. Run creation is only resent on 429/503.
+RETRY_ATTEMPTS = int(os.environ.get("ASSISTANT_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("ASSISTANT_RETRY_BASE_MS", "200")) / 1000
+RETRY_MAX_DELAY = float(os.environ.get("ASSISTANT_RETRY_MAX_MS", "2000")) / 1000
+
+# Hedge idempotent reads (run status, messages) slower than this latency
+# quantile of recent calls with a second request; 0 disables, 0.95 = p95.
+HEDGE_QUANTILE = float(os.environ.get("ASSISTANT_HEDGE_QUANTILE", "0"))
+
+# Pending runs nobody collects within this many seconds are cancelled.
+PENDING_RUN_TTL = float(os.environ.get("ASSISTANT_PENDING_TTL", "600"))
+# How long /ask/result waits for a pending run before answering "pending" again.
+RESULT_WAIT = float(os.environ.get("ASSISTANT_RESULT_WAIT", "10"))
+
+# Empty threads kept ready for anonymous questions (0 disables).
+ANON_THREAD_POOL_SIZE = int(os.environ.get("ANON_THREAD_POOL_SIZE", "8"))
+
+STILL_THINKING_ANSWER = "The assistant is still thinking. Please try again in a moment."
+NO_ANSWER = "I couldn’t generate a full response this time. Please try again."
+ERROR_ANSWER = "There was an issue contacting the AI service. Please try again."
+BUSY_ANSWER = "The assistant is busy right now. Please try again in a moment."
+DEGRADED_ANSWER = (
+    "The AI service is temporarily unavailable, and there is no saved answer to this question. "
+    "Please try again in a few minutes."
+)
+# Put before a saved answer to a different question (DEGRADED_SIMILARITY).
+DEGRADED_SIMILAR_NOTICE = (
+    "The AI service is temporarily unavailable. Below is a saved answer to a different question, "
+    "\u201c{question}\u201d, which may not apply to yours. Please ask again in a few minutes.\n\n"
+)
+
+# Placeholder replies returned instead of a real answer; never worth caching.
+FALLBACK_ANSWERS = frozenset({STILL_THINKING_ANSWER, NO_ANSWER, ERROR_ANSWER, BUSY_ANSWER, DEGRADED_ANSWER})
+
+ACTIVE_RUN_STATUSES = frozenset({"queued", "in_progress", "cancelling"})
+
+
+class RunPending(Exception):
+    """
+    The run outlived the request deadline. It keeps going upstream and its
+    answer can be collected later with the token.
+    """
+
+    def __init__(self, token: str):
+        super().__init__(token)
+        self.token = token
+
+
+class RunFailed(RuntimeError):
+    """
+    A streamed run ended without completing (failed, cancelled, expired...).
+    """
+
+    def __init__(self, status: str):
+        super().__init__(f"run ended with status {status}")
+        self.status = status
+
+
+# ---------- OpenAI Client ----------
+# One client per process so every request shares the same keep-alive pool.
+# It is built on first use, not at import: the SDK alone takes about a
+# third of a second to import (main's lifespan warms it up in the
+# background instead). Retries are left to `upstream` below, so they are
+# counted by the circuit breaker and not multiplied by the SDK's own.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+                _client = AsyncOpenAI(
+                    api_key=os.environ.get("OPENAI_API_KEY"),
+                    base_url=OPENAI_BASE_URL,
+                    max_retries=0,
+                    timeout=max(API_TIMEOUT, RUN_TIMEOUT),
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=MAX_CONCURRENCY,
+                            max_keepalive_connections=min(MAX_CONCURRENCY, 100),
+                        )
+                    ),
+                )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _thread_gone(error: Exception) -> bool:
+    """
+    The conversation thread was deleted upstream (or expired).
+    """
+    from openai import NotFoundError
+
+    return isinstance(error, NotFoundError)
+
+
+breaker = CircuitBreaker(
+    failure_ratio=CIRCUIT_FAILURE_RATIO,
+    window=CIRCUIT_WINDOW,
+    min_calls=CIRCUIT_MIN_CALLS,
+    open_seconds=CIRCUIT_OPEN_SECONDS,
+)
+upstream = Upstream(
+    breaker,
+    attempts=RETRY_ATTEMPTS,
+    base_delay=RETRY_BASE_DELAY,
+    max_delay=RETRY_MAX_DELAY,
+    hedge_quantile=HEDGE_QUANTILE,
+)
+metrics.Gauge(
+    "assistant_circuit_state",
+    "Assistant circuit breaker state: 0 closed, 1 half-open, 2 open.",
+    callback=lambda: STATE_VALUES[breaker.state],
+)
+
+_slots = ConcurrencyLimiter(
+    max(1, MAX_CONCURRENCY // WORKERS),
+    max_queue=MAX_QUEUE // WORKERS,
+    max_wait=QUEUE_TIMEOUT,
+)
+if SHARED_STATE_PATH:
+    _upstream_budget = SharedTokenBucketLimiter(shared_state, "upstream", UPSTREAM_RUNS_PER_MINUTE / 60, UPSTREAM_BURST)
+else:
+    _upstream_budget = TokenBucketLimiter(UPSTREAM_RUNS_PER_MINUTE / 60, UPSTREAM_BURST, max_keys=1)
+
+
+async def _admit():
+    """
+    Take a slot and then an upstream run from the budget. Raises
+    CircuitOpen (before queueing for a slot) or RateLimited. The slot comes
+    first so a request refused one has not spent budget on a run it never
+    makes.
+    """
+    try:
+        breaker.check()
+    except CircuitOpen:
+        ASSISTANT_ERRORS.inc("CircuitOpen")
+        raise
+    try:
+        with ASSISTANT_STAGE_SECONDS.time("slot_wait"):
+            await _slots.acquire()
+    except RateLimited as e:
+        print("ERROR calling assistant: no free slot,", e)
+        ASSISTANT_ERRORS.inc("NoFreeSlot")
+        raise
+    try:
+        wait = await _upstream_budget.take("upstream")
+    except BaseException:
+        _slots.release()
+        raise
+    if wait:
+        _slots.release()
+        ASSISTANT_ERRORS.inc("UpstreamBudget")
+        raise RateLimited(wait, "upstream_budget")
+
+
+def admission_stats() -> dict:
+    return {
+        **_slots.stats(),
+        "upstream_budget_limited": _upstream_budget.limited,
+        "result_polls_shared": _result_polls.shared,
+        # 0 closed, 1 half-open, 2 open (as assistant_circuit_state).
+        "circuit_state": STATE_VALUES[breaker.state],
+    }
+
+
+INSTRUCTIONS = (
+    "You are a warm, educational, supportive health assistant.\n"
+    "You give general health information only, not medical advice."
+)
+
+
+def build_prompt(user_question: str) -> str:
+    return f"User question: \"{user_question}\""
+
+
+def _run_params(thread_id: str, user_question: str) -> dict:
+    # The question rides along with the run instead of a separate
+    # messages.create call, and the instructions are sent per run so they
+    # are not repeated in the stored thread.
+    return {
+        "thread_id": thread_id,
+        "assistant_id": ASSISTANT_ID,
+        "additional_instructions": INSTRUCTIONS,
+        "additional_messages": [{"role": "user", "content": build_prompt(user_question)}],
+    }
+
+
+# ---------- Conversation Threads ----------
+# Logged-in users keep one thread, so the model sees their earlier questions.
+# Only one run may be active on a thread at a time: runs for one user queue
+# on a per-user lock in this process and take a user_run: claim in
+# shared_state, so a run in another worker is not started on the same
+# thread. The thread ids are cached only with a single worker; with several,
+# another process may replace the thread, so the stored row is read each time.
+_user_threads: Dict[int, str] = {}
+_user_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Anonymous questions each get a fresh thread (sharing one would leak one
+# visitor's questions into another's context). A few empty threads are
+# created ahead of time so that round trip is off the request path.
+_spare_threads: deque = deque()
+
+# Named background jobs, at most one running per name.
+_background_tasks: Dict[str, asyncio.Task] = {}
+
+
+def _spawn(name: str, job):
+    if name in _background_tasks:
+        return
+    task = asyncio.ensure_future(job())
+    _background_tasks[name] = task
+    task.add_done_callback(lambda t: _background_tasks.pop(name, None))
+
+
+def _user_lock(user_id: int) -> asyncio.Lock:
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[user_id] = lock
+    return lock
+
+
+async def _create_thread() -> str:
+    with ASSISTANT_STAGE_SECONDS.time("thread_create"):
+        thread = await upstream.call("threads.create", get_client().beta.threads.create, THREAD_TIMEOUT)
+    return thread.id
+
+
+async def _delete_thread(thread_id: str):
+    try:
+        await upstream.call(
+            "threads.delete",
+            lambda: get_client().beta.threads.delete(thread_id),
+            THREAD_TIMEOUT,
+            idempotent=True,
+        )
+    except Exception as e:
+        print("ERROR deleting assistant thread:", e)
+
+
+async def _user_thread_id(user_id: int) -> str:
+    thread_id = None if SHARED_STATE_PATH else _user_threads.get(user_id)
+    if thread_id is None:
+        thread_id = await asyncio.to_thread(get_user_thread, user_id)
+    if thread_id is None:
+        return await _store_user_thread(user_id, await _create_thread())
+    _user_threads[user_id] = thread_id
+    return thread_id
+
+
+async def _store_user_thread(user_id: int, thread_id: str, replacing: Optional[str] = None) -> str:
+    """
+    Make a newly created thread the user's (in place of replacing, if set)
+    and return the user's thread. If another worker stored one first, that
+    one is returned and the new thread is deleted.
+    """
+    if replacing is None:
+        stored = await asyncio.to_thread(claim_user_thread, user_id, thread_id)
+    else:
+        stored = await asyncio.to_thread(replace_user_thread, user_id, replacing, thread_id)
+    if stored != thread_id:
+        _spawn(f"delete_thread_{thread_id}", lambda: _delete_thread(thread_id))
+    _user_threads[user_id] = stored
+    return stored
+
+
+async def _refill_spare_threads():
+    try:
+        while len(_spare_threads) < ANON_THREAD_POOL_SIZE:
+            _spare_threads.append(await _create_thread())
+    except Exception as e:
+        print("ERROR pre-creating assistant thread:", e)
+
+
+async def _anonymous_thread_id() -> str:
+    thread_id = _spare_threads.popleft() if _spare_threads else await _create_thread()
+    if ANON_THREAD_POOL_SIZE > 0:
+        _spawn("refill_spare_threads", _refill_spare_threads)
+    return thread_id
+
+
+@asynccontextmanager
+async def _conversation(user_id: Optional[int]):
+    """
+    Yield (thread_id, renew) for this caller. renew() swaps a user's
+    stored thread for a new one, e.g. after it was deleted upstream.
+    """
+    if user_id is None:
+        async def renew():
+            return await _create_thread()
+
+        yield await _anonymous_thread_id(), renew
+        return
+
+    async with _user_lock(user_id):
+        # Held for the whole run; the TTL only frees it if this process dies.
+        claim = f"user_run:{user_id}"
+        claimed = await shared_state.run(shared_state.add, claim, "1", PENDING_RUN_TTL)
+        try:
+            thread_id = await _user_thread_id(user_id) if claimed else None
+            if thread_id is None or await _thread_busy(thread_id):
+                # A run in another worker or a pending run still owns the
+                # user's thread; answer this one on a throwaway thread
+                # rather than wait for it.
+                async def renew():
+                    return await _create_thread()
+
+                yield await _create_thread(), renew
+            else:
+                async def renew():
+                    return await _store_user_thread(user_id, await _create_thread(), replacing=thread_id)
+
+                yield thread_id, renew
+        finally:
+            if claimed:
+                await shared_state.run(shared_state.delete, claim)
+
+
+# ---------- Run Polling ----------
+class PendingRun:
+    __slots__ = ("thread_id", "run_id", "user_id", "question", "created_at", "answer", "recorded")
+
+    def __init__(self, thread_id: str, run_id: str, user_id: Optional[int], question: str):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.user_id = user_id
+        self.question = question
+        self.created_at = time.monotonic()
+        self.answer: Optional[str] = None
+        # Set by whoever saves the collected answer, so it is saved once.
+        self.recorded = False
+
+
+# Pending runs are also recorded in shared_state, so with several workers
+# a token can be collected by whichever process gets the /ask/result call.
+_pending_runs: Dict[str, PendingRun] = {}
+_busy_threads: Dict[str, str] = {}  # thread_id -> token of its pending run
+
+
+async def _thread_busy(thread_id: str) -> bool:
+    if thread_id in _busy_threads:
+        return True
+    return await shared_state.run(shared_state.get, f"busy_thread:{thread_id}") is not None
+
+
+async def _poll_run(thread_id: str, run, deadline: float, created_at: Optional[float] = None):
+    """
+    Poll until the run leaves the active states or the deadline passes.
+    Intervals grow from POLL_INITIAL_INTERVAL to POLL_MAX_INTERVAL, so short
+    runs are picked up quickly and long ones cost few requests.
+
+    With created_at (a loop.time() value), the time the run spent queued
+    upstream is recorded as the "run_queued" stage, to polling accuracy.
+    """
+    loop = asyncio.get_running_loop()
+    interval = POLL_INITIAL_INTERVAL
+    while run.status in ACTIVE_RUN_STATUSES:
+        if created_at is not None and run.status != "queued":
+            ASSISTANT_STAGE_SECONDS.observe(loop.time() - created_at, "run_queued")
+            created_at = None
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+        run = await _retrieve_run(thread_id, run.id)
+    return run
+
+
+async def _retrieve_run(thread_id: str, run_id: str):
+    return await upstream.call(
+        "runs.retrieve",
+        lambda: get_client().beta.threads.runs.retrieve(run_id, thread_id=thread_id),
+        API_TIMEOUT,
+        idempotent=True,
+    )
+
+
+async def _cancel_run(thread_id: str, run_id: str):
+    try:
+        await upstream.call(
+            "runs.cancel",
+            lambda: get_client().beta.threads.runs.cancel(run_id, thread_id=thread_id),
+            API_TIMEOUT,
+            idempotent=True,
+        )
+    except Exception as e:
+        print("ERROR cancelling assistant run:", e)
+
+
+async def _register_pending(thread_id: str, run_id: str, user_id: Optional[int], question: str) -> str:
+    token = secrets.token_urlsafe(16)
+    _pending_runs[token] = PendingRun(thread_id, run_id, user_id, question)
+    _busy_threads[thread_id] = token
+    _spawn("sweep_pending_runs", _sweep_pending_runs)
+
+    record = json.dumps([thread_id, run_id, user_id, question])
+    await shared_state.run(shared_state.set, f"pending_run:{token}", record, PENDING_RUN_TTL)
+    await shared_state.run(shared_state.set, f"busy_thread:{thread_id}", token, PENDING_RUN_TTL)
+    return token
+
+
+async def _load_pending(token: str) -> PendingRun:
+    """
+    A pending run registered by another worker. Raises KeyError if unknown.
+    """
+    record = await shared_state.run(shared_state.get, f"pending_run:{token}")
+    if record is None:
+        raise KeyError(token)
+    thread_id, run_id, user_id, question = json.loads(record)
+    pending = _pending_runs.setdefault(token, PendingRun(thread_id, run_id, user_id, question))
+    _spawn("sweep_pending_runs", _sweep_pending_runs)
+    return pending
+
+
+def _forget_pending(token: str):
+    pending = _pending_runs.pop(token, None)
+    if pending is not None and _busy_threads.get(pending.thread_id) == token:
+        del _busy_threads[pending.thread_id]
+
+
+async def _sweep_pending_runs():
+    """
+    Cancel runs whose token nobody came back for, and drop collected
+    results once they expire.
+    """
+    while _pending_runs:
+        await asyncio.sleep(min(PENDING_RUN_TTL, 30))
+        now = time.monotonic()
+        for token, pending in list(_pending_runs.items()):
+            if now - pending.created_at < PENDING_RUN_TTL:
+                continue
+            _forget_pending(token)
+            if pending.answer is None:
+                await _cancel_run(pending.thread_id, pending.run_id)
+
+
+async def _run_answer(thread_id: str, run) -> str:
+    if run.status != "completed":
+        print("ERROR calling assistant: run ended with status", run.status)
+        ASSISTANT_ERRORS.inc(f"run_{run.status}")
+        if run.status == "requires_action":
+            # We don't serve tool calls; free the thread for the next run.
+            await _cancel_run(thread_id, run.id)
+        return ERROR_ANSWER
+
+    # Only this run's messages, not the whole conversation.
+    with ASSISTANT_STAGE_SECONDS.time("messages_list"):
+        messages = await upstream.call(
+            "messages.list",
+            lambda: get_client().beta.threads.messages.list(thread_id=thread_id, run_id=run.id, order="asc"),
+            MESSAGES_TIMEOUT,
+            idempotent=True,
+        )
+    parts = [
+        p.text.value
+        for msg in messages.data
+        if msg.role == "assistant"
+        for p in msg.content
+        if p.type == "text"
+    ]
+    if parts:
+        return "\n".join(parts)
+
+    return NO_ANSWER
+
+
+# Clients polling the same token at once share one poll of the run: the
+# upstream sees one runs.retrieve loop per token (and worker), however many
+# requests are waiting on it. Followers get the leader's result or error.
+_result_polls = SingleFlight(max_wait=RESULT_WAIT + API_TIMEOUT, share_errors=(Exception,))
+
+
+async def collect_pending_run(token: str) -> PendingRun:
+    """
+    Wait up to RESULT_WAIT seconds for a pending run and return it with
+    .answer filled in. Raises RunPending if it is still going and KeyError
+    for unknown or expired tokens.
+    """
+    pending = _pending_runs.get(token) or await _load_pending(token)
+    if pending.answer is not None:
+        return pending
+    return await _result_polls.do(token, lambda: _poll_pending(token, pending))
+
+
+async def _poll_pending(token: str, pending: PendingRun) -> PendingRun:
+    loop = asyncio.get_running_loop()
+    run = await _retrieve_run(pending.thread_id, pending.run_id)
+    run = await _poll_run(pending.thread_id, run, loop.time() + RESULT_WAIT)
+    if run.status in ACTIVE_RUN_STATUSES:
+        raise RunPending(token)
+
+    if pending.answer is None:
+        pending.answer = await _run_answer(pending.thread_id, run)
+        if _busy_threads.get(pending.thread_id) == token:
+            del _busy_threads[pending.thread_id]
+        await shared_state.run(shared_state.delete, f"busy_thread:{pending.thread_id}")
+    return pending
+
+
+# ---------- Assistant Calls ----------
+async def _create_run(thread_id: str, user_question: str):
+    return await upstream.call(
+        "runs.create",
+        lambda: get_client().beta.threads.runs.create(**_run_params(thread_id, user_question)),
+        API_TIMEOUT,
+    )
+
+
+async def _open_stream(thread_id: str, user_question: str):
+    """
+    Start a streamed run; returns (manager, stream).
+    """
+
+    async def open_once():
+        manager = get_client().beta.threads.runs.stream(**_run_params(thread_id, user_question))
+        return manager, await manager.__aenter__()
+
+    return await upstream.call("runs.stream", open_once, API_TIMEOUT)
+
+
+async def _ask_assistant(user_question: str, user_id: Optional[int] = None) -> str:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + RUN_TIMEOUT
+
+    async with _conversation(user_id) as (thread_id, renew):
+        with ASSISTANT_STAGE_SECONDS.time("run_create"):
+            try:
+                run = await _create_run(thread_id, user_question)
+            except Exception as e:
+                if not _thread_gone(e):
+                    raise
+                thread_id = await renew()
+                run = await _create_run(thread_id, user_question)
+
+        created_at = loop.time()
+        try:
+            run = await _poll_run(thread_id, run, deadline, created_at)
+        except asyncio.CancelledError:
+            # Nobody is waiting for this answer any more.
+            _spawn(f"cancel_{run.id}", lambda: _cancel_run(thread_id, run.id))
+            raise
+        ASSISTANT_STAGE_SECONDS.observe(loop.time() - created_at, "run")
+
+        if run.status in ACTIVE_RUN_STATUSES:
+            raise RunPending(await _register_pending(thread_id, run.id, user_id, user_question))
+
+        return await _run_answer(thread_id, run)
+
+
+async def call_health_assistant(user_question: str, user_id: Optional[int] = None) -> str:
+    """
+    Call your OpenAI Health Assistant and return a warm, educational answer.
+    With a user_id the question continues that user's conversation thread.
+    Raises RunPending if the run is still going at the request deadline,
+    RateLimited if the run budget or the wait queue is exhausted, and
+    CircuitOpen while the circuit breaker considers upstream down.
+    """
+    ASSISTANT_CALLS.inc("ask")
+    await _admit()
+
+    try:
+        return await _ask_assistant(user_question, user_id)
+    except RunPending:
+        raise
+    except CircuitOpen as e:
+        print("ERROR calling assistant:", e)
+        ASSISTANT_ERRORS.inc("CircuitOpen")
+        raise
+    except asyncio.TimeoutError:
+        print("ERROR calling assistant: stage timed out")
+        ASSISTANT_ERRORS.inc("TimeoutError")
+        return ERROR_ANSWER
+    except Exception as e:
+        print("ERROR calling assistant:", e)
+        ASSISTANT_ERRORS.inc(type(e).__name__)
+        return ERROR_ANSWER
+    finally:
+        _slots.release()
+
+
+_FAILED_RUN_EVENTS = {
+    "thread.run.failed",
+    "thread.run.cancelled",
+    "thread.run.expired",
+    "thread.run.incomplete",
+}
+
+
+async def stream_health_assistant(user_question: str, user_id: Optional[int] = None):
+    """
+    Yield the answer text piece by piece as the run produces it.
+    Errors are raised to the caller, which decides how to report them.
+    """
+    ASSISTANT_CALLS.inc("stream")
+    loop = asyncio.get_running_loop()
+    await _admit()
+
+    try:
+        async with _conversation(user_id) as (thread_id, renew):
+            with ASSISTANT_STAGE_SECONDS.time("run_create"):
+                try:
+                    stream_manager, stream = await _open_stream(thread_id, user_question)
+                except Exception as e:
+                    if not _thread_gone(e):
+                        raise
+                    thread_id = await renew()
+                    stream_manager, stream = await _open_stream(thread_id, user_question)
+            created_at = loop.time()
+
+            try:
+                events = stream.__aiter__()
+                while True:
+                    # RUN_TIMEOUT bounds the gap between events, not the whole answer.
+                    try:
+                        event = await asyncio.wait_for(events.__anext__(), RUN_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+
+                    if event.event == "thread.message.delta":
+                        for part in event.data.delta.content or []:
+                            if part.type == "text" and part.text and part.text.value:
+                                yield part.text.value
+                    elif event.event == "thread.run.in_progress":
+                        ASSISTANT_STAGE_SECONDS.observe(loop.time() - created_at, "run_queued")
+                    elif event.event in _FAILED_RUN_EVENTS:
+                        raise RunFailed(event.event.rsplit(".", 1)[-1])
+                ASSISTANT_STAGE_SECONDS.observe(loop.time() - created_at, "run")
+            except Exception as e:
+                # A stream dying mid-answer counts against upstream health too.
+                if is_transient(e):
+                    breaker.record_failure()
+                raise
+            finally:
+                await stream_manager.__aexit__(None, None, None)
+    except RunFailed as e:
+        ASSISTANT_ERRORS.inc(f"run_{e.status}")
+        raise
+    except Exception as e:
+        ASSISTANT_ERRORS.inc(type(e).__name__)
+        raise
+    finally:
+        _slots.release()
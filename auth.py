@@ -0,0 +1,198 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+# ---------- Settings ----------
+# New and upgraded hashes use this KDF; "scrypt" or "pbkdf2_sha256".
+KDF = os.environ.get("AUTH_KDF", "scrypt")
+SCRYPT_N = int(os.environ.get("AUTH_SCRYPT_N", str(2**14)))
+SCRYPT_R = int(os.environ.get("AUTH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("AUTH_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.environ.get("AUTH_PBKDF2_ITERATIONS", "600000"))
+
+# KDF work runs in its own processes so login storms can't starve the
+# event loop or the request threadpool.
+HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING_HASHES = int(os.environ.get("AUTH_MAX_PENDING_HASHES", "64"))
+
+# Repeat logins with the same credentials within this window skip the KDF.
+CREDENTIAL_CACHE_TTL = float(os.environ.get("AUTH_CREDENTIAL_CACHE_TTL", "300"))
+CREDENTIAL_CACHE_SIZE = int(os.environ.get("AUTH_CREDENTIAL_CACHE_SIZE", "10000"))
+
+# Session tokens are signed with this secret. Set it explicitly when running
+# several workers, otherwise each process signs with its own random key.
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "").encode() or secrets.token_bytes(32)
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(12 * 3600)))
+
+
+# ---------- Password Hashing (runs in worker processes) ----------
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text.encode())
+
+
+def _current_params() -> Tuple[str, ...]:
+    if KDF == "pbkdf2_sha256":
+        return ("pbkdf2_sha256", str(PBKDF2_ITERATIONS))
+    return ("scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P))
+
+
+def _derive(password: str, params: Tuple[str, ...], salt: bytes) -> bytes:
+    if params[0] == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, int(params[1]))
+    n, r, p = (int(x) for x in params[1:4])
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=128 * n * r * p + 1024 * 1024)
+
+
+def make_hash(password: str, params: Tuple[str, ...]) -> str:
+    """
+    Stored format: "<kdf>$<cost params...>$<salt>$<hash>" (base64 fields).
+    """
+    salt = secrets.token_bytes(16)
+    return "$".join(params + (_b64(salt), _b64(_derive(password, params, salt))))
+
+
+def check_hash(password: str, stored: str) -> bool:
+    if "$" not in stored:
+        # Legacy unsalted sha256 hex digest from before per-user salts.
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+
+    fields = stored.split("$")
+    params, salt, expected = tuple(fields[:-2]), _unb64(fields[-2]), _unb64(fields[-1])
+    return hmac.compare_digest(_derive(password, params, salt), expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    return tuple(stored.split("$")[:-2]) != _current_params()
+
+
+# ---------- Async API ----------
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pending = asyncio.Semaphore(MAX_PENDING_HASHES)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: don't fork a process that already runs an event loop
+            # and thread pools.
+            _executor = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+async def _offload(fn, *args):
+    async with _pending:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _offload(make_hash, password, _current_params())
+
+
+async def verify_password(password: str, stored: str) -> Tuple[bool, Optional[str]]:
+    """
+    Check a password against its stored hash. Returns (ok, new_hash) where
+    new_hash is set when the stored hash used outdated parameters and
+    should be replaced.
+    """
+    ok = await _offload(check_hash, password, stored)
+    if ok and needs_rehash(stored):
+        return True, await hash_password(password)
+    return ok, None
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+# ---------- Verified-Credential Cache ----------
+class CredentialCache:
+    """
+    Remembers credentials that recently passed the KDF check, keyed by an
+    HMAC of username and password (the password itself is never kept).
+    An entry only counts while the user's stored hash is unchanged.
+    """
+
+    def __init__(self, ttl: float = CREDENTIAL_CACHE_TTL, max_entries: int = CREDENTIAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(username: str, password: str) -> bytes:
+        return hmac.new(SESSION_SECRET, f"{username}\0{password}".encode(), hashlib.sha256).digest()
+
+    def check(self, username: str, password: str, stored: str) -> bool:
+        key = self._key(username, password)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            cached_hash, expires = entry
+            if expires < time.monotonic() or cached_hash != stored:
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, username: str, password: str, stored: str):
+        if self.ttl <= 0:
+            return
+        key = self._key(username, password)
+        with self._lock:
+            self._entries[key] = (stored, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+credential_cache = CredentialCache()
+
+
+# ---------- Session Tokens ----------
+def _sign(payload: str) -> str:
+    return hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).hexdigest()
+
+
+def create_session_token(user_id: int) -> str:
+    payload = f"{user_id}.{int(time.time()) + SESSION_TTL}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token: str) -> Optional[int]:
+    """
+    Return the user id for a valid, unexpired token, else None.
+    """
+    try:
+        user_id, expires, signature = token.split(".")
+        payload = f"{user_id}.{expires}"
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        if int(expires) < time.time():
+            return None
+        return int(user_id)
+    except ValueError:
+        return None
@@ -0,0 +1,96 @@
+"""
+Export/import throughput and memory at scale.
+
+    python bench/bench_archive.py [--rows 10000000] [--gzip]
+
+Seeds a throwaway database with --rows messages, then runs
+`manage.py export` on it and `manage.py import` of that file into a fresh
+database, each as a child process. It reports rows/s and the child's
+peak RSS. The same is done at a tenth of --rows first: with streaming
+export and bounded import batches, peak RSS should be about the same at
+both sizes. Import speed includes full-text indexing (the messages_fts
+trigger), which is most of its cost. Prints JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANAGE = os.path.join(ROOT, "manage.py")
+
+WORDS = "blood pressure sleep water headache stretch fever rest doctor symptoms daily walk".split()
+
+
+def seed(path: str, rows: int, batch: int = 50000):
+    subprocess.run([sys.executable, MANAGE, "init-db"], env={**os.environ, "HEALTH_DB_PATH": path},
+                   check=True, stdout=subprocess.DEVNULL)
+    rng = random.Random(1)
+    conn = sqlite3.connect(path)
+    # Seeding speed is not what is measured here; skip the search index.
+    conn.execute("DROP TRIGGER messages_fts_insert")
+    for offset in range(0, rows, batch):
+        data = [
+            (rng.randint(1, 10000), "user" if i % 2 == 0 else "assistant",
+             " ".join(rng.choices(WORDS, k=rng.randint(10, 80))))
+            for i in range(min(batch, rows - offset))
+        ]
+        with conn:
+            conn.executemany("INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)", data)
+    conn.close()
+
+
+def run_child(args, db_path: str) -> dict:
+    """
+    Run manage.py with args against db_path; returns seconds and peak RSS.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, MANAGE, *args], env={**os.environ, "HEALTH_DB_PATH": db_path},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(process.stderr.read().decode())
+    return {"seconds": round(time.perf_counter() - start, 1), "peak_rss_mb": round(usage.ru_maxrss / 1024, 1)}
+
+
+def run(rows: int, use_gzip: bool) -> dict:
+    tmp = tempfile.mkdtemp()
+    source = os.path.join(tmp, "source.db")
+    target = os.path.join(tmp, "target.db")
+    dump = os.path.join(tmp, "messages.ndjson" + (".gz" if use_gzip else ""))
+
+    seed(source, rows)
+    exported = run_child(["export", "--output", dump], source)
+    exported["rows_per_s"] = round(rows / exported["seconds"])
+    exported["file_mb"] = round(os.path.getsize(dump) / 1e6, 1)
+
+    imported = run_child(["import", dump, "--keep-ids"], target)
+    imported["rows_per_s"] = round(rows / imported["seconds"])
+
+    with sqlite3.connect(target) as conn:
+        (count,) = conn.execute("SELECT COUNT(*) FROM messages").fetchone()
+    for path in (source, target, dump):
+        os.remove(path)
+    return {"rows": rows, "export": exported, "import": imported, "rows_after_import": count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    runs = [run(n, args.gzip) for n in (args.rows // 10, args.rows)]
+    for result in runs:
+        print(json.dumps(result), file=sys.stderr)
+    print(json.dumps({"gzip": args.gzip, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+/ask/batch against the same questions sent one /ask at a time.
+
+    python bench/bench_batch.py [--questions 40] [--concurrency 8] [--run-latency 1.0]
+
+Starts bench/fake_openai.py and uvicorn main:app (with
+ASK_BATCH_CONCURRENCY=--concurrency), logs a user in and asks
+--questions new questions three ways: serially through /ask, as one
+/ask/batch, and as one streamed /ask/batch, timing the first and last
+streamed result. Every question is new in each run, so nothing comes from
+the answer cache. Also checks that results come back in order and that
+the batch's history rows were saved. Prints JSON.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from load_test import free_port, wait_until_up  # noqa: E402
+
+QUESTION = "How much water should I drink on a hot day, run {} question {}?"
+
+
+def run(client: httpx.Client, args, headers: dict) -> dict:
+    results = {}
+
+    start = time.perf_counter()
+    for i in range(args.questions):
+        client.post("/ask", json={"question": QUESTION.format("serial", i)}, headers=headers).raise_for_status()
+    results["serial_s"] = round(time.perf_counter() - start, 2)
+
+    start = time.perf_counter()
+    response = client.post(
+        "/ask/batch",
+        json={"questions": [{"question": QUESTION.format("batch", i)} for i in range(args.questions)]},
+        headers=headers,
+    )
+    response.raise_for_status()
+    batch = response.json()["results"]
+    results["batch_s"] = round(time.perf_counter() - start, 2)
+    results["batch_in_order"] = [r["index"] for r in batch] == list(range(args.questions))
+    results["batch_statuses"] = sorted({r["status"] for r in batch})
+
+    start = time.perf_counter()
+    arrivals = []
+    with client.stream(
+        "POST",
+        "/ask/batch",
+        params={"stream": "true"},
+        json={"questions": [{"question": QUESTION.format("stream", i)} for i in range(args.questions)]},
+        headers=headers,
+    ) as response:
+        for line in response.iter_lines():
+            if line:
+                json.loads(line)
+                arrivals.append(time.perf_counter() - start)
+    results["stream_first_result_s"] = round(arrivals[0], 2)
+    results["stream_last_result_s"] = round(arrivals[-1], 2)
+    results["stream_results"] = len(arrivals)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--run-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    db_path = os.path.join(tempfile.mkdtemp(), "bench_batch.db")
+    env = {
+        "ASK_RATE_PER_MINUTE": "0",
+        "ASK_BATCH_RATE_PER_MINUTE": "0",
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake_url + "/v1",
+        "HEALTH_DB_PATH": db_path,
+        "ANSWER_CACHE_DB": "",
+        "ASK_BATCH_CONCURRENCY": str(args.concurrency),
+    }
+    processes = [
+        subprocess.Popen([
+            sys.executable, os.path.join(ROOT, "bench", "fake_openai.py"),
+            "--port", str(fake_port), "--run-latency", str(args.run_latency), "--failure-rate", "0",
+        ]),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        ),
+    ]
+    try:
+        wait_until_up(fake_url + "/stats")
+        wait_until_up(app_url + "/stats")
+        with httpx.Client(base_url=app_url, timeout=600) as client:
+            client.post("/signup", json={"username": "bench", "password": "bench"})
+            token = client.post("/login", json={"username": "bench", "password": "bench"}).json()["token"]
+            results = run(client, args, {"Authorization": f"Bearer {token}"})
+            time.sleep(0.5)  # let the history writer flush
+            stats = client.get("/stats").json()["message_writer"]
+            results["history_rows_written"] = stats["written"]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print(json.dumps({"config": vars(args), **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
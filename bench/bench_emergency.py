@@ -0,0 +1,91 @@
+"""
+Micro-benchmark: compiled emergency detector vs the old per-request scan.
+
+    python bench/bench_emergency.py [--phrases 2000] [--repeat 20000]
+
+The old scan rebuilt the phrase list, lowercased the message and did one
+substring search per phrase. Both are timed with the shipped phrase list
+and with it padded out to --phrases synthetic entries.
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emergency import EmergencyDetector, Phrase, load_phrases  # noqa: E402
+
+LEGACY_PHRASES = [
+    "not breathing",
+    "can't breathe",
+    "cannot breathe",
+    "bleeding a lot",
+    "overdose",
+    "suicidal",
+    "kill myself",
+    "want to hurt myself",
+    "heart attack",
+    "stroke",
+    "chest pain",
+    "passed out",
+    "unconscious",
+]
+
+MESSAGES = [
+    "Why do I feel lightheaded when I stand up?",
+    "I have had a mild headache for two days and I'm not sure if I should worry about it or just drink more water.",
+    "My father has chest pain and is sweating a lot",
+    "What are good habits for better sleep? " * 8,
+]
+
+
+def legacy_scan(text, phrases):
+    text_lower = text.lower()
+    emergencies = list(phrases)
+    return any(word in text_lower for word in emergencies)
+
+
+def synthetic_phrases(count, seed=7):
+    rng = random.Random(seed)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(500)]
+    return [" ".join(rng.choices(words, k=rng.randint(1, 4))) for _ in range(count)]
+
+
+def per_call_us(fn, repeat):
+    return timeit.timeit(fn, number=repeat) / repeat * 1e6
+
+
+def run(phrase_count, repeat):
+    shipped = load_phrases()
+    extra = synthetic_phrases(max(0, phrase_count - len(shipped)))
+
+    results = {}
+    for label, legacy_list, phrases in [
+        ("shipped", LEGACY_PHRASES, shipped),
+        (f"{phrase_count}_phrases", LEGACY_PHRASES + extra, shipped + [Phrase(p, 1.0, "synthetic") for p in extra]),
+    ]:
+        detector = EmergencyDetector(phrases)
+        legacy_us = [per_call_us(lambda m=m: legacy_scan(m, legacy_list), repeat) for m in MESSAGES]
+        detector_us = [per_call_us(lambda m=m: detector.is_emergency(m), repeat) for m in MESSAGES]
+        results[label] = {
+            "phrases": len(phrases),
+            "legacy_us": round(sum(legacy_us) / len(MESSAGES), 2),
+            "detector_us": round(sum(detector_us) / len(MESSAGES), 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phrases", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.phrases, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+The FAQ store: warm-up job, lookups, and swapping in a new version.
+
+    python bench/bench_faq.py [--questions 50] [--concurrency 8] [--run-latency 1.0] [--asks 20]
+
+Starts bench/fake_openai.py and uvicorn main:app (answer cache off,
+FAQ_RELOAD_INTERVAL=0.5), then:
+  1. runs `manage.py warm-faq` on --questions questions and times it;
+  2. waits for the server to load that version and times --asks /ask
+     calls for FAQ questions (reworded: other case and punctuation) and
+     for new ones;
+  3. times FaqStore.get() in process against the same file;
+  4. runs warm-faq again while a client keeps asking FAQ questions, and
+     checks every answer during the swap came from the store.
+Prints JSON.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+sys.path.insert(0, ROOT)
+
+from load_test import free_port, wait_until_up  # noqa: E402
+
+QUESTION = "How much sleep does someone aged {} need?"
+
+
+def run_warm_faq(env: dict, questions_file: str, concurrency: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "manage.py", "warm-faq", "--questions", questions_file, "--concurrency", str(concurrency)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def wait_for_version(client: httpx.Client, version: int) -> float:
+    start = time.perf_counter()
+    while client.get("/stats").json()["faq"]["version"] < version:
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+
+def time_asks(client: httpx.Client, questions) -> dict:
+    timings = []
+    for question in questions:
+        start = time.perf_counter()
+        client.post("/ask", json={"question": question}).raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return {"p50_ms": round(statistics.median(timings) * 1000, 2), "max_ms": round(max(timings) * 1000, 2)}
+
+
+def lookup_us(path: str, questions) -> float:
+    from faq import FaqStore
+
+    store = FaqStore(path)
+    store.refresh()
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for question in questions:
+            store.get(question)
+    return (time.perf_counter() - start) / (rounds * len(questions)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--run-latency", type=float, default=1.0)
+    parser.add_argument("--asks", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    questions = [QUESTION.format(age) for age in range(args.questions)]
+    questions_file = os.path.join(tmp, "questions.txt")
+    with open(questions_file, "w") as f:
+        f.write("# bench questions\n" + "\n".join(questions) + "\n")
+    store_path = os.path.join(tmp, "faq.db")
+
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    env = {
+        "ASK_RATE_PER_MINUTE": "0",
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake_url + "/v1",
+        "HEALTH_DB_PATH": os.path.join(tmp, "bench_faq.db"),
+        "ANSWER_CACHE_SIZE": "0",
+        "ANSWER_CACHE_DB": "",
+        "FAQ_STORE_PATH": store_path,
+        "FAQ_RELOAD_INTERVAL": "0.5",
+        "MAINTENANCE_INTERVAL": "0",
+    }
+    processes = [
+        subprocess.Popen([
+            sys.executable, os.path.join(ROOT, "bench", "fake_openai.py"),
+            "--port", str(fake_port), "--run-latency", str(args.run_latency), "--failure-rate", "0",
+        ]),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        ),
+    ]
+    results = {}
+    try:
+        wait_until_up(fake_url + "/stats")
+        wait_until_up(app_url + "/stats")
+        with httpx.Client(base_url=app_url, timeout=120) as client:
+            results["warm_faq"] = run_warm_faq(env, questions_file, args.concurrency)
+            results["reload_wait_s"] = round(wait_for_version(client, 1), 2)
+
+            reworded = [q.upper().replace("?", " ?!") for q in questions[:args.asks]]
+            results["ask_faq_hit"] = time_asks(client, reworded)
+            results["ask_miss"] = time_asks(client, [f"Is coffee bad for me, case {i}?" for i in range(args.asks)])
+            results["lookup_us"] = round(lookup_us(store_path, reworded + ["not in the store"]), 2)
+
+            # Ask store questions without pause while version 2 is built and swapped in.
+            stop = threading.Event()
+            swap = {"asked": 0, "not_from_store": 0}
+
+            def ask_during_swap():
+                with httpx.Client(base_url=app_url, timeout=120) as c:
+                    while not stop.is_set():
+                        start = time.perf_counter()
+                        c.post("/ask", json={"question": questions[swap["asked"] % len(questions)]}).raise_for_status()
+                        swap["asked"] += 1
+                        if time.perf_counter() - start > args.run_latency / 2:
+                            swap["not_from_store"] += 1
+
+            asker = threading.Thread(target=ask_during_swap)
+            asker.start()
+            results["warm_faq_again"] = run_warm_faq(env, questions_file, args.concurrency)
+            wait_for_version(client, 2)
+            time.sleep(0.5)
+            stop.set()
+            asker.join()
+            results["during_swap"] = swap
+            results["server_faq"] = client.get("/stats").json()["faq"]
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print(json.dumps({"config": vars(args), **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
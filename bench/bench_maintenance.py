@@ -0,0 +1,103 @@
+"""
+Space reclaimed and writer stalls from one maintenance pass.
+
+    python bench/bench_maintenance.py [--rows 500000] [--days 365]
+                                      [--retention-days 180] [--compress-after-days 30]
+
+Seeds a throwaway database with --rows messages spread evenly over the
+last --days days (assistant answers of 0.5-4 KB), then runs
+run_maintenance() while a writer thread keeps inserting one row every
+few milliseconds, as /ask would. Prints the maintenance report next to
+the writer's worst and p99 insert latency, and checks that a compressed
+answer still reads back and is still found by search. A second pass
+then shows what each later one costs when there is nothing new to do.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["HEALTH_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_maintenance.db")
+
+from maintenance import run_maintenance  # noqa: E402
+from search import search_history  # noqa: E402
+from storage import decode_message, init_db, pool  # noqa: E402
+
+WORDS = ("blood pressure sleep water headache stretch fever rest doctor symptoms daily walk hydration "
+         "vitamin protein posture knee shoulder allergy migraine").split()
+
+
+def seed(rows: int, days: int, batch: int = 20000):
+    rng = random.Random(1)
+    init_db()
+    start = time.time() - days * 86400
+    step = days * 86400 / rows
+    for offset in range(0, rows, batch):
+        data = []
+        for i in range(offset, min(rows, offset + batch)):
+            role = "user" if i % 2 == 0 else "assistant"
+            words = rng.randint(8, 30) if role == "user" else rng.randint(80, 600)
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i * step))
+            data.append((rng.randint(1, 1000), role, " ".join(rng.choices(WORDS, k=words)), created))
+        with pool.connection() as conn:
+            conn.executemany("INSERT INTO messages (user_id, role, message, created_at) VALUES (?, ?, ?, ?)", data)
+
+
+def writer(stop: threading.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO messages (user_id, role, message) VALUES (1, 'user', 'how much water a day')")
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.005)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--retention-days", type=float, default=180)
+    parser.add_argument("--compress-after-days", type=float, default=30)
+    args = parser.parse_args()
+
+    seed(args.rows, args.days)
+    stop, latencies = threading.Event(), []
+    thread = threading.Thread(target=writer, args=(stop, latencies))
+    thread.start()
+    report = run_maintenance(pool, args.retention_days, "", args.compress_after_days)
+    stop.set()
+    thread.join()
+    second = run_maintenance(pool, args.retention_days, "", args.compress_after_days)
+
+    with pool.connection() as conn:
+        row = conn.execute(
+            "SELECT id, user_id, message FROM messages WHERE typeof(message) = 'blob' ORDER BY id LIMIT 1"
+        ).fetchone()
+    if row is not None:
+        text = decode_message(row[2])
+        word = text.split()[0]
+        found = any(hit["id"] == row[0] for hit in search_history(row[1], word, 1000))
+        compressed_check = {"reads_back": bool(text), "found_by_search": found}
+    else:
+        compressed_check = None
+
+    latencies.sort()
+    print(json.dumps({
+        "rows": args.rows,
+        "report": report.as_dict(),
+        "writer_inserts": len(latencies),
+        "writer_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+        "writer_max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+        "compressed_row": compressed_check,
+        "second_pass_seconds": round(second.seconds, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cost of per-client token buckets at scale.
+
+    python bench/bench_ratelimit.py [--keys 100000] [--ops 1000000]
+
+Fills a TokenBucketLimiter with --keys distinct clients, then times
+acquire() for random existing keys (steady state) and for a stream of
+new keys (each creating a bucket and evicting an idle one). Memory per key
+comes from tracemalloc. A final pass advances the clock past the idle
+window to check that idle keys are reclaimed. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit  # noqa: E402
+from ratelimit import TokenBucketLimiter  # noqa: E402
+
+
+def ns_per_op(fn, keys) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        fn(key)
+    return round((time.perf_counter() - start) / len(keys) * 1e9, 1)
+
+
+def run(n_keys: int, ops: int) -> dict:
+    keys = [f"ip:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(n_keys)]
+    limiter = TokenBucketLimiter(rate=20 / 60, burst=10, max_keys=n_keys)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for key in keys:
+        limiter.acquire(key)
+    bytes_per_key = (tracemalloc.get_traced_memory()[0] - before) / n_keys
+    tracemalloc.stop()
+
+    hot = random.choices(keys, k=ops)
+    steady = ns_per_op(limiter.acquire, hot)
+    fresh = [f"user:{i}" for i in range(ops)]
+    churn = ns_per_op(limiter.acquire, fresh)
+
+    # Jump past the idle window: the next acquire sweeps everything idle.
+    real_monotonic = time.monotonic
+    ratelimit.time.monotonic = lambda: real_monotonic() + limiter._idle_after + 1
+    try:
+        limiter.acquire("after-idle")
+    finally:
+        ratelimit.time.monotonic = real_monotonic
+
+    return {
+        "keys": n_keys,
+        "bytes_per_key": round(bytes_per_key),
+        "acquire_existing_key_ns": steady,
+        "acquire_new_key_with_eviction_ns": churn,
+        "keys_left_after_idle_window": limiter.stats()["keys"],
+        "stats": limiter.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--ops", type=int, default=1_000_000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.keys, args.ops), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+How /ask behaves through an upstream outage and latency spikes.
+
+    python bench/bench_resilience.py [--requests 200] [--concurrency 20]
+                                     [--open-seconds 3] [--hedge-quantile 0.95]
+                                     [--degraded-similarity 0.6]
+
+Starts bench/fake_openai.py and uvicorn main:app, then drives anonymous
+/ask traffic through four phases, changing the fake's faults between
+them via its /faults endpoint:
+
+  healthy    no faults; fills the answer cache
+  outage     every upstream call answers 500; half the questions are
+             rewordings of cached ones, half are new
+  recovery   faults cleared; waits --open-seconds for the half-open trial
+  spikes     --slow-rate of upstream calls take --slow-latency seconds longer
+
+Each phase reports latency and error rate (load_test.py's summary), the
+circuit state at its end, and how much the circuit breaker, retry, hedge
+and degraded-answer counters from /metrics moved. During the outage, p95
+should drop to milliseconds once the circuit opens. Reworded questions
+get DEGRADED_ANSWER unless --degraded-similarity is set (the rewording
+scores about 0.65), in which case they get the cached answer under the
+notice naming the original question. Compare spikes with and without
+--hedge-quantile for the effect of hedging. Prints JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from load_test import answered, free_port, run_load, wait_until_up  # noqa: E402
+
+QUESTION = "Why do I feel lightheaded when I stand up after sitting, case {}?"
+REWORDED = "why do i feel light headed when i stand up after sitting case {}"
+NEW_QUESTION = "What helps with a sore throat from shouting at match {}?"
+
+TRACKED = (
+    "assistant_circuit_state",
+    "assistant_circuit_transitions_total",
+    "assistant_upstream_retries_total",
+    "assistant_upstream_hedges_total",
+    "assistant_degraded_answers_total",
+)
+
+
+def scrape(app_url: str) -> dict:
+    """
+    The TRACKED series from /metrics, as {"name{labels}": value}.
+    """
+    values = defaultdict(float)
+    for line in httpx.get(app_url + "/metrics").text.splitlines():
+        if line.startswith(TRACKED):
+            series, value = line.rsplit(" ", 1)
+            values[series] = float(value)
+    return values
+
+
+def delta(before: dict, after: dict) -> dict:
+    return {
+        series: after[series] - before.get(series, 0)
+        for series in sorted(after)
+        if after[series] != before.get(series, 0) and not series.startswith("assistant_circuit_state")
+    }
+
+
+async def run_phases(args, app_url: str, fake_url: str) -> dict:
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app_url, timeout=120, limits=limits) as client:
+
+        async def ask(question: str) -> bool:
+            return answered(await client.post("/ask", json={"question": question}))
+
+        async def phase(name: str, faults: dict, request):
+            await client.post(fake_url + "/faults", json=faults)
+            before = scrape(app_url)
+            summary = await run_load(args.requests, args.concurrency, request)
+            after = scrape(app_url)
+            summary["circuit_state"] = after.get("assistant_circuit_state", 0)
+            summary["counters"] = delta(before, after)
+            results[name] = summary
+            print(name, json.dumps(summary), file=sys.stderr)
+
+        cached = args.requests
+        await phase("healthy", {"http_error_rate": 0, "slow_rate": 0}, lambda i: ask(QUESTION.format(i)))
+        await phase(
+            "outage",
+            {"http_error_rate": 1},
+            lambda i: ask(REWORDED.format(i % cached) if i % 2 else NEW_QUESTION.format(i)),
+        )
+        await client.post(fake_url + "/faults", json={"http_error_rate": 0})
+        await asyncio.sleep(args.open_seconds + 0.5)
+        await phase("recovery", {}, lambda i: ask(NEW_QUESTION.format(f"r{i}")))
+        await phase(
+            "spikes",
+            {"slow_rate": args.slow_rate, "slow_latency": args.slow_latency},
+            lambda i: ask(NEW_QUESTION.format(f"s{i}")),
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per phase")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--open-seconds", type=float, default=3)
+    parser.add_argument("--hedge-quantile", type=float, default=0)
+    parser.add_argument("--degraded-similarity", type=float, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    env = {
+        "ASK_RATE_PER_MINUTE": "0",
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake_url + "/v1",
+        "HEALTH_DB_PATH": os.path.join(tempfile.mkdtemp(), "bench_resilience.db"),
+        "ANSWER_CACHE_DB": "",
+        "ANSWER_CACHE_SIZE": str(max(1000, args.requests)),
+        "ASSISTANT_CIRCUIT_OPEN_SECONDS": str(args.open_seconds),
+        "ASSISTANT_HEDGE_QUANTILE": str(args.hedge_quantile),
+        "DEGRADED_SIMILARITY": str(args.degraded_similarity),
+    }
+    processes = [
+        subprocess.Popen([sys.executable, os.path.join(ROOT, "bench", "fake_openai.py"), "--port", str(fake_port)]),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        ),
+    ]
+    try:
+        wait_until_up(fake_url + "/stats")
+        wait_until_up(app_url + "/stats")
+        results = asyncio.run(run_phases(args, app_url, fake_url))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print(json.dumps({"config": vars(args), "phases": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Bytes on the wire and requests/s for the home page: the old inline HTML
+string vs the pre-built static bundle.
+
+    python bench/bench_root.py [--requests 3000]
+
+"legacy" serves the page, CSS and JS inlined into one uncompressed
+HTMLResponse, as read_root used to. "first_visit" is the new page plus its
+hashed CSS/JS, gzip-encoded. "repeat_visit" is a browser revalidating the
+page with If-None-Match (assets come from its cache). Throughput is
+measured in-process with Starlette's TestClient, so compare the numbers to
+each other rather than to production. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import HTMLResponse  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from static_assets import STATIC_DIR, StaticBundle  # noqa: E402
+import main  # noqa: E402
+
+
+def legacy_page() -> str:
+    def read(name):
+        with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as f:
+            return f.read()
+
+    page = read("index.html")
+    page = page.replace('<link rel="stylesheet" href="{{app.css}}" />', "<style>\n" + read("app.css") + "</style>")
+    return page.replace('<script src="{{app.js}}" defer></script>', "<script>\n" + read("app.js") + "</script>")
+
+
+def wire_bytes(response) -> int:
+    header_bytes = sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+    return header_bytes + int(response.headers.get("content-length", len(response.content)))
+
+
+def requests_per_second(client, url, headers, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get(url, headers=headers)
+    return round(count / (time.perf_counter() - start), 1)
+
+
+def main_bench(count):
+    legacy_app = FastAPI()
+    html = legacy_page()
+
+    @legacy_app.get("/", response_class=HTMLResponse)
+    def read_root():
+        return html
+
+    legacy = TestClient(legacy_app)
+    current = TestClient(main.app)
+    gzip_headers = {"accept-encoding": "gzip"}
+
+    legacy_response = legacy.get("/", headers=gzip_headers)
+
+    page = current.get("/", headers=gzip_headers)
+    assets = [current.get(url, headers=gzip_headers) for url in re.findall(r'"(/static/[^"]+)"', page.text)]
+    revalidate_headers = {**gzip_headers, "if-none-match": page.headers["etag"]}
+    revalidated = current.get("/", headers=revalidate_headers)
+
+    return {
+        "brotli_available": StaticBundle().index.bodies.keys() >= {"br"},
+        "legacy": {
+            "requests": 1,
+            "bytes": wire_bytes(legacy_response),
+            "requests_per_s": requests_per_second(legacy, "/", gzip_headers, count),
+        },
+        "first_visit": {
+            "requests": 1 + len(assets),
+            "bytes": wire_bytes(page) + sum(wire_bytes(a) for a in assets),
+            "requests_per_s": requests_per_second(current, "/", gzip_headers, count),
+        },
+        "repeat_visit": {
+            "requests": 1,
+            "status": revalidated.status_code,
+            "bytes": wire_bytes(revalidated),
+            "requests_per_s": requests_per_second(current, "/", revalidate_headers, count),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+    print(json.dumps(main_bench(args.requests), indent=2))
@@ -0,0 +1,123 @@
+"""
+History search latency at scale.
+
+    python bench/bench_search.py [--rows 1000000] [--users 1000] [--queries 200]
+                                 [--via triggers|backfill]
+
+Seeds a throwaway database with --rows messages spread over --users users
+(one user gets 10% of all rows, to stand in for a long history), drawn
+from a Zipf-like vocabulary so some words are in most rows and some in
+very few. With --via triggers the rows are indexed as they are inserted;
+with --via backfill the insert trigger is dropped while seeding and the
+index is built afterwards by backfill_search_index(), as
+`python manage.py backfill-search` would. Then times search_history()
+for the heavy user and a typical one, with common, rare, two-word and
+non-matching queries, and prints p50/p95 in ms as JSON.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["HEALTH_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+
+from search import backfill_search_index, search_history  # noqa: E402
+from storage import init_db, pool  # noqa: E402
+
+TOPICS = [
+    "headache", "migraine", "dizziness", "blood", "pressure", "sleep", "insomnia", "fever", "cough",
+    "allergy", "asthma", "diabetes", "cholesterol", "vitamin", "hydration", "exercise", "stretching",
+    "anxiety", "stress", "nutrition", "protein", "fiber", "sugar", "caffeine", "posture", "back",
+    "knee", "shoulder", "rash", "sunburn", "vaccine", "flu", "cold", "throat", "sinus", "nausea",
+]
+FILLER = [f"w{i}" for i in range(5000)]
+# Zipf-ish weights: the first filler words are in most rows, the last in few.
+FILLER_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(FILLER))))
+
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(FILLER, cum_weights=FILLER_WEIGHTS, k=rng.randint(15, 60))
+    words += rng.sample(TOPICS, 2)
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+def seed(rows: int, users: int, via: str, batch: int = 20000) -> dict:
+    rng = random.Random(1)
+    init_db()
+    if via == "backfill":
+        with pool.connection() as conn:
+            (trigger_sql,) = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'messages_fts_insert'"
+            ).fetchone()
+            conn.execute("DROP TRIGGER messages_fts_insert")
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        n = min(batch, rows - offset)
+        data = [
+            # User 1 is the heavy one: about 10% of all rows.
+            (1 if rng.random() < 0.1 else rng.randint(2, users), "user" if i % 2 == 0 else "assistant", sentence(rng))
+            for i in range(n)
+        ]
+        with pool.connection() as conn:
+            conn.executemany("INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)", data)
+    seeded = time.perf_counter() - start
+    result = {"rows": rows, "users": users, "via": via, "insert_rows_per_s": round(rows / seeded)}
+
+    if via == "backfill":
+        with pool.connection() as conn:
+            conn.execute(trigger_sql)
+        start = time.perf_counter()
+        result["backfilled"] = backfill_search_index()
+        result["backfill_s"] = round(time.perf_counter() - start, 1)
+    result["db_mb"] = round(os.path.getsize(os.environ["HEALTH_DB_PATH"]) / 1e6, 1)
+    return result
+
+
+def latency_ms(user_id: int, queries, limit: int = 20) -> dict:
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        search_history(user_id, query, limit)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--via", choices=("triggers", "backfill"), default="triggers")
+    args = parser.parse_args()
+
+    result = seed(args.rows, args.users, args.via)
+    rng = random.Random(2)
+    kinds = {
+        "common_word": lambda: FILLER[rng.randint(0, 4)],
+        "rare_word": lambda: FILLER[rng.randint(4000, 4999)],
+        "topic": lambda: rng.choice(TOPICS),
+        "two_words": lambda: " ".join(rng.sample(TOPICS, 2)),
+        "no_match": lambda: "zzzz" + str(rng.randint(0, 10**6)),
+    }
+    result["heavy_user"] = {kind: latency_ms(1, [make() for _ in range(args.queries)]) for kind, make in kinds.items()}
+    result["typical_user"] = {
+        kind: latency_ms(rng.randint(2, args.users), [make() for _ in range(args.queries)])
+        for kind, make in kinds.items()
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
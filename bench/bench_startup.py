@@ -0,0 +1,160 @@
+"""
+Import time and time to first request, as a regression check.
+
+    python bench/bench_startup.py [--runs 5] [--max-import-ms 600] [--max-ready-ms 2000]
+
+Import: runs `python -X importtime -c "import main"` --runs times in an
+empty directory and reports the median total, the heaviest top-level
+packages, whether the OpenAI SDK was loaded (it should not be) and
+whether importing created any file (it should not: no database, no
+cache). Every import run is repeated with ANSWER_CACHE_DB,
+SHARED_STATE_PATH and FAQ_STORE_PATH pointed into that directory, so
+the optional stores are checked too. Ready: starts `uvicorn main:app` --runs times, against a new
+database and against one already at the current schema version, and
+times from spawn until GET /stats first answers.
+
+Exits 1 if a median is over --max-import-ms or --max-ready-ms, or if
+importing loaded the SDK or created files, so it can run in CI. Prints
+JSON.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from load_test import free_port  # noqa: E402
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure_import(env: dict) -> dict:
+    """
+    One `import main` in a fresh interpreter: total ms, top-level packages
+    by cumulative ms, and the files it left behind.
+    """
+    cwd = tempfile.mkdtemp()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {ROOT!r}); import main"],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages = defaultdict(float)
+    total_us = 0
+    for match in IMPORTTIME_LINE.finditer(result.stderr):
+        _, cumulative, indent, name = match.groups()
+        if name == "main":
+            total_us = int(cumulative)
+        elif len(indent) == 3:  # imported directly by main
+            packages[name.split(".")[0]] += int(cumulative) / 1000
+    return {
+        "total_ms": total_us / 1000,
+        "packages": packages,
+        "openai_loaded": bool(re.search(r"\| +openai$", result.stderr, re.M)),
+        "files_created": sorted(os.listdir(cwd)),
+    }
+
+
+def measure_ready(env: dict) -> float:
+    """
+    Seconds from spawning uvicorn until /stats answers.
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving")
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=600)
+    parser.add_argument("--max-ready-ms", type=float, default=2000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "HEALTH_DB_PATH": os.path.join(tmp, "bench_startup.db"),
+        "MAINTENANCE_INTERVAL": "0",
+    }
+
+    # Relative paths, so anything opened on import lands where
+    # measure_import looks for it.
+    stores_env = {
+        **env,
+        "ANSWER_CACHE_DB": "answer_cache.db",
+        "SHARED_STATE_PATH": "shared_state.db",
+        "FAQ_STORE_PATH": "faq.db",
+    }
+    imports = [measure_import(env) for _ in range(args.runs)]
+    store_imports = [measure_import(stores_env) for _ in range(args.runs)]
+    packages = defaultdict(list)
+    for run in imports:
+        for name, ms in run["packages"].items():
+            packages[name].append(ms)
+    heaviest = sorted(((statistics.median(ms), name) for name, ms in packages.items()), reverse=True)[:8]
+
+    new_db, current_db = [], []
+    for i in range(args.runs):
+        path = os.path.join(tmp, f"new_{i}.db")
+        new_db.append(measure_ready({**env, "HEALTH_DB_PATH": path}))
+        current_db.append(measure_ready({**env, "HEALTH_DB_PATH": path}))
+
+    result = {
+        "import_ms": round(statistics.median(run["total_ms"] for run in imports), 1),
+        "heaviest_imports_ms": {name: round(ms, 1) for ms, name in heaviest},
+        "openai_loaded_on_import": any(run["openai_loaded"] for run in imports + store_imports),
+        "files_created_on_import": sorted({f for run in imports + store_imports for f in run["files_created"]}),
+        "ready_ms_new_db": round(statistics.median(new_db) * 1000),
+        "ready_ms_current_db": round(statistics.median(current_db) * 1000),
+    }
+    failures = []
+    if result["import_ms"] > args.max_import_ms:
+        failures.append(f"import took {result['import_ms']} ms (budget {args.max_import_ms})")
+    if max(result["ready_ms_new_db"], result["ready_ms_current_db"]) > args.max_ready_ms:
+        failures.append(f"first request took over {args.max_ready_ms} ms")
+    if result["openai_loaded_on_import"]:
+        failures.append("importing main loaded the OpenAI SDK")
+    if result["files_created_on_import"]:
+        failures.append(f"importing main created {result['files_created_on_import']}")
+    result["failures"] = failures
+
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Mixed read/write SQLite load: connection-per-request (old get_db()) vs the
+pooled WAL connections in storage.py.
+
+    python bench/bench_storage.py [--threads 16] [--ops 2000] [--write-ratio 0.2]
+
+Each worker thread alternates between the /history read and the /ask
+write (two INSERTs + commit) against a pre-seeded database and records
+per-operation latency. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import ConnectionPool  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+READ_SQL = "SELECT role, message FROM messages WHERE user_id = ? ORDER BY id ASC"
+WRITE_SQL = "INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)"
+
+
+def seed(path, users, rows_per_user):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        WRITE_SQL,
+        ((u, "user" if i % 2 == 0 else "assistant", "x" * 200) for u in range(users) for i in range(rows_per_user)),
+    )
+    conn.commit()
+    conn.close()
+
+
+class LegacyDB:
+    """The old pattern: sqlite3.connect() per request, default journal."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, user_id):
+        conn = sqlite3.connect(self.path)
+        conn.execute(READ_SQL, (user_id,)).fetchall()
+        conn.close()
+
+    def write(self, user_id):
+        conn = sqlite3.connect(self.path)
+        conn.execute(WRITE_SQL, (user_id, "user", "question"))
+        conn.execute(WRITE_SQL, (user_id, "assistant", "answer" * 50))
+        conn.commit()
+        conn.close()
+
+
+class PooledDB:
+    def __init__(self, path, size):
+        self.pool = ConnectionPool(path, size=size)
+
+    def read(self, user_id):
+        with self.pool.connection() as conn:
+            conn.execute(READ_SQL, (user_id,)).fetchall()
+
+    def write(self, user_id):
+        with self.pool.connection() as conn:
+            conn.execute(WRITE_SQL, (user_id, "user", "question"))
+            conn.execute(WRITE_SQL, (user_id, "assistant", "answer" * 50))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(db, threads, ops, write_ratio, users):
+    reads, writes, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        local_reads, local_writes, local_errors = [], [], 0
+        for _ in range(ops):
+            user_id = rng.randrange(users)
+            is_write = rng.random() < write_ratio
+            start = time.perf_counter()
+            try:
+                (db.write if is_write else db.read)(user_id)
+            except sqlite3.OperationalError:
+                local_errors += 1
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            (local_writes if is_write else local_reads).append(elapsed)
+        with lock:
+            reads.extend(local_reads)
+            writes.extend(local_writes)
+            errors.append(local_errors)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "ops_per_s": round((len(reads) + len(writes)) / elapsed, 1),
+        "read_p50_ms": round(percentile(reads, 50), 3),
+        "read_p99_ms": round(percentile(reads, 99), 3),
+        "write_p50_ms": round(percentile(writes, 50), 3) if writes else None,
+        "write_p99_ms": round(percentile(writes, 99), 3) if writes else None,
+        "errors": sum(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=2000, help="operations per thread")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rows-per-user", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("legacy", "pooled"):
+            path = os.path.join(tmp, f"{name}.db")
+            seed(path, args.users, args.rows_per_user)
+            db = LegacyDB(path) if name == "legacy" else PooledDB(path, args.pool_size)
+            results[name] = run(db, args.threads, args.ops, args.write_ratio, args.users)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Round trips and tokens: one thread per question (old flow) vs a reused
+per-user thread (assistant.py).
+
+    python bench/bench_threads.py [--users 20] [--questions 10]
+
+Both flows run against an in-process fake of the Assistants endpoints that
+counts API calls, messages returned by messages.list and the approximate
+context tokens (characters / 4) the model would read for each run.
+Results are printed as JSON.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ["HEALTH_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_threads.db")
+
+import assistant  # noqa: E402
+from storage import init_db  # noqa: E402
+
+ANSWER = "Feeling lightheaded when you stand up is often related to a brief drop in blood pressure. " * 3
+LEGACY_PROMPT = (
+    "You are a warm, educational, supportive health assistant.\n"
+    "You give general health information only, not medical advice.\n\n"
+    "User question: \"{}\""
+)
+
+
+def _text_message(msg_id, role, text, run_id=None):
+    return SimpleNamespace(
+        id=msg_id,
+        role=role,
+        run_id=run_id,
+        content=[SimpleNamespace(type="text", text=SimpleNamespace(value=text))],
+    )
+
+
+class FakeAssistants:
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.threads = {}
+        self.calls = {"threads.create": 0, "runs.create": 0, "messages.list": 0}
+        self.messages_returned = 0
+        self.context_tokens = 0
+        self.beta = SimpleNamespace(
+            threads=SimpleNamespace(
+                create=self.create_thread,
+                runs=SimpleNamespace(create=self.create_run, create_and_poll=self.create_run),
+                messages=SimpleNamespace(list=self.list_messages),
+            )
+        )
+
+    async def create_thread(self, messages=()):
+        self.calls["threads.create"] += 1
+        thread_id = f"thread_{next(self.ids)}"
+        self.threads[thread_id] = [_text_message(f"msg_{next(self.ids)}", m["role"], m["content"]) for m in messages]
+        return SimpleNamespace(id=thread_id)
+
+    async def create_run(self, thread_id, assistant_id, additional_instructions="", additional_messages=()):
+        # Runs complete instantly, so neither flow needs to poll.
+        self.calls["runs.create"] += 1
+        run_id = f"run_{next(self.ids)}"
+        thread = self.threads[thread_id]
+        for m in additional_messages:
+            thread.append(_text_message(f"msg_{next(self.ids)}", m["role"], m["content"]))
+        context = len(additional_instructions) + sum(len(m.content[0].text.value) for m in thread)
+        self.context_tokens += context // 4
+        thread.append(_text_message(f"msg_{next(self.ids)}", "assistant", ANSWER, run_id))
+        return SimpleNamespace(id=run_id, status="completed")
+
+    async def list_messages(self, thread_id, run_id=None, order="desc"):
+        self.calls["messages.list"] += 1
+        data = [m for m in self.threads[thread_id] if run_id is None or m.run_id == run_id]
+        data = data if order == "asc" else list(reversed(data))
+        data = data[:20]  # the API's default page size
+        self.messages_returned += len(data)
+        return SimpleNamespace(data=data)
+
+
+async def legacy_call(fake, question):
+    thread = await fake.beta.threads.create(messages=[{"role": "user", "content": LEGACY_PROMPT.format(question)}])
+    await fake.beta.threads.runs.create_and_poll(thread_id=thread.id, assistant_id="asst")
+    messages = await fake.beta.threads.messages.list(thread_id=thread.id)
+    for msg in messages.data:
+        if msg.role == "assistant":
+            return msg.content[0].text.value
+
+
+def summarize(fake, questions):
+    total_calls = sum(fake.calls.values())
+    return {
+        "calls": fake.calls,
+        "calls_per_question": round(total_calls / questions, 2),
+        "messages_listed_per_question": round(fake.messages_returned / questions, 2),
+        "context_tokens_per_question": round(fake.context_tokens / questions, 1),
+    }
+
+
+async def run(users, questions):
+    total = users * questions
+    question = "Why do I feel lightheaded when I stand up?"
+
+    legacy = FakeAssistants()
+    for _ in range(total):
+        await legacy_call(legacy, question)
+
+    reused = FakeAssistants()
+    assistant._client = reused
+    for user_id in range(1, users + 1):
+        for _ in range(questions):
+            await assistant.call_health_assistant(question, user_id)
+
+    anonymous = FakeAssistants()
+    assistant._client = anonymous
+    for _ in range(total):
+        await assistant.call_health_assistant(question)
+    await asyncio.gather(*assistant._background_tasks.values())
+
+    return {
+        "one_thread_per_question": summarize(legacy, total),
+        "per_user_thread": summarize(reused, total),
+        "anonymous_prewarmed_threads": summarize(anonymous, total),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=10, help="questions per user")
+    args = parser.parse_args()
+
+    init_db()
+    print(json.dumps(asyncio.run(run(args.users, args.questions)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
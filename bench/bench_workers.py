@@ -0,0 +1,95 @@
+"""
+Throughput of serve.py with 1 worker vs N workers.
+
+    python bench/bench_workers.py [--workers 1,4] [--scenarios ask_emergency,history]
+                                  [--requests 2000] [--concurrency 64] [--min-speedup 0]
+
+For each worker count, starts serve.py (WEB_CONCURRENCY=n) on a fresh
+database against one shared bench/fake_openai.py, runs the load_test.py
+scenarios and records requests/s. The default scenarios are the CPU-bound
+ones (emergency detection, history paging), where extra processes should
+help; upstream-bound scenarios scale with concurrency instead. Prints JSON
+with each run and the speedup of the largest worker count over the
+smallest per scenario. With --min-speedup, exits with status 1 if any
+scenario scales less than that.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from load_test import UNLIMITED_CLIENT_ENV, free_port, run_scenarios, wait_until_up  # noqa: E402
+
+
+def run_with_workers(workers: int, args, fake_url: str) -> dict:
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, "bench_workers.db")
+    port = free_port()
+    env = {
+        **UNLIMITED_CLIENT_ENV,
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake_url,
+        "HEALTH_DB_PATH": db_path,
+        "WEB_CONCURRENCY": str(workers),
+        "PORT": str(port),
+        "HOST": "127.0.0.1",
+        "LOG_LEVEL": "warning",
+    }
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve.py")], cwd=ROOT, env=env)
+    try:
+        app_url = f"http://127.0.0.1:{port}"
+        wait_until_up(app_url + "/stats", timeout=60)
+        return asyncio.run(run_scenarios(args, app_url, db_path))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default=f"1,{min(4, os.cpu_count() or 1)}")
+    parser.add_argument("--scenarios", default="ask_emergency,history")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--history-rows", type=int, default=20000)
+    parser.add_argument("--min-speedup", type=float, default=0)
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    worker_counts = sorted({int(n) for n in args.workers.split(",")})
+
+    fake_port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "fake_openai.py"), "--port", str(fake_port), "--api-latency", "0"]
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{fake_port}/stats")
+        runs = {n: run_with_workers(n, args, f"http://127.0.0.1:{fake_port}/v1") for n in worker_counts}
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    low, high = worker_counts[0], worker_counts[-1]
+    speedup = {
+        scenario: round(runs[high][scenario]["requests_per_s"] / max(runs[low][scenario]["requests_per_s"], 1e-9), 2)
+        for scenario in args.scenarios
+    }
+    print(json.dumps({
+        "cpu_count": os.cpu_count(),
+        "runs": {str(n): result for n, result in runs.items()},
+        f"speedup_{high}_vs_{low}": speedup,
+    }, indent=2))
+
+    if args.min_speedup and min(speedup.values()) < args.min_speedup:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
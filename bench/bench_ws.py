@@ -0,0 +1,158 @@
+"""
+Memory per idle /ws/chat connection, and answers while thousands idle.
+
+    python bench/bench_ws.py [--sockets 1000,2000,5000] [--users 100] [--questions 20] [--deflate]
+
+Starts bench/fake_openai.py and uvicorn main:app, signs up --users
+users, then opens authenticated /ws/chat sockets (spread over those
+users) in steps up to each --sockets count and leaves them idle. After
+each step it reads the server's resident memory from /proc and asks
+--questions questions on one more socket, timing each until "done". The
+reported kb_per_socket is the RSS growth per socket between the first
+and last step, which leaves out what the first connection warms up.
+The server runs without permessage-deflate, as serve.py does, unless
+--deflate is given.
+Needs the `websockets` package (which uvicorn also needs to serve
+WebSockets) and a file descriptor limit above the largest step, on both
+ends. Prints JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from load_test import free_port, wait_until_up  # noqa: E402
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("no VmRSS")
+
+
+async def open_socket(url: str, token: str):
+    socket = await websockets.connect(url, max_queue=4)
+    await socket.send(json.dumps({"type": "auth", "token": token}))
+    if json.loads(await socket.recv())["type"] != "ready":
+        raise RuntimeError("not authenticated")
+    return socket
+
+
+async def answer_latencies(url: str, token: str, questions: int) -> dict:
+    timings = []
+    async with websockets.connect(url) as socket:
+        await socket.send(json.dumps({"type": "auth", "token": token}))
+        await socket.recv()
+        for i in range(questions):
+            start = time.perf_counter()
+            question = f"Why do I get headaches, case {time.time()} {i}?"
+            await socket.send(json.dumps({"type": "ask", "question": question}))
+            while json.loads(await socket.recv())["type"] != "done":
+                pass
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings) * 1000, 1),
+        "max_ms": round(timings[-1] * 1000, 1),
+    }
+
+
+async def run(args, app_url: str, server_pid: int) -> dict:
+    ws_url = app_url.replace("http://", "ws://") + "/ws/chat"
+    tokens = []
+    async with httpx.AsyncClient(base_url=app_url, timeout=60) as client:
+        for i in range(args.users):
+            credentials = {"username": f"ws{i}", "password": "bench-password"}
+            await client.post("/signup", json=credentials)
+            tokens.append((await client.post("/login", json=credentials)).json()["token"])
+
+    sockets = [await open_socket(ws_url, tokens[0])]
+    await asyncio.sleep(0.5)
+    steps = [{"sockets": 1, "rss_kb": rss_kb(server_pid)}]
+    for target in args.sockets:
+        while len(sockets) < target:
+            batch = range(len(sockets), min(target, len(sockets) + 200))
+            sockets += await asyncio.gather(*(open_socket(ws_url, tokens[i % len(tokens)]) for i in batch))
+        await asyncio.sleep(1)
+        step = {"sockets": len(sockets), "rss_kb": rss_kb(server_pid)}
+        step["answer_while_idle"] = await answer_latencies(ws_url, tokens[0], args.questions)
+        steps.append(step)
+        print(json.dumps(step), file=sys.stderr)
+
+    async with httpx.AsyncClient(base_url=app_url) as client:
+        chat_sockets = (await client.get("/stats")).json()["chat_sockets"]
+    await asyncio.gather(*(socket.close() for socket in sockets))
+
+    first, last = steps[1], steps[-1]
+    per_socket = (last["rss_kb"] - first["rss_kb"]) / max(1, last["sockets"] - first["sockets"])
+    return {"steps": steps, "kb_per_socket": round(per_socket, 1), "server_chat_sockets": chat_sockets}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=lambda s: [int(n) for n in s.split(",")], default=[1000, 2000, 5000])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--deflate", action="store_true")
+    args = parser.parse_args()
+
+    # Children inherit the raised limit.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    env = {
+        "ASK_RATE_PER_MINUTE": "0",
+        "AUTH_RATE_PER_MINUTE": "0",
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake_url + "/v1",
+        "HEALTH_DB_PATH": os.path.join(tempfile.mkdtemp(), "bench_ws.db"),
+        "ANSWER_CACHE_DB": "",
+        "WS_IDLE_TIMEOUT": "3600",
+        "MAINTENANCE_INTERVAL": "0",
+    }
+    processes = [
+        subprocess.Popen([
+            sys.executable, os.path.join(ROOT, "bench", "fake_openai.py"),
+            "--port", str(fake_port), "--run-latency", "0.2", "--failure-rate", "0",
+        ]),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning",
+             "--backlog", "4096", "--ws-per-message-deflate", str(args.deflate).lower()],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        ),
+    ]
+    try:
+        wait_until_up(fake_url + "/stats")
+        wait_until_up(app_url + "/stats")
+        results = asyncio.run(run(args, app_url, processes[1].pid))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print(json.dumps({"config": vars(args), **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+A local stand-in for the OpenAI Assistants endpoints main.py uses, so the
+whole app can be load-tested offline.
+
+    python bench/fake_openai.py [--port 8010] [--run-latency 1.0] [--failure-rate 0.01]
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8010/v1 (any
+OPENAI_API_KEY works). Runs stay "queued" for --queue-latency seconds,
+"in_progress" until --run-latency, then complete, or fail with
+probability --failure-rate. Streamed runs send --tokens text deltas
+--token-interval seconds apart. --http-error-rate makes any call answer
+500 instead, and --slow-rate delays a call by an extra --slow-latency
+seconds (a latency spike). Every setting can also be given as an
+environment variable, e.g. FAKE_OPENAI_RUN_LATENCY=0.5.
+
+Settings can be changed while it runs, to script outages and recoveries:
+POST /faults with a JSON object of settings (e.g. {"http_error_rate": 1})
+applies them and returns them all; GET /faults reads them.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from typing import Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = (
+    "Feeling lightheaded when you stand up is often related to a brief drop in blood pressure. "
+    "Drinking enough water and standing up slowly can help. "
+)
+
+
+def _env(name: str, default: float) -> float:
+    return float(os.environ.get("FAKE_OPENAI_" + name, str(default)))
+
+
+class Settings:
+    api_latency = _env("API_LATENCY", 0.005)
+    queue_latency = _env("QUEUE_LATENCY", 0.05)
+    run_latency = _env("RUN_LATENCY", 0.5)
+    failure_rate = _env("FAILURE_RATE", 0)
+    http_error_rate = _env("HTTP_ERROR_RATE", 0)
+    slow_rate = _env("SLOW_RATE", 0)
+    slow_latency = _env("SLOW_LATENCY", 1.0)
+    tokens = int(_env("TOKENS", 40))
+    token_interval = _env("TOKEN_INTERVAL", 0.01)
+
+
+settings = Settings()
+app = FastAPI()
+
+_ids = itertools.count(1)
+_threads: Dict[str, List[dict]] = {}
+_runs: Dict[str, dict] = {}
+stats = {"requests": 0, "http_errors": 0, "slow_requests": 0, "runs": 0, "failed_runs": 0}
+SETTING_NAMES = [name for name in vars(Settings) if not name.startswith("_")]
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{next(_ids)}"
+
+
+def _message(thread_id: str, role: str, text: str, run_id=None, status="completed") -> dict:
+    return {
+        "id": _new_id("msg"),
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "run_id": run_id,
+        "assistant_id": None,
+        "status": status,
+        "attachments": [],
+        "metadata": {},
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}] if text else [],
+    }
+
+
+def _run_view(run: dict) -> dict:
+    elapsed = time.monotonic() - run["started"]
+    if run["status"] in ("queued", "in_progress"):
+        if elapsed >= settings.run_latency:
+            run["status"] = "failed" if run["fail"] else "completed"
+            if not run["fail"]:
+                _threads[run["thread_id"]].append(_message(run["thread_id"], "assistant", ANSWER, run["id"]))
+        elif elapsed >= settings.queue_latency:
+            run["status"] = "in_progress"
+    return {k: v for k, v in run.items() if k not in ("started", "fail")}
+
+
+@app.middleware("http")
+async def simulate_upstream(request: Request, call_next):
+    if not request.url.path.startswith("/v1/"):
+        return await call_next(request)
+    stats["requests"] += 1
+    await asyncio.sleep(settings.api_latency)
+    if random.random() < settings.slow_rate:
+        stats["slow_requests"] += 1
+        await asyncio.sleep(settings.slow_latency)
+    if random.random() < settings.http_error_rate:
+        stats["http_errors"] += 1
+        return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=500)
+    return await call_next(request)
+
+
+@app.post("/v1/threads")
+async def create_thread(request: Request):
+    thread_id = _new_id("thread")
+    _threads[thread_id] = []
+    return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+
+def _thread(thread_id: str) -> List[dict]:
+    messages = _threads.get(thread_id)
+    if messages is None:
+        raise HTTPException(status_code=404, detail={"message": "No thread found", "type": "invalid_request_error"})
+    return messages
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/v1/threads/{thread_id}/runs")
+async def create_run(thread_id: str, request: Request):
+    messages = _thread(thread_id)
+    body = await request.json()
+    for m in body.get("additional_messages") or []:
+        messages.append(_message(thread_id, m["role"], m["content"]))
+
+    stats["runs"] += 1
+    fail = random.random() < settings.failure_rate
+    stats["failed_runs"] += fail
+    run = {
+        "id": _new_id("run"),
+        "object": "thread.run",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "assistant_id": body.get("assistant_id"),
+        "status": "queued",
+        "started": time.monotonic(),
+        "fail": fail,
+    }
+    _runs[run["id"]] = run
+    if not body.get("stream"):
+        return _run_view(run)
+    return StreamingResponse(_stream_run(run), media_type="text/event-stream")
+
+
+async def _stream_run(run: dict):
+    view = _run_view(run)
+    yield _sse("thread.run.created", view)
+    await asyncio.sleep(settings.queue_latency)
+    run["status"] = "in_progress"
+    yield _sse("thread.run.in_progress", _run_view(run))
+
+    if run["fail"]:
+        run["status"] = "failed"
+        yield _sse("thread.run.failed", _run_view(run))
+        yield "event: done\ndata: [DONE]\n\n"
+        return
+
+    message = _message(run["thread_id"], "assistant", "", run["id"], status="in_progress")
+    yield _sse("thread.message.created", message)
+    words = ANSWER.split(" ")
+    pieces = [" ".join(words[i::settings.tokens]) for i in range(settings.tokens)] if settings.tokens else []
+    for piece in pieces:
+        await asyncio.sleep(settings.token_interval)
+        delta = {"content": [{"index": 0, "type": "text", "text": {"value": piece + " "}}]}
+        yield _sse("thread.message.delta", {"id": message["id"], "object": "thread.message.delta", "delta": delta})
+
+    done = _message(run["thread_id"], "assistant", "".join(p + " " for p in pieces), run["id"])
+    done["id"] = message["id"]
+    _threads[run["thread_id"]].append(done)
+    yield _sse("thread.message.completed", done)
+    run["status"] = "completed"
+    yield _sse("thread.run.completed", _run_view(run))
+    yield "event: done\ndata: [DONE]\n\n"
+
+
+@app.get("/v1/threads/{thread_id}/runs/{run_id}")
+async def retrieve_run(thread_id: str, run_id: str):
+    run = _runs.get(run_id)
+    if run is None or run["thread_id"] != thread_id:
+        raise HTTPException(status_code=404, detail={"message": "No run found", "type": "invalid_request_error"})
+    return _run_view(run)
+
+
+@app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+async def cancel_run(thread_id: str, run_id: str):
+    run = await retrieve_run(thread_id, run_id)
+    if run["status"] in ("queued", "in_progress"):
+        _runs[run_id]["status"] = "cancelled"
+    return _run_view(_runs[run_id])
+
+
+@app.get("/v1/threads/{thread_id}/messages")
+async def list_messages(thread_id: str, run_id: str = None, order: str = "desc", limit: int = 20):
+    data = [m for m in _thread(thread_id) if run_id is None or m["run_id"] == run_id]
+    if order != "asc":
+        data.reverse()
+    data = data[:limit]
+    return {
+        "object": "list",
+        "data": data,
+        "first_id": data[0]["id"] if data else None,
+        "last_id": data[-1]["id"] if data else None,
+        "has_more": False,
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.get("/faults")
+async def get_faults():
+    return {name: getattr(settings, name) for name in SETTING_NAMES}
+
+
+@app.post("/faults")
+async def set_faults(request: Request):
+    changes = await request.json()
+    unknown = set(changes) - set(SETTING_NAMES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown settings: {sorted(unknown)}")
+    for name, value in changes.items():
+        setattr(settings, name, type(getattr(Settings, name))(value))
+    return await get_faults()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    for name in SETTING_NAMES:
+        default = getattr(settings, name)
+        parser.add_argument("--" + name.replace("_", "-"), type=type(default), default=default)
+    args = parser.parse_args()
+
+    for name in SETTING_NAMES:
+        setattr(settings, name, getattr(args, name))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
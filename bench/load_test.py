@@ -0,0 +1,261 @@
+"""
+End-to-end load test of main:app against the fake Assistants backend.
+
+    python bench/load_test.py [--scenarios ask_anonymous,history] [--requests 500]
+                              [--concurrency 50] [--output results.json]
+
+Starts bench/fake_openai.py and uvicorn main:app on free local ports (with
+a throwaway database), then runs each scenario in turn:
+
+  ask_anonymous   POST /ask, distinct questions, no session
+  ask_logged_in   POST /ask with a session token, spread over --users users
+  ask_stream      POST /ask/stream as a logged-in user, read to the end
+  ask_emergency   POST /ask with an emergency phrase (never reaches upstream)
+  history         GET /history pages for a user with --history-rows rows
+  auth_storm      POST /signup then /login for --requests new users
+
+Each scenario reports requests/s, p50/p95/p99 latency in ms and the error
+rate (non-2xx, transport errors or fallback answers). Results are printed
+as JSON, and also written to --output, so runs from different commits can
+be diffed. Extra arguments after "--" are passed to fake_openai.py, e.g.
+"-- --run-latency 2 --failure-rate 0.05". Use --app-url to test an
+already-running server instead of starting one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from assistant import FALLBACK_ANSWERS  # noqa: E402
+
+SCENARIOS = ("ask_anonymous", "ask_logged_in", "ask_stream", "ask_emergency", "history", "auth_storm")
+QUESTION = "Why do I feel lightheaded when I stand up? (variant {})"
+EMERGENCY_QUESTION = "I have crushing chest pain and can't breathe"
+# One client IP drives all the load; per-client limits would measure the
+# limiter, not the app. Benches starting the app put these first in its
+# environment, so a value set in the environment still wins.
+UNLIMITED_CLIENT_ENV = {"ASK_RATE_PER_MINUTE": "0", "AUTH_RATE_PER_MINUTE": "0"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    total = len(latencies)
+    return {
+        "requests": total,
+        "requests_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+    }
+
+
+async def run_load(count: int, concurrency: int, request) -> dict:
+    """
+    Call request(i) for i in range(count) with at most `concurrency` in
+    flight. request returns True on success.
+    """
+    latencies = []
+    errors = 0
+    next_index = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for i in next_index:
+            start = time.perf_counter()
+            try:
+                ok = await request(i)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def create_users(client, count: int, prefix: str) -> list:
+    users = []
+    for i in range(count):
+        r = await client.post("/signup", json={"username": f"{prefix}{i}", "password": "bench-password"})
+        data = r.json()
+        users.append((data["user_id"], {"Authorization": "Bearer " + data["token"]}))
+    return users
+
+
+def answered(r) -> bool:
+    return r.status_code == 200 and r.json().get("answer") not in FALLBACK_ANSWERS
+
+
+def seed_history(db_path: str, user_id: int, rows: int):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)",
+            ((user_id, "user" if i % 2 == 0 else "assistant", QUESTION.format(i)) for i in range(rows)),
+        )
+    conn.close()
+
+
+async def run_scenarios(args, app_url: str, db_path: str) -> dict:
+    results = {}
+    run_tag = str(int(time.time()))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app_url, timeout=120, limits=limits) as client:
+        for scenario in args.scenarios:
+            if scenario == "ask_anonymous":
+                async def request(i):
+                    return answered(await client.post("/ask", json={"question": QUESTION.format(f"{run_tag}-a{i}")}))
+
+            elif scenario in ("ask_logged_in", "ask_stream"):
+                users = await create_users(client, args.users, f"{scenario}-{run_tag}-")
+
+                if scenario == "ask_logged_in":
+                    async def request(i, users=users):
+                        _, headers = users[i % len(users)]
+                        r = await client.post("/ask", json={"question": QUESTION.format(i)}, headers=headers)
+                        return answered(r)
+                else:
+                    async def request(i, users=users):
+                        _, headers = users[i % len(users)]
+                        body = {"question": QUESTION.format(f"{run_tag}-s{i}")}
+                        async with client.stream("POST", "/ask/stream", json=body, headers=headers) as r:
+                            text = "".join([chunk async for chunk in r.aiter_text()])
+                        return r.status_code == 200 and "event: done" in text and "event: error" not in text
+
+            elif scenario == "ask_emergency":
+                async def request(i):
+                    return answered(await client.post("/ask", json={"question": EMERGENCY_QUESTION}))
+
+            elif scenario == "history":
+                [(user_id, headers)] = await create_users(client, 1, f"history-{run_tag}-")
+                if db_path is None:
+                    print("history: --app-url given, not seeding rows", file=sys.stderr)
+                else:
+                    seed_history(db_path, user_id, args.history_rows)
+                newest = (await client.get("/history", params={"limit": 1}, headers=headers)).json()
+                top = newest[0]["id"] + 1 if newest else 1
+
+                async def request(i, headers=headers, top=top):
+                    params = {"limit": 50}
+                    if i % 2:
+                        params["before_id"] = random.randint(1, top)
+                    r = await client.get("/history", params=params, headers=headers)
+                    return r.status_code == 200
+
+            elif scenario == "auth_storm":
+                async def request(i):
+                    credentials = {"username": f"storm-{run_tag}-{i}", "password": "bench-password"}
+                    r = await client.post("/signup", json=credentials)
+                    if r.status_code != 200 or not r.json().get("success"):
+                        return False
+                    r = await client.post("/login", json=credentials)
+                    return r.status_code == 200 and r.json().get("success")
+
+            else:
+                raise SystemExit(f"unknown scenario {scenario!r}; choose from {', '.join(SCENARIOS)}")
+
+            results[scenario] = await run_load(args.requests, args.concurrency, request)
+            print(scenario, json.dumps(results[scenario]), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20, help="users for the logged-in scenarios")
+    parser.add_argument("--history-rows", type=int, default=20000)
+    parser.add_argument("--app-url", help="test this server instead of starting one")
+    parser.add_argument("--output", help="also write the JSON results here")
+    args, fake_args = parser.parse_known_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    fake_args = [a for a in fake_args if a != "--"]
+
+    processes = []
+    db_path = None
+    app_url = args.app_url
+    try:
+        if app_url is None:
+            fake_port, app_port = free_port(), free_port()
+            tmp = tempfile.mkdtemp()
+            db_path = os.path.join(tmp, "load_test.db")
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "bench", "fake_openai.py"), "--port", str(fake_port), *fake_args]
+            ))
+            env = {
+                **UNLIMITED_CLIENT_ENV,
+                **os.environ,
+                "OPENAI_API_KEY": "bench",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+                "HEALTH_DB_PATH": db_path,
+                "ANSWER_CACHE_DB": "",
+            }
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+                cwd=ROOT,
+                env=env,
+            ))
+            app_url = f"http://127.0.0.1:{app_port}"
+            wait_until_up(f"http://127.0.0.1:{fake_port}/stats")
+        wait_until_up(app_url + "/stats")
+
+        results = {
+            "config": {k: v for k, v in vars(args).items() if k not in ("app_url", "output")},
+            "fake_openai_args": fake_args,
+            "scenarios": asyncio.run(run_scenarios(args, app_url, db_path)),
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import math
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Tuple
+
+_APOSTROPHES = re.compile(r"['’`]")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Fold case, punctuation and whitespace so trivially different wordings
+    of a question share one cache key.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _APOSTROPHES.sub("", text)
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def _ngrams(key: str, n: int = 3) -> set:
+    grams = set(key.split())
+    padded = f" {key} "
+    grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+class _Entry:
+    __slots__ = ("question", "answer", "created_at", "grams")
+
+    def __init__(self, question: str, answer: str, created_at: float, grams: set):
+        self.question = question
+        self.answer = answer
+        self.created_at = created_at
+        self.grams = grams
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of assistant answers keyed on the normalized question.
+
+    With similarity_threshold > 0, a miss on the exact key falls back to the
+    closest cached question by TF-IDF cosine over word and character n-grams.
+    With db_path set, entries are also kept in SQLite, and load() reloads
+    them (the constructor opens nothing). An exact-key miss then also
+    checks SQLite, so worker processes sharing the file see each other's
+    answers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 86400,
+        similarity_threshold: float = 0.0,
+        db_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.db_path = db_path
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._index: Dict[str, set] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------- Lookup ----------
+    def get(self, question: str) -> Optional[str]:
+        answer = self.peek(question)
+        if answer is None:
+            answer = self.lookup(question)
+        return answer
+
+    def peek(self, question: str) -> Optional[str]:
+        """
+        The in-memory exact-key hit, if any: never blocks, so async code
+        can call it directly. On None, follow with lookup().
+        """
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.answer
+        return None
+
+    def lookup(self, question: str) -> Optional[str]:
+        """
+        The rest of get() after a peek() miss: SQLite (with db_path set,
+        which may wait on another worker's write, so call it from a
+        thread) and then fuzzy matching.
+        """
+        key = normalize_question(question)
+        now = time.time()
+        if self.db_path:
+            row = self._fetch(key, now)
+            if row is not None:
+                question, answer, created_at = row
+                with self._lock:
+                    if key not in self._entries:
+                        self._insert(key, _Entry(question, answer, created_at, _ngrams(key)))
+                        self._evict()
+                    self.shared_hits += 1
+                return answer
+
+        with self._lock:
+            if self.similarity_threshold > 0:
+                similar = self._most_similar(key, now, self.similarity_threshold)
+                if similar is not None:
+                    self._entries.move_to_end(similar)
+                    self.similar_hits += 1
+                    return self._entries[similar].answer
+
+            self.misses += 1
+            return None
+
+    def similar(self, question: str, threshold: float) -> Optional[Tuple[str, str]]:
+        """
+        (question, answer) of the closest cached question scoring at least
+        threshold, whatever similarity_threshold is set to. Used when the
+        assistant is unreachable; the caller must say which question the
+        answer is for.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            similar = self._most_similar(key, time.time(), threshold)
+            if similar is None:
+                return None
+            self.similar_hits += 1
+            entry = self._entries[similar]
+            return entry.question, entry.answer
+
+    def put(self, question: str, answer: str):
+        key = normalize_question(question)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._insert(key, _Entry(question, answer, now, _ngrams(key)))
+            evicted = self._evict()
+
+        if self.db_path:
+            self._persist(key, question, answer, now, evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def load(self):
+        """
+        Fill memory with the newest unexpired entries from db_path and drop
+        the expired ones there. Blocking; call once at startup.
+        """
+        if not self.db_path:
+            return
+        min_created = time.time() - self.ttl if self.ttl > 0 else 0
+        with self._db_lock:
+            conn = self._db()
+            rows = conn.execute(
+                """
+                SELECT key, question, answer, created_at
+                FROM answer_cache
+                WHERE created_at >= ?
+                ORDER BY created_at DESC
+                LIMIT ?
+                """,
+                (min_created, self.max_entries),
+            ).fetchall()
+            conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (min_created,))
+            conn.commit()
+
+        with self._lock:
+            # Oldest first, so the LRU order matches insertion time.
+            for key, question, answer, created_at in reversed(rows):
+                if key not in self._entries:
+                    self._insert(key, _Entry(question, answer, created_at, _ngrams(key)))
+
+    # ---------- Internals (call with the lock held) ----------
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created_at > self.ttl
+
+    def _insert(self, key: str, entry: _Entry):
+        self._entries[key] = entry
+        for gram in entry.grams:
+            self._index[gram].add(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        for gram in entry.grams:
+            keys = self._index[gram]
+            keys.discard(key)
+            if not keys:
+                del self._index[gram]
+
+    def _evict(self) -> list:
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _idf(self, gram: str) -> float:
+        return math.log((1 + len(self._entries)) / (1 + len(self._index.get(gram, ())))) + 1
+
+    def _most_similar(self, key: str, now: float, threshold: float) -> Optional[str]:
+        grams = _ngrams(key)
+        weights = {g: self._idf(g) for g in grams}
+        q_norm = math.sqrt(sum(w * w for w in weights.values()))
+        if q_norm == 0:
+            return None
+
+        # Only questions sharing at least one n-gram can score above zero.
+        dot = defaultdict(float)
+        for gram, w in weights.items():
+            for candidate in self._index.get(gram, ()):
+                dot[candidate] += w * w
+
+        best, best_score = None, threshold
+        for candidate, score in dot.items():
+            entry = self._entries[candidate]
+            if self._expired(entry, now):
+                continue
+            d_norm = math.sqrt(sum(self._idf(g) ** 2 for g in entry.grams))
+            if d_norm == 0:
+                continue
+            cosine = score / (q_norm * d_norm)
+            if cosine >= best_score:
+                best, best_score = candidate, cosine
+        return best
+
+    # ---------- SQLite persistence (call with _db_lock held) ----------
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    key TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _fetch(self, key: str, now: float) -> Optional[tuple]:
+        min_created = now - self.ttl if self.ttl > 0 else 0
+        with self._db_lock:
+            return self._db().execute(
+                "SELECT question, answer, created_at FROM answer_cache WHERE key = ? AND created_at >= ?",
+                (key, min_created),
+            ).fetchone()
+
+    def _persist(self, key: str, question: str, answer: str, created_at: float, evicted: list):
+        with self._db_lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO answer_cache (key, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                (key, question, answer, created_at),
+            )
+            if evicted:
+                conn.executemany("DELETE FROM answer_cache WHERE key = ?", [(k,) for k in evicted])
+            conn.commit()
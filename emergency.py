@@ -0,0 +1,166 @@
+import os
+import re
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple
+
+DEFAULT_PHRASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emergency_phrases.txt")
+
+_APOSTROPHES = re.compile(r"['’`]")
+_WORD = re.compile(r"\w+")
+
+# Negative contractions are spelled out so "can't", "cant", "cannot" and
+# "can not" all normalize to the same tokens.
+_EXPANSIONS = {
+    "cant": ("can", "not"),
+    "cannot": ("can", "not"),
+    "wont": ("will", "not"),
+    "dont": ("do", "not"),
+    "doesnt": ("does", "not"),
+    "didnt": ("did", "not"),
+    "isnt": ("is", "not"),
+    "arent": ("are", "not"),
+    "wasnt": ("was", "not"),
+    "werent": ("were", "not"),
+    "couldnt": ("could", "not"),
+    "wouldnt": ("would", "not"),
+    "havent": ("have", "not"),
+    "hasnt": ("has", "not"),
+}
+
+
+@lru_cache(maxsize=65536)
+def stem(token: str) -> str:
+    """
+    Strip a plural -s so "pains", "attacks" and "strokes" match the phrase
+    forms "pain", "attack" and "stroke". Verb endings are left alone:
+    stripping them turned "stroking" into "stroke" and "bleed a lot" into
+    "bleeding a lot", so inflected phrases are listed explicitly instead.
+    """
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def normalize_tokens(text: str) -> List[str]:
+    text = text.lower()
+    if not text.isascii():
+        # Drop accents so "corazón" and "corazon" match.
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+
+    tokens = []
+    for token in _WORD.findall(_APOSTROPHES.sub("", text)):
+        expansion = _EXPANSIONS.get(token)
+        if expansion:
+            tokens.extend(expansion)
+        else:
+            tokens.append(stem(token))
+    return tokens
+
+
+class Phrase(NamedTuple):
+    text: str
+    weight: float
+    category: str
+
+
+class Detection(NamedTuple):
+    score: float
+    phrases: Tuple[str, ...]
+    categories: Tuple[str, ...]
+
+
+def load_phrases(path: str = DEFAULT_PHRASES_PATH) -> List[Phrase]:
+    """
+    Read "phrase | weight | category" lines; weight defaults to 1.0 and
+    category to "general". Blank lines and # comments are skipped.
+    """
+    phrases = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.split("|")]
+            weight = float(fields[1]) if len(fields) > 1 and fields[1] else 1.0
+            category = fields[2] if len(fields) > 2 and fields[2] else "general"
+            phrases.append(Phrase(fields[0], weight, category))
+    return phrases
+
+
+class EmergencyDetector:
+    """
+    Aho-Corasick automaton over normalized word tokens.
+
+    Built once; scan() makes a single pass over the message regardless of
+    how many phrases are loaded, and only matches whole words (plurals folded).
+    """
+
+    def __init__(self, phrases: List[Phrase], threshold: float = 1.0):
+        self.threshold = threshold
+        self.phrases: List[Phrase] = []
+
+        # State 0 is the root. Each state has token transitions, a failure
+        # link and the phrase indices that end there.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for phrase in phrases:
+            tokens = normalize_tokens(phrase.text)
+            if tokens:
+                self._add(tokens, len(self.phrases))
+                self.phrases.append(phrase)
+        self._link()
+
+    def _add(self, tokens: List[str], index: int):
+        state = 0
+        for token in tokens:
+            nxt = self._goto[state].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][token] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] += (index,)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(token, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def scan(self, text: str) -> Detection:
+        goto, fail, out = self._goto, self._fail, self._out
+        matched = set()
+        state = 0
+        for token in normalize_tokens(text):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if out[state]:
+                matched.update(out[state])
+
+        found = [self.phrases[i] for i in sorted(matched)]
+        return Detection(
+            score=sum(p.weight for p in found),
+            phrases=tuple(p.text for p in found),
+            categories=tuple(sorted({p.category for p in found})),
+        )
+
+    def is_emergency(self, text: str) -> bool:
+        return self.scan(text).score >= self.threshold
+
+
+def load_detector(path: str = DEFAULT_PHRASES_PATH, threshold: float = 1.0) -> EmergencyDetector:
+    return EmergencyDetector(load_phrases(path), threshold)
@@ -0,0 +1,254 @@
+"""
+Precomputed answers to the questions asked most often.
+
+`python manage.py warm-faq` asks the assistant a curated list of
+questions (and optionally the ones most users asked recently, mined from
+history), FAQ_CONCURRENCY at a time, and writes the answers to a new
+SQLite file that then replaces FAQ_STORE_PATH with one os.replace(). Each
+build is numbered one above the store it replaces, whose file is kept as
+FAQ_STORE_PATH + ".prev" (move it back to roll back). A question whose
+answer fails to generate keeps its answer from the previous build.
+
+The server loads the store into a dict keyed on normalize_question() at
+startup, so a hit is a dict lookup with no upstream call, and checks
+every FAQ_RELOAD_INTERVAL seconds whether the file was replaced. Answers
+are generic, not per user, like answer_cache's.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from assistant import FALLBACK_ANSWERS, call_health_assistant
+from cache import normalize_question
+from storage import DB_PATH, decode_message
+
+# ---------- Settings ----------
+# "" disables the store.
+STORE_PATH = os.environ.get("FAQ_STORE_PATH", os.path.splitext(DB_PATH)[0] + "_faq.db")
+RELOAD_INTERVAL = float(os.environ.get("FAQ_RELOAD_INTERVAL", "60"))
+CONCURRENCY = int(os.environ.get("FAQ_CONCURRENCY", "8"))
+# Mined questions must have been asked by at least this many users, so
+# nothing one person typed ends up answering everyone.
+MIN_USERS = int(os.environ.get("FAQ_MIN_USERS", "3"))
+MINE_BATCH_ROWS = 10000
+
+
+# ---------- Questions ----------
+def read_questions(path: str) -> List[str]:
+    """
+    One question per line; blank lines and lines starting with # are skipped.
+    """
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def frequent_questions(pool, rows: int, top: int, min_users: int = MIN_USERS) -> List[str]:
+    """
+    Among the user questions in the last `rows` messages, the `top` most
+    asked by distinct users (at least min_users of them), each in the
+    wording first seen.
+    """
+    with pool.connection() as conn:
+        last_id = conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0
+
+    askers: Dict[str, Tuple[str, set]] = {}
+    start = max(0, last_id - rows)
+    while start < last_id:
+        end = min(last_id, start + MINE_BATCH_ROWS)
+        with pool.connection() as conn:
+            batch = conn.execute(
+                "SELECT user_id, message FROM messages WHERE id > ? AND id <= ? AND role = 'user'",
+                (start, end),
+            ).fetchall()
+        for user_id, message in batch:
+            question = decode_message(message)
+            key = normalize_question(question)
+            if key:
+                askers.setdefault(key, (question, set()))[1].add(user_id)
+        start = end
+
+    ranked = sorted(askers.values(), key=lambda entry: len(entry[1]), reverse=True)
+    return [question for question, users in ranked[:top] if len(users) >= min_users]
+
+
+# ---------- Building ----------
+def read_store(path: str) -> Tuple[int, float, Dict[str, Tuple[str, str]]]:
+    """
+    (version, built_at, {key: (question, answer)}) of a store file, or
+    version 0 and nothing if there is none.
+    """
+    if not path or not os.path.exists(path):
+        return 0, 0.0, {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        version, built_at = conn.execute("SELECT version, built_at FROM faq_meta").fetchone()
+        rows = conn.execute("SELECT key, question, answer FROM faq").fetchall()
+    finally:
+        conn.close()
+    return version, built_at, {key: (question, answer) for key, question, answer in rows}
+
+
+def write_store(path: str, entries: Dict[str, Tuple[str, str]], version: int) -> float:
+    """
+    Write entries as store `version` to a temporary file, then swap it in.
+    Readers see the old store or the new one, never a partial file.
+    """
+    built_at = time.time()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE faq_meta (version INTEGER NOT NULL, built_at REAL NOT NULL)")
+        conn.execute(
+            "CREATE TABLE faq (key TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL) WITHOUT ROWID"
+        )
+        conn.execute("INSERT INTO faq_meta VALUES (?, ?)", (version, built_at))
+        conn.executemany(
+            "INSERT INTO faq VALUES (?, ?, ?)",
+            ((key, question, answer) for key, (question, answer) in sorted(entries.items())),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    if os.path.exists(path):
+        previous = path + ".prev"
+        if os.path.exists(previous):
+            os.remove(previous)
+        os.link(path, previous)
+    os.replace(tmp_path, path)
+    return built_at
+
+
+async def generate_answers(
+    questions: List[str],
+    concurrency: int = CONCURRENCY,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Tuple[str, str]]:
+    """
+    {key: (question, answer)} for the questions the assistant answered,
+    `concurrency` at a time. Fallback answers, runs still going at the
+    deadline and upstream errors leave a question out.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    answers: Dict[str, Tuple[str, str]] = {}
+    done = 0
+
+    async def answer(key: str, question: str):
+        nonlocal done
+        async with slots:
+            try:
+                text = await call_health_assistant(question)
+            except Exception as e:
+                print(f"No FAQ answer for {question!r}: {e!r}")
+                text = None
+        if text is not None and text not in FALLBACK_ANSWERS:
+            answers[key] = (question, text)
+        done += 1
+        if progress:
+            progress(done, len(unique))
+
+    unique: Dict[str, str] = {}
+    for question in questions:
+        unique.setdefault(normalize_question(question), question)
+    unique.pop("", None)
+    await asyncio.gather(*(answer(key, question) for key, question in unique.items()))
+    return answers
+
+
+async def build_store(
+    questions: List[str],
+    path: str = STORE_PATH,
+    concurrency: int = CONCURRENCY,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> dict:
+    """
+    Answer `questions` and replace the store at `path` with them. Returns
+    a report for the warm-faq command.
+    """
+    start = time.perf_counter()
+    version, _, previous = read_store(path)
+    entries = await generate_answers(questions, concurrency, progress)
+
+    carried = 0
+    for question in questions:
+        key = normalize_question(question)
+        if key not in entries and key in previous:
+            entries[key] = previous[key]
+            carried += 1
+
+    write_store(path, entries, version + 1)
+    return {
+        "path": path,
+        "version": version + 1,
+        "questions": len({normalize_question(q) for q in questions} - {""}),
+        "entries": len(entries),
+        "carried_over": carried,
+        "seconds": round(time.perf_counter() - start, 1),
+    }
+
+
+# ---------- Serving ----------
+class FaqStore:
+    """
+    The store file held in memory as {normalized question: answer}.
+    refresh() reloads it when the file was replaced (or drops it when the
+    file is gone); lookups never touch the file.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._answers: Dict[str, str] = {}
+        self._file_id: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+        self.version = 0
+        self.built_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get(self, question: str) -> Optional[str]:
+        if not self._answers:
+            return None
+        answer = self._answers.get(normalize_question(question))
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def refresh(self):
+        if not self.path:
+            return
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+                file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                file_id = None
+            if file_id == self._file_id:
+                return
+
+            version, built_at, entries = read_store(self.path) if file_id else (0, 0.0, {})
+            # One assignment, so lookups see the old dict or the new one.
+            self._answers = {key: answer for key, (_, answer) in entries.items()}
+            self._file_id = file_id
+            self.version = version
+            self.built_at = built_at
+            self.reloads += 1
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "built_at": self.built_at,
+            "entries": len(self._answers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
@@ -1,61 +1,252 @@
 import os
+import asyncio
+import functools
+import hmac
+import json
+import math
 import sqlite3
-import hashlib
+import zlib
+from contextlib import aclosing, asynccontextmanager
 from typing import Optional, List
 
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+import anyio
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from openai import OpenAI
-
-# ---------- OpenAI Client & Assistant ----------
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-ASSISTANT_ID = "asst_55iZs4Uxtgt0JmWxJwYWYOMD"
-
-app = FastAPI()
-
-DB_PATH = "health_ai.db"
-
-
-# ---------- Database Setup ----------
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Users table
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL
-        );
-        """
-    )
-
-    # Messages table (chat/history)
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            role TEXT NOT NULL,        -- "user" or "assistant"
-            message TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-        """
+from starlette.requests import HTTPConnection
+
+from assistant import (
+    BUSY_ANSWER,
+    DEGRADED_ANSWER,
+    DEGRADED_SIMILAR_NOTICE,
+    ERROR_ANSWER,
+    FALLBACK_ANSWERS,
+    NO_ANSWER,
+    PENDING_RUN_TTL,
+    STILL_THINKING_ANSWER,
+    RunPending,
+    admission_stats,
+    call_health_assistant,
+    close_client,
+    collect_pending_run,
+    get_client,
+    stream_health_assistant,
+)
+from archive import GZIP_MEDIA_TYPE, NDJSON_MEDIA_TYPE, LineBuffer, MessageImporter, export_ndjson
+import auth
+from auth import (
+    create_session_token,
+    credential_cache,
+    hash_password,
+    verify_password,
+    verify_session_token,
+)
+from cache import AnswerCache, normalize_question
+from emergency import DEFAULT_PHRASES_PATH, load_detector
+from faq import RELOAD_INTERVAL as FAQ_RELOAD_INTERVAL, FaqStore
+from maintenance import MaintenanceJob
+import metrics
+from metrics import (
+    DEGRADED_ANSWERS,
+    EMERGENCY_DETECTIONS,
+    RATE_LIMITED,
+    SQLITE_QUERY_SECONDS,
+    MetricsMiddleware,
+    timed,
+)
+from ratelimit import RateLimited, SharedTokenBucketLimiter, TokenBucketLimiter
+from resilience import CircuitOpen
+from search import search_history
+from shared_state import SHARED_STATE_PATH, shared_state
+from singleflight import SingleFlight
+from static_assets import IMMUTABLE_CACHE_CONTROL, PAGE_CACHE_CONTROL, Asset, StaticBundle
+from storage import decode_message, init_db, pool
+from writer import MessageWriter
+
+# ---------- History Writer ----------
+# /ask hands history rows to a background writer that batches them into
+# a few large transactions instead of committing on the request path.
+message_writer = MessageWriter(
+    pool,
+    max_queue=int(os.environ.get("WRITER_QUEUE_SIZE", "10000")),
+    batch_size=int(os.environ.get("WRITER_BATCH_SIZE", "500")),
+    flush_interval=float(os.environ.get("WRITER_FLUSH_INTERVAL_MS", "50")) / 1000,
+)
+
+
+# Retention, compression of old answers and incremental vacuum; see
+# maintenance.py. One worker runs each pass.
+maintenance_job = MaintenanceJob(pool, shared_state)
+
+
+# Seconds between deletions of expired shared_state entries.
+SHARED_STATE_PURGE_INTERVAL = float(os.environ.get("SHARED_STATE_PURGE_INTERVAL", "60"))
+
+# serve.py migrates once before starting its workers and sets this to 0.
+RUN_MIGRATIONS = os.environ.get("RUN_MIGRATIONS", "1") != "0"
+
+
+async def warm_up_client():
+    try:
+        await run_in_threadpool(get_client)
+    except Exception as e:
+        # Questions will fail the same way (ERROR_ANSWER) until it is fixed.
+        print("ERROR creating OpenAI client:", e)
+
+
+async def purge_shared_state():
+    # Pending runs, claims and rate limit buckets all expire; with several
+    # workers nothing else deletes their rows from the shared file.
+    while True:
+        await asyncio.sleep(SHARED_STATE_PURGE_INTERVAL)
+        try:
+            await shared_state.run(shared_state.purge_expired)
+        except Exception as e:
+            print("ERROR purging shared state:", e)
+
+
+async def reload_faq():
+    while True:
+        await asyncio.sleep(FAQ_RELOAD_INTERVAL)
+        try:
+            await run_in_threadpool(faq_store.refresh)
+        except Exception as e:
+            # Keep serving the store already loaded.
+            print("ERROR reloading FAQ store:", e)
+
+
+# Importing this module opens nothing: no database connection, no OpenAI
+# client. Everything with a cost starts here.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if RUN_MIGRATIONS:
+        await run_in_threadpool(init_db)  # a single read once the schema is current
+    await run_in_threadpool(faq_store.refresh)
+    await run_in_threadpool(answer_cache.load)
+    await run_in_threadpool(static_bundle)
+    faq_reloader = asyncio.ensure_future(reload_faq())
+    state_purger = asyncio.ensure_future(purge_shared_state())
+    message_writer.start()
+    maintenance_job.start()
+    # Serve right away; the OpenAI SDK loads in the background so the first
+    # question does not wait for it.
+    client_warmup = asyncio.ensure_future(warm_up_client())
+    yield
+    faq_reloader.cancel()
+    state_purger.cancel()
+    await run_in_threadpool(maintenance_job.stop)
+    # Flush whatever is still queued before the process exits.
+    await run_in_threadpool(message_writer.stop)
+    await client_warmup
+    await close_client()
+    auth.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+# Streamed answers are written to history every N chunks so a dropped
+# connection keeps what was already generated.
+STREAM_CHECKPOINT_CHUNKS = int(os.environ.get("STREAM_CHECKPOINT_CHUNKS", "20"))
+
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", "500"))
+
+# Bulk export/import of the whole database (/admin/*) is only served when
+# ADMIN_TOKEN is set, to clients sending it in X-Admin-Token.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Uploaded lines handed to the importer per threadpool call.
+IMPORT_FEED_LINES = 2000
+
+# /ask/batch: most questions per request, and how many of one request's
+# questions are with the assistant at once.
+ASK_BATCH_MAX_QUESTIONS = int(os.environ.get("ASK_BATCH_MAX_QUESTIONS", "100"))
+ASK_BATCH_CONCURRENCY = int(os.environ.get("ASK_BATCH_CONCURRENCY", "8"))
+
+# /ws/chat: sockets per process, seconds a socket may sit without a
+# message from the client, seconds to send the auth message, and seconds a
+# send may stall on a client that is not reading before it is dropped.
+WS_MAX_CONNECTIONS = int(os.environ.get("WS_MAX_CONNECTIONS", "10000"))
+WS_IDLE_TIMEOUT = float(os.environ.get("WS_IDLE_TIMEOUT", "300"))
+WS_AUTH_TIMEOUT = float(os.environ.get("WS_AUTH_TIMEOUT", "10"))
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "10"))
+
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get("SEARCH_MAX_PAGE_SIZE", "100"))
+# Ranked results cannot use keyset cursors; deep offsets are refused
+# rather than ranking ever more rows per page.
+SEARCH_MAX_OFFSET = int(os.environ.get("SEARCH_MAX_OFFSET", "1000"))
+
+# ---------- Emergency Detector ----------
+# Built once at startup; see emergency_phrases.txt for the file format.
+emergency_detector = load_detector(
+    os.environ.get("EMERGENCY_PHRASES_PATH", DEFAULT_PHRASES_PATH),
+    threshold=float(os.environ.get("EMERGENCY_THRESHOLD", "1.0")),
+)
+
+# ---------- FAQ Store ----------
+# Answers built offline by `python manage.py warm-faq`; see faq.py.
+faq_store = FaqStore()
+
+# ---------- Answer Cache ----------
+# ANSWER_CACHE_SIMILARITY=0 disables fuzzy matching (0.85 or higher is a
+# sensible starting point when enabled); ANSWER_CACHE_DB="" keeps
+# the cache in memory only.
+answer_cache = AnswerCache(
+    max_entries=int(os.environ.get("ANSWER_CACHE_SIZE", "1000")),
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", "86400")),
+    similarity_threshold=float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0")),
+    db_path=os.environ.get("ANSWER_CACHE_DB") or None,
+)
+# While the assistant's circuit is open, questions with no cached answer of
+# their own get DEGRADED_ANSWER. Setting this (0.9 or higher: at 0.6,
+# "normal blood sugar" got the "normal blood pressure" answer) serves the
+# answer to the closest question scoring at least that much instead,
+# prefixed with DEGRADED_SIMILAR_NOTICE naming that question. 0 disables.
+DEGRADED_SIMILARITY = float(os.environ.get("DEGRADED_SIMILARITY", "0"))
+
+
+# ---------- Rate Limits ----------
+# Token buckets per client: logged-in users by id, everyone else by IP.
+# Rates and bursts are per deployment. With SHARED_STATE_PATH set (serve.py
+# sets it for more than one worker) the buckets live in the shared store,
+# so every worker draws on the same ones; otherwise they are in memory.
+def client_limiter(name: str, per_minute: float, burst: float):
+    if SHARED_STATE_PATH:
+        return SharedTokenBucketLimiter(shared_state, name, per_minute / 60, burst)
+    return TokenBucketLimiter(
+        rate=per_minute / 60,
+        burst=burst,
+        max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")),
     )
 
-    conn.commit()
-    conn.close()
-
-
-init_db()
-
 
-def get_db():
-    return sqlite3.connect(DB_PATH)
+ask_limiter = client_limiter(
+    "ask",
+    float(os.environ.get("ASK_RATE_PER_MINUTE", "20")),
+    float(os.environ.get("ASK_BURST", "10")),
+)
+# Batches are charged per question, from a bucket of their own that fits a
+# whole batch.
+ask_batch_limiter = client_limiter(
+    "ask_batch",
+    float(os.environ.get("ASK_BATCH_RATE_PER_MINUTE", "120")),
+    float(os.environ.get("ASK_BATCH_BURST", str(ASK_BATCH_MAX_QUESTIONS))),
+)
+# Password hashing is deliberately slow, so signup/login get a tighter limit.
+auth_limiter = client_limiter(
+    "auth",
+    float(os.environ.get("AUTH_RATE_PER_MINUTE", "10")),
+    float(os.environ.get("AUTH_BURST", "5")),
+)
+
+# Identical questions asked at the same time share one assistant run.
+in_flight = SingleFlight(
+    max_wait=float(os.environ.get("SINGLEFLIGHT_MAX_WAIT", "60")),
+    is_failure=lambda answer: answer in FALLBACK_ANSWERS,
+    share_errors=(RunPending, CircuitOpen),
+)
 
 
 # ---------- Pydantic Models ----------
@@ -64,561 +255,965 @@ class Question(BaseModel):
     user_id: Optional[int] = None
 
 
+class QuestionBatch(BaseModel):
+    questions: List[Question]
+
+
 class AuthRequest(BaseModel):
     username: str
     password: str
 
 
 class Message(BaseModel):
+    id: Optional[int] = None
     role: str
     message: str
 
 
-# ---------- OpenAI Call ----------
-def call_health_assistant(user_question: str) -> str:
-    """
-    Call your OpenAI Health Assistant and return a warm, educational answer.
-    """
-    try:
-        thread = client.beta.threads.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": (
-                        "You are a warm, educational, supportive health assistant.\n"
-                        "You give general health information only, not medical advice.\n\n"
-                        f"User question: \"{user_question}\""
-                    ),
-                }
-            ]
-        )
+class SearchResult(BaseModel):
+    id: int
+    role: str
+    created_at: Optional[str] = None
+    snippet: str  # HTML-escaped, matches wrapped in <mark>
 
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=ASSISTANT_ID,
-        )
 
-        if run.status != "completed":
-            return "The assistant is still thinking. Please try again in a moment."
+# ---------- Admission Control ----------
+def client_key(request: HTTPConnection, user_id: Optional[int]) -> str:
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
 
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data:
-            if msg.role == "assistant":
-                parts = [p.text.value for p in msg.content if p.type == "text"]
-                if parts:
-                    return "\n".join(parts)
 
-        return "I couldn’t generate a full response this time. Please try again."
-    except Exception as e:
-        print("ERROR calling assistant:", e)
-        return "There was an issue contacting the AI service. Please try again."
+def too_many_requests(retry_after: float, limit: str, detail: str = BUSY_ANSWER) -> JSONResponse:
+    RATE_LIMITED.inc(limit)
+    return JSONResponse(
+        {"detail": detail, "retry_after": math.ceil(retry_after)},
+        status_code=429,
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+async def enforce_limit(limiter, key: str, limit: str, cost: float = 1):
+    wait = await limiter.take(key, cost)
+    if wait:
+        raise RateLimited(wait, limit)
+
+
+# Per-client limits get their own message; upstream overload says "busy".
+RATE_LIMIT_MESSAGES = {
+    "ask": "You're asking questions faster than I can answer. Please wait a moment and try again.",
+    "ask_batch": "You're asking questions faster than I can answer. Please wait a moment and try again.",
+    "auth": "Too many attempts. Please wait a moment and try again.",
+}
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return too_many_requests(exc.retry_after, exc.reason, RATE_LIMIT_MESSAGES.get(exc.reason, BUSY_ANSWER))
 
 
 # ---------- Auth Endpoints ----------
+@timed(SQLITE_QUERY_SECONDS, "create_user")
+def create_user(username: str, pw_hash: str) -> int:
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+            (username, pw_hash),
+        )
+        return c.lastrowid
+
+
+@timed(SQLITE_QUERY_SECONDS, "get_credentials")
+def get_credentials(username: str):
+    with pool.connection() as conn:
+        return conn.execute(
+            "SELECT id, password_hash FROM users WHERE username = ?",
+            (username,),
+        ).fetchone()
+
+
+@timed(SQLITE_QUERY_SECONDS, "update_password_hash")
+def update_password_hash(user_id: int, pw_hash: str):
+    with pool.connection() as conn:
+        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (pw_hash, user_id))
+
+
+def session_user_id(authorization: Optional[str] = Header(None)) -> Optional[int]:
+    """
+    The user id from an "Authorization: Bearer <token>" header, or None
+    without one. A header that is there but invalid or expired is a 401,
+    not a silent fall back to anonymous (whose history would not be saved).
+    """
+    if not authorization:
+        return None
+    user_id = None
+    if authorization.lower().startswith("bearer "):
+        user_id = verify_session_token(authorization[7:].strip())
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Please log in again.")
+    return user_id
+
+
+def resolve_user(claimed_user_id: Optional[int], session_user: Optional[int]) -> Optional[int]:
+    """
+    A user_id in the request is only honoured when the session token
+    belongs to that same user.
+    """
+    if claimed_user_id is not None and claimed_user_id != session_user:
+        raise HTTPException(status_code=401, detail="Please log in again.")
+    return session_user
+
+
 @app.post("/signup")
-def signup(auth: AuthRequest):
+async def signup(auth: AuthRequest, request: Request):
+    await enforce_limit(auth_limiter, client_key(request, None), "auth")
     username = auth.username.strip()
     password = auth.password
 
     if not username or not password:
         return {"success": False, "message": "Username and password are required."}
 
-    pw_hash = hashlib.sha256(password.encode()).hexdigest()
+    pw_hash = await hash_password(password)
 
-    conn = get_db()
-    c = conn.cursor()
     try:
-        c.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-            (username, pw_hash),
-        )
-        conn.commit()
-        user_id = c.lastrowid
-        return {
-            "success": True,
-            "message": "Account created.",
-            "user_id": user_id,
-            "username": username,
-        }
+        user_id = await run_in_threadpool(create_user, username, pw_hash)
     except sqlite3.IntegrityError:
         return {"success": False, "message": "Username already taken."}
-    finally:
-        conn.close()
+
+    credential_cache.add(username, password, pw_hash)
+    return {
+        "success": True,
+        "message": "Account created.",
+        "user_id": user_id,
+        "username": username,
+        "token": create_session_token(user_id),
+    }
 
 
 @app.post("/login")
-def login(auth: AuthRequest):
+async def login(auth: AuthRequest, request: Request):
+    await enforce_limit(auth_limiter, client_key(request, None), "auth")
     username = auth.username.strip()
     password = auth.password
 
     if not username or not password:
         return {"success": False, "message": "Username and password are required."}
 
-    pw_hash = hashlib.sha256(password.encode()).hexdigest()
-
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        "SELECT id, password_hash FROM users WHERE username = ?",
-        (username,),
-    )
-    row = c.fetchone()
-    conn.close()
+    row = await run_in_threadpool(get_credentials, username)
 
     if row is None:
         return {"success": False, "message": "User not found."}
 
     user_id, stored_hash = row
-    if stored_hash != pw_hash:
-        return {"success": False, "message": "Incorrect password."}
+    if not credential_cache.check(username, password, stored_hash):
+        ok, new_hash = await verify_password(password, stored_hash)
+        if not ok:
+            return {"success": False, "message": "Incorrect password."}
+        if new_hash is not None:
+            # Cost settings changed (or a legacy hash): upgrade in place.
+            await run_in_threadpool(update_password_hash, user_id, new_hash)
+            stored_hash = new_hash
+        credential_cache.add(username, password, stored_hash)
 
     return {
         "success": True,
         "message": "Login successful.",
         "user_id": user_id,
         "username": username,
+        "token": create_session_token(user_id),
     }
 
 
 # ---------- History Endpoint ----------
 @app.get("/history")
-def get_history(user_id: int) -> List[Message]:
-    conn = get_db()
-    c = conn.cursor()
-    c.execute(
-        """
-        SELECT role, message
-        FROM messages
-        WHERE user_id = ?
-        ORDER BY id ASC
-        """,
-        (user_id,),
+def get_history(
+    user_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    session_user: Optional[int] = Depends(session_user_id),
+) -> List[Message]:
+    """
+    One page of the logged-in user's history, oldest first.
+
+    With no cursor this is the most recent page. before_id pages backwards
+    (older rows); after_id returns rows newer than the last one the client
+    has seen, so it can pull only what changed.
+    """
+    user_id = resolve_user(user_id, session_user)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Please log in again.")
+    return load_history(user_id, before_id, after_id, limit)
+
+
+def load_history(
+    user_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> List[dict]:
+    with SQLITE_QUERY_SECONDS.time("history"), pool.connection() as conn:
+        if after_id is not None:
+            rows = conn.execute(
+                """
+                SELECT id, role, message
+                FROM messages
+                WHERE user_id = ? AND id > ? AND id < ?
+                ORDER BY id ASC
+                LIMIT ?
+                """,
+                (user_id, after_id, before_id if before_id is not None else 2**63 - 1, limit),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                """
+                SELECT id, role, message
+                FROM messages
+                WHERE user_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (user_id, before_id if before_id is not None else 2**63 - 1, limit),
+            ).fetchall()
+            rows.reverse()
+
+    return [{"id": id_, "role": role, "message": decode_message(msg)} for (id_, role, msg) in rows]
+
+
+@app.get("/history/search")
+def search_history_endpoint(
+    q: str = Query(..., min_length=1, max_length=500),
+    user_id: Optional[int] = None,
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    session_user: Optional[int] = Depends(session_user_id),
+) -> List[SearchResult]:
+    """
+    The logged-in user's messages containing every word of q, best match
+    first. Page with offset; a short page is the last one. Each result's
+    id can be passed to /history as a cursor to load the surrounding
+    conversation.
+    """
+    user_id = resolve_user(user_id, session_user)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Please log in again.")
+    return search_history(user_id, q, limit, offset)
+
+
+# ---------- Export / Import ----------
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+def export_response(user_id: Optional[int], gzip: bool, filename: str) -> StreamingResponse:
+    """
+    NDJSON, one message per line in id order, streamed page by page.
+    """
+    if gzip:
+        filename += ".gz"
+    return StreamingResponse(
+        export_ndjson(pool, user_id, gzip),
+        media_type=GZIP_MEDIA_TYPE if gzip else NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    rows = c.fetchall()
-    conn.close()
 
-    return [{"role": role, "message": msg} for (role, msg) in rows]
+
+@app.get("/history/export")
+def export_history(
+    gzip: bool = False,
+    session_user: Optional[int] = Depends(session_user_id),
+):
+    """
+    Download the logged-in user's whole history as NDJSON (gzip=true for .ndjson.gz).
+    """
+    if session_user is None:
+        raise HTTPException(status_code=401, detail="Please log in again.")
+    return export_response(session_user, gzip, f"history-{session_user}.ndjson")
+
+
+@app.get("/admin/export", dependencies=[Depends(require_admin)])
+def admin_export(user_id: Optional[int] = None, gzip: bool = False):
+    """
+    Export every message, or one user's, as NDJSON.
+    """
+    name = "messages.ndjson" if user_id is None else f"history-{user_id}.ndjson"
+    return export_response(user_id, gzip, name)
+
+
+@app.post("/admin/import", dependencies=[Depends(require_admin)])
+async def admin_import(request: Request, user_id: Optional[int] = None, keep_ids: bool = False):
+    """
+    Load an NDJSON body in the export format (send Content-Encoding: gzip
+    for a .gz file). The body is read as it arrives and committed in
+    large transactions. user_id assigns every row to that user; keep_ids
+    restores the original ids, skipping ones that already exist.
+    """
+    importer = MessageImporter(pool, user_id=user_id, keep_ids=keep_ids)
+    buffer = LineBuffer(gzip=request.headers.get("content-encoding", "").lower() == "gzip")
+    lines = []
+    try:
+        async for chunk in request.stream():
+            lines.extend(buffer.push(chunk))
+            if len(lines) >= IMPORT_FEED_LINES:
+                await run_in_threadpool(importer.feed, lines)
+                lines = []
+        lines.extend(buffer.finish())
+        await run_in_threadpool(importer.feed, lines)
+        await run_in_threadpool(importer.close)
+    except (ValueError, zlib.error) as e:
+        return JSONResponse({"detail": str(e), **importer.stats()}, status_code=400)
+    return importer.stats()
+
+
+# ---------- Stats Endpoint ----------
+@app.get("/stats")
+def get_stats():
+    return {
+        "faq": faq_store.stats(),
+        "answer_cache": answer_cache.stats(),
+        "in_flight": in_flight.stats(),
+        "message_writer": message_writer.stats(),
+        "admission": admission_stats(),
+        "ask_limiter": ask_limiter.stats(),
+        "ask_batch_limiter": ask_batch_limiter.stats(),
+        "auth_limiter": auth_limiter.stats(),
+        "chat_sockets": chat_sockets.stats(),
+        "maintenance": maintenance_job.stats(),
+    }
+
+
+# ---------- Metrics Endpoint ----------
+def component_stats() -> dict:
+    return {
+        (component, stat): value
+        for component, stats in get_stats().items()
+        for stat, value in stats.items()
+    }
+
+
+metrics.Gauge(
+    "health_component_stat",
+    "Counters and gauges from /stats, read at scrape time.",
+    ("component", "stat"),
+    callback=component_stats,
+)
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 
 # ---------- Home Page (Simple UI + Auth + History) ----------
+# static/ is minified, hashed and pre-compressed once, at startup (or on
+# first use without the lifespan); serving the page is then just picking a
+# body and checking the ETag.
+@functools.lru_cache(maxsize=None)
+def static_bundle() -> StaticBundle:
+    return StaticBundle()
+
+
+def asset_response(request: Request, asset: Asset, cache_control: str) -> Response:
+    encoding = asset.choose_encoding(request.headers.get("accept-encoding", ""))
+    headers = {
+        "Cache-Control": cache_control,
+        "ETag": asset.etag(encoding),
+        "Vary": "Accept-Encoding",
+    }
+    if asset.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(asset.bodies[encoding], media_type=asset.content_type, headers=headers)
+
+
 @app.get("/", response_class=HTMLResponse)
-def read_root():
-    return """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <title>Health Assistant AI</title>
-        <meta charset="UTF-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-        <style>
-            body {
-                background: radial-gradient(circle at top, #151823, #05060a 40%, #020308 100%);
-                color: #f5f5f7;
-                font-family: system-ui, sans-serif;
-                margin: 0;
-                display: flex;
-                flex-direction: column;
-                min-height: 100vh;
-            }
-            .navbar {
-                text-align: center;
-                padding: 20px 0;
-                font-size: 1.7rem;
-                font-weight: 600;
-                letter-spacing: 0.5px;
-                border-bottom: 1px solid rgba(255,255,255,0.05);
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                gap: 10px;
-            }
-            .content {
-                max-width: 900px;
-                margin: 10px auto 20px auto;
-                padding: 0 20px 20px 20px;
-                flex: 1;
-                display: flex;
-                flex-direction: column;
-                gap: 14px;
-            }
-            /* Auth bar */
-            .auth-bar {
-                background: rgba(10, 12, 20, 0.9);
-                border-radius: 10px;
-                padding: 10px 12px;
-                border: 1px solid rgba(255,255,255,0.06);
-                display: flex;
-                flex-wrap: wrap;
-                align-items: center;
-                gap: 8px;
-                font-size: 0.85rem;
-            }
-            .auth-bar input {
-                background: #0b0d15;
-                border-radius: 8px;
-                border: 1px solid #2a2f42;
-                color: #fff;
-                padding: 5px 8px;
-                font-size: 0.85rem;
-            }
-            .auth-bar button {
-                padding: 6px 10px;
-                border-radius: 8px;
-                border: none;
-                background: linear-gradient(135deg,#32e0a1,#1aa36f);
-                color: #000;
-                font-size: 0.8rem;
-                font-weight: 600;
-                cursor: pointer;
-            }
-            .auth-message {
-                color: #f5f5f7;
-                font-size: 0.8rem;
-            }
-            .auth-muted {
-                color: #9ea2b3;
-            }
-            .auth-logged {
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            }
-
-            /* Simple Q&A box */
-            .assistant-box {
-                background: rgba(10, 12, 20, 0.85);
-                padding: 20px;
-                border-radius: 14px;
-                border: 1px solid rgba(255,255,255,0.06);
-                box-shadow: 0 0 25px rgba(0,0,0,0.6);
-            }
-            .assistant-box h2 {
-                margin-top: 0;
-                margin-bottom: 10px;
-                font-size: 1.1rem;
-            }
-            textarea {
-                width: 100%;
-                height: 120px;
-                background: #0b0d15;
-                border-radius: 10px;
-                padding: 10px;
-                border: 1px solid #2a2f42;
-                color: #fff;
-                margin-bottom: 10px;
-                resize: vertical;
-                font-size: 0.95rem;
-            }
-            .ask-button {
-                width: 100%;
-                padding: 10px;
-                border-radius: 10px;
-                border: none;
-                background: linear-gradient(135deg,#32e0a1,#1aa36f);
-                color: #000;
-                font-size: 1rem;
-                font-weight: bold;
-                cursor: pointer;
-            }
-            #answer {
-                margin-top: 15px;
-                white-space: pre-wrap;
-                border-top: 1px solid rgba(255,255,255,0.08);
-                padding-top: 10px;
-                font-size: 0.95rem;
-            }
-
-            /* History box */
-            .history-box {
-                background: rgba(5, 7, 14, 0.9);
-                border-radius: 10px;
-                border: 1px solid rgba(255,255,255,0.04);
-                padding: 10px 12px;
-                font-size: 0.85rem;
-                max-height: 220px;
-                overflow-y: auto;
-            }
-            .history-entry {
-                margin-bottom: 8px;
-            }
-            .history-entry strong {
-                color: #32e0a1;
-            }
-
-            .footer {
-                text-align: center;
-                font-size: 0.75rem;
-                color: #8a8f9e;
-                margin: 10px 0 18px 0;
-                opacity: 0.6;
-            }
-        </style>
-    </head>
-    <body>
-        <header class="navbar">
-            <span>Health Assistant AI</span>
-        </header>
-
-        <main class="content">
-            <!-- Auth bar -->
-            <div class="auth-bar">
-                <div id="auth-logged-out">
-                    <span class="auth-muted">Log in or sign up to save your questions and answers:</span>
-                    <input id="authUsername" type="text" placeholder="Username" />
-                    <input id="authPassword" type="password" placeholder="Password" />
-                    <button onclick="signup()">Sign up</button>
-                    <button onclick="login()">Log in</button>
-                </div>
-                <div id="auth-logged-in" style="display:none" class="auth-logged">
-                    <span>Logged in as <strong id="currentUserLabel"></strong></span>
-                    <button onclick="loadHistory()">Load history</button>
-                    <button onclick="logout()">Log out</button>
-                </div>
-                <div id="authMessage" class="auth-message"></div>
-            </div>
-
-            <!-- Main Q&A box -->
-            <div class="assistant-box">
-                <h2>Ask a health-related question</h2>
-                <textarea id="question" placeholder="Example: Why do I feel lightheaded when I stand up?"></textarea>
-                <button class="ask-button" onclick="ask()">Ask</button>
-                <div id="answer"></div>
-            </div>
-
-            <!-- History panel (when logged in + loaded) -->
-            <div class="history-box" id="historyBox">
-                <em>History will appear here after you log in and click "Load history".</em>
-            </div>
-        </main>
-
-        <footer class="footer">
-            Educational information only — not medical advice or diagnosis.
-        </footer>
-
-        <script>
-            const authLoggedOut = document.getElementById('auth-logged-out');
-            const authLoggedIn = document.getElementById('auth-logged-in');
-            const authMsg = document.getElementById('authMessage');
-            const currentUserLabel = document.getElementById('currentUserLabel');
-            const historyBox = document.getElementById('historyBox');
-
-            function getCurrentUser() {
-                const userId = localStorage.getItem('health_user_id');
-                const username = localStorage.getItem('health_username');
-                if (userId && username) {
-                    return { userId: parseInt(userId), username };
-                }
-                return null;
-            }
-
-            function setCurrentUser(userId, username) {
-                localStorage.setItem('health_user_id', String(userId));
-                localStorage.setItem('health_username', username);
-                updateAuthUI();
-            }
-
-            function clearCurrentUser() {
-                localStorage.removeItem('health_user_id');
-                localStorage.removeItem('health_username');
-                updateAuthUI();
-            }
-
-            function updateAuthUI() {
-                const user = getCurrentUser();
-                authMsg.textContent = '';
-                if (user) {
-                    authLoggedOut.style.display = 'flex';
-                    authLoggedOut.style.visibility = 'hidden';
-                    authLoggedOut.style.position = 'absolute';
-                    authLoggedIn.style.display = 'flex';
-                    currentUserLabel.textContent = user.username;
-                } else {
-                    authLoggedOut.style.display = 'flex';
-                    authLoggedOut.style.visibility = 'visible';
-                    authLoggedOut.style.position = 'static';
-                    authLoggedIn.style.display = 'none';
-                    currentUserLabel.textContent = '';
-                    historyBox.innerHTML = '<em>History will appear here after you log in and click "Load history".</em>';
-                }
-            }
-
-            function showAuthMessage(text) {
-                authMsg.textContent = text;
-            }
-
-            async function signup() {
-                const username = document.getElementById('authUsername').value.trim();
-                const password = document.getElementById('authPassword').value;
-
-                if (!username || !password) {
-                    showAuthMessage("Please enter username and password.");
-                    return;
-                }
-
-                try {
-                    const res = await fetch('/signup', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ username, password })
-                    });
-                    const data = await res.json();
-                    showAuthMessage(data.message || '');
-                    if (data.success) {
-                        setCurrentUser(data.user_id, data.username);
-                    }
-                } catch (err) {
-                    console.error(err);
-                    showAuthMessage("Error during signup.");
-                }
-            }
-
-            async function login() {
-                const username = document.getElementById('authUsername').value.trim();
-                const password = document.getElementById('authPassword').value;
-
-                if (!username || !password) {
-                    showAuthMessage("Please enter username and password.");
-                    return;
-                }
-
-                try {
-                    const res = await fetch('/login', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ username, password })
-                    });
-                    const data = await res.json();
-                    showAuthMessage(data.message || '');
-                    if (data.success) {
-                        setCurrentUser(data.user_id, data.username);
-                    }
-                } catch (err) {
-                    console.error(err);
-                    showAuthMessage("Error during login.");
-                }
-            }
-
-            function logout() {
-                clearCurrentUser();
-                showAuthMessage("Logged out.");
-            }
-
-            async function loadHistory() {
-                const user = getCurrentUser();
-                if (!user) {
-                    showAuthMessage("You must be logged in to load history.");
-                    return;
-                }
-
-                try {
-                    const res = await fetch('/history?user_id=' + user.userId);
-                    const data = await res.json();
-
-                    historyBox.innerHTML = "";
-                    if (!data || data.length === 0) {
-                        historyBox.innerHTML = "<em>No saved history yet. Ask a question and I'll start saving your chats.</em>";
-                        return;
-                    }
-
-                    for (const entry of data) {
-                        const div = document.createElement('div');
-                        div.className = 'history-entry';
-                        const who = entry.role === 'user' ? 'You' : 'Assistant';
-                        div.innerHTML = "<strong>" + who + ":</strong> " + entry.message;
-                        historyBox.appendChild(div);
-                    }
-                } catch (err) {
-                    console.error(err);
-                    showAuthMessage("Error loading history.");
-                }
-            }
-
-            async function ask() {
-                const questionEl = document.getElementById('question');
-                const answerDiv = document.getElementById('answer');
-                const text = questionEl.value.trim();
-
-                if (!text) {
-                    answerDiv.textContent = "Please type a question.";
-                    return;
-                }
-
-                answerDiv.textContent = "Thinking...";
-                const user = getCurrentUser();
-
-                const body = user
-                    ? { question: text, user_id: user.userId }
-                    : { question: text };
-
-                try {
-                    const res = await fetch('/ask', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify(body)
-                    });
-                    const data = await res.json();
-                    answerDiv.textContent = data.answer || "I couldn't generate a response. Please try again.";
-                } catch (err) {
-                    console.error(err);
-                    answerDiv.textContent = "There was an error contacting the server. Please try again.";
-                }
-            }
-
-            // Initialize auth UI on load
-            updateAuthUI();
-        </script>
-    </body>
-    </html>
-    """
+def read_root(request: Request):
+    return asset_response(request, static_bundle().index, PAGE_CACHE_CONTROL)
+
+
+@app.get("/static/{name}")
+def read_static(name: str, request: Request):
+    asset = static_bundle().assets.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found.")
+    return asset_response(request, asset, IMMUTABLE_CACHE_CONTROL)
 
 
 # ---------- Ask Endpoint (with history saving) ----------
-@app.post("/ask")
-def ask_health_question(q: Question):
+EMERGENCY_ANSWER = (
+    "⚠️ Your message sounds like it could involve a serious or emergency situation.\n\n"
+    "Please call 911 or your local emergency number, or go to the nearest emergency room or urgent care "
+    "immediately. This assistant cannot evaluate or respond to emergencies."
+)
+
+
+def is_emergency(question: str) -> bool:
+    detection = emergency_detector.scan(question)
+    if detection.score < emergency_detector.threshold:
+        return False
+    for category in detection.categories:
+        EMERGENCY_DETECTIONS.inc(category)
+    return True
+
+
+def degraded_answer(question: str) -> str:
     """
-    Takes a question and returns an answer.
-    If user_id is provided, saves the conversation in the database.
-    """
-    text_lower = q.question.lower()
-    emergencies = [
-        "not breathing",
-        "can't breathe",
-        "cannot breathe",
-        "bleeding a lot",
-        "overdose",
-        "suicidal",
-        "kill myself",
-        "want to hurt myself",
-        "heart attack",
-        "stroke",
-        "chest pain",
-        "passed out",
-        "unconscious",
-    ]
+    Best answer available without the assistant when the question itself
+    is not cached: with DEGRADED_SIMILARITY set, a cached answer to a
+    similar question under a notice naming it, otherwise DEGRADED_ANSWER.
+    """
+    if DEGRADED_SIMILARITY > 0:
+        similar = answer_cache.similar(question, DEGRADED_SIMILARITY)
+        if similar is not None:
+            DEGRADED_ANSWERS.inc("cache")
+            similar_question, answer = similar
+            return DEGRADED_SIMILAR_NOTICE.format(question=similar_question) + answer
+    DEGRADED_ANSWERS.inc("fallback")
+    return DEGRADED_ANSWER
 
-    # Emergency check
-    if any(word in text_lower for word in emergencies):
-        answer = (
-            "⚠️ Your message sounds like it could involve a serious or emergency situation.\n\n"
-            "Please call 911 or your local emergency number, or go to the nearest emergency room or urgent care "
-            "immediately. This assistant cannot evaluate or respond to emergencies."
-        )
-    else:
-        answer = call_health_assistant(q.question)
 
-    # Save history if we have a logged-in user
-    if q.user_id is not None:
-        conn = get_db()
+async def cached_answer(question: str) -> Optional[str]:
+    """
+    The FAQ store's or the answer cache's answer, if either has one. The
+    cache's SQLite lookup (ANSWER_CACHE_DB) runs in the threadpool: it can
+    wait on another worker's write.
+    """
+    answer = faq_store.get(question)
+    if answer is None:
+        answer = answer_cache.peek(question)
+    if answer is None:
+        if answer_cache.db_path:
+            answer = await run_in_threadpool(answer_cache.lookup, question)
+        else:
+            answer = answer_cache.lookup(question)
+    return answer
+
+
+async def answer_question(question: str, user_id: Optional[int] = None) -> str:
+    """
+    Answer from the FAQ store or the cache when possible, otherwise ask
+    the assistant and remember real answers for next time. While the
+    circuit breaker has the assistant marked down, answers come from
+    degraded_answer().
+
+    Logged-in users continue their own conversation thread, so their
+    answers may draw on earlier questions; those are never cached or
+    handed to other callers.
+    """
+    answer = await cached_answer(question)
+    if answer is not None:
+        return answer
+
+    key = normalize_question(question)
+    try:
+        if user_id is not None:
+            shared = await in_flight.join(key)
+            if shared is not None:
+                return shared
+            return await call_health_assistant(question, user_id)
+
+        async def ask():
+            answer = await call_health_assistant(question)
+            if answer not in FALLBACK_ANSWERS:
+                await run_in_threadpool(answer_cache.put, question, answer)
+            return answer
+
+        return await in_flight.do(key, ask)
+    except CircuitOpen:
+        return await run_in_threadpool(degraded_answer, question)
+
+
+@timed(SQLITE_QUERY_SECONDS, "save_conversation")
+def save_conversation(user_id: int, question: str, answer: str) -> int:
+    """
+    Save a question/answer pair and return the id of the assistant row.
+    """
+    with pool.connection() as conn:
         c = conn.cursor()
         c.execute(
             "INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)",
-            (q.user_id, "user", q.question),
+            (user_id, "user", question),
         )
         c.execute(
             "INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)",
-            (q.user_id, "assistant", answer),
+            (user_id, "assistant", answer),
         )
-        conn.commit()
-        conn.close()
+        return c.lastrowid
+
+
+@timed(SQLITE_QUERY_SECONDS, "save_messages")
+def save_messages(rows: List[tuple]):
+    """
+    Save (user_id, role, message) rows in one transaction.
+    """
+    with pool.connection() as conn:
+        conn.executemany("INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)", rows)
+
+
+@timed(SQLITE_QUERY_SECONDS, "update_message")
+def update_message(message_id: int, message: str):
+    with pool.connection() as conn:
+        conn.execute("UPDATE messages SET message = ? WHERE id = ?", (message, message_id))
+
+
+async def record_conversation(user_id: int, question: str, answer: str):
+    await record_messages([(user_id, "user", question), (user_id, "assistant", answer)])
+
+
+async def record_messages(rows: List[tuple]):
+    """
+    Save history off the request path, or directly if the writer is full.
+    Either way the rows land in one transaction.
+    """
+    if rows and not message_writer.submit(rows):
+        await run_in_threadpool(save_messages, rows)
+
+
+def pending_response(token: str) -> dict:
+    return {"answer": STILL_THINKING_ANSWER, "pending": True, "token": token}
+
+
+@app.post("/ask")
+async def ask_health_question(
+    q: Question,
+    request: Request,
+    session_user: Optional[int] = Depends(session_user_id),
+):
+    """
+    Takes a question and returns an answer.
+    With a valid session token, saves the conversation in the database.
+
+    Slow runs are not restarted: the response carries "pending": true and a
+    token to poll /ask/result/{token} with.
+    """
+    user_id = resolve_user(q.user_id, session_user)
+
+    # Emergency check (never rate limited)
+    if is_emergency(q.question):
+        answer = EMERGENCY_ANSWER
+    else:
+        await enforce_limit(ask_limiter, client_key(request, user_id), "ask")
+        try:
+            answer = await answer_question(q.question, user_id)
+        except RunPending as pending:
+            return pending_response(pending.token)
+
+    # Save history if we have a logged-in user (off the request path)
+    if user_id is not None:
+        await record_conversation(user_id, q.question, answer)
 
     return {"answer": answer}
+
+
+@app.get("/ask/result/{token}")
+async def get_ask_result(token: str):
+    """
+    Collect the answer of a run that was still going when /ask returned.
+    """
+    try:
+        pending = await collect_pending_run(token)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown or expired token.")
+    except RunPending:
+        return pending_response(token)
+    except Exception as e:
+        print("ERROR collecting assistant run:", e)
+        return {"answer": ERROR_ANSWER, "pending": False}
+
+    # Save/cache the answer only once, whoever collects it first (in any
+    # worker process).
+    if not pending.recorded:
+        pending.recorded = True
+        if await shared_state.run(shared_state.add, f"recorded_run:{token}", "1", PENDING_RUN_TTL):
+            if pending.user_id is not None:
+                await record_conversation(pending.user_id, pending.question, pending.answer)
+            elif pending.answer not in FALLBACK_ANSWERS:
+                await run_in_threadpool(answer_cache.put, pending.question, pending.answer)
+
+    return {"answer": pending.answer, "pending": False}
+
+
+# ---------- Batch Ask Endpoint ----------
+async def answer_batch_item(index: int, question: str, slots: asyncio.Semaphore) -> dict:
+    """
+    One /ask/batch result. status is "ok", "fallback" (the assistant could
+    not answer; answer says why), "pending" (poll token as with /ask),
+    "busy" (upstream admission refused it) or "error".
+    """
+    async with slots:
+        try:
+            answer = await answer_question(question)
+        except RunPending as pending:
+            return {"index": index, "status": "pending", **pending_response(pending.token)}
+        except RateLimited as e:
+            return {"index": index, "status": "busy", "answer": BUSY_ANSWER, "retry_after": math.ceil(e.retry_after)}
+        except Exception as e:
+            print("ERROR answering batch question:", e)
+            return {"index": index, "status": "error", "answer": ERROR_ANSWER}
+    return {"index": index, "status": "fallback" if answer in FALLBACK_ANSWERS else "ok", "answer": answer}
+
+
+def batch_history(batch: List[Question], results: List[dict], user_id: Optional[int]) -> List[tuple]:
+    """
+    History rows for the answered questions, in batch order.
+    """
+    if user_id is None:
+        return []
+    rows = []
+    for result in sorted(results, key=lambda r: r["index"]):
+        if result["status"] in ("ok", "fallback", "emergency"):
+            rows.append((user_id, "user", batch[result["index"]].question))
+            rows.append((user_id, "assistant", result["answer"]))
+    return rows
+
+
+@app.post("/ask/batch")
+async def ask_health_questions(
+    batch: QuestionBatch,
+    request: Request,
+    stream: bool = False,
+    session_user: Optional[int] = Depends(session_user_id),
+):
+    """
+    Answers up to ASK_BATCH_MAX_QUESTIONS questions, ASK_BATCH_CONCURRENCY
+    at a time, with the same cache, emergency check and history as /ask.
+    Every question's user_id must match the session, as with /ask.
+
+    Questions are answered on their own, not in the user's conversation
+    thread: a thread runs one question at a time, which would serialize
+    the batch. They are still saved to the user's history, except those
+    left pending.
+
+    Returns {"results": [...]} in question order, each with "index",
+    "status" and "answer" (see answer_batch_item). With ?stream=true the
+    results are sent as NDJSON lines as each one finishes, in whatever
+    order that is. History rows of the whole batch are saved in one
+    transaction once every question has finished.
+    """
+    questions = batch.questions
+    if not questions:
+        return {"results": []}
+    if len(questions) > ASK_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {ASK_BATCH_MAX_QUESTIONS} questions per batch.")
+    user_id = None
+    for q in questions:
+        user_id = resolve_user(q.user_id, session_user)
+
+    # Emergencies are answered up front and are never rate limited.
+    results: List[dict] = []
+    to_ask = []
+    for index, q in enumerate(questions):
+        if is_emergency(q.question):
+            results.append({"index": index, "status": "emergency", "answer": EMERGENCY_ANSWER})
+        else:
+            to_ask.append(index)
+    if to_ask:
+        await enforce_limit(ask_batch_limiter, client_key(request, user_id), "ask_batch", len(to_ask))
+
+    slots = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    tasks = [
+        asyncio.ensure_future(answer_batch_item(index, questions[index].question, slots))
+        for index in to_ask
+    ]
+
+    if not stream:
+        results.extend(await asyncio.gather(*tasks))
+        await record_messages(batch_history(questions, results, user_id))
+        results.sort(key=lambda r: r["index"])
+        return {"results": results}
+
+    async def lines():
+        try:
+            for result in results:
+                yield json.dumps(result) + "\n"
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                results.append(result)
+                yield json.dumps(result) + "\n"
+        finally:
+            # A client that hangs up stops the questions not yet answered;
+            # the ones that were are still saved.
+            for task in tasks:
+                task.cancel()
+            with anyio.CancelScope(shield=True):
+                await record_messages(batch_history(questions, results, user_id))
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers={"X-Accel-Buffering": "no"})
+
+
+# ---------- Streaming Ask Endpoint (Server-Sent Events) ----------
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def answer_events(question: str, user_id: Optional[int], emergency: bool):
+    """
+    One answer as it is generated, as (event, data) pairs: "chunk"
+    ({"text"}), "error" ({"message"}) and a final "done" ({"answer"}).
+    Logged-in users' answers are saved every STREAM_CHECKPOINT_CHUNKS
+    chunks and when the generator finishes or is closed, so iterate it
+    under contextlib.aclosing() to save on disconnect too.
+    """
+    chunks = []
+    answer_id = None
+    saved_len = 0
+
+    async def checkpoint():
+        nonlocal answer_id, saved_len
+        text = "".join(chunks)
+        if user_id is None or not text or len(text) == saved_len:
+            return
+        if answer_id is None:
+            answer_id = await run_in_threadpool(
+                save_conversation, user_id, question, text
+            )
+        else:
+            await run_in_threadpool(update_message, answer_id, text)
+        saved_len = len(text)
+
+    try:
+        if emergency:
+            chunks.append(EMERGENCY_ANSWER)
+            yield "chunk", {"text": EMERGENCY_ANSWER}
+        elif (cached := await cached_answer(question)) is not None:
+            chunks.append(cached)
+            yield "chunk", {"text": cached}
+        elif (shared := await in_flight.join(normalize_question(question))) is not None:
+            # Someone is already asking this via /ask; reuse that run.
+            chunks.append(shared)
+            yield "chunk", {"text": shared}
+        else:
+            try:
+                async for text in stream_health_assistant(question, user_id):
+                    chunks.append(text)
+                    yield "chunk", {"text": text}
+                    if len(chunks) % STREAM_CHECKPOINT_CHUNKS == 0:
+                        await checkpoint()
+                if chunks and user_id is None:
+                    await run_in_threadpool(answer_cache.put, question, "".join(chunks))
+            except RateLimited:
+                if not chunks:
+                    chunks.append(BUSY_ANSWER)
+                yield "error", {"message": BUSY_ANSWER}
+            except CircuitOpen:
+                if not chunks:
+                    fallback = await run_in_threadpool(degraded_answer, question)
+                    chunks.append(fallback)
+                    yield "chunk", {"text": fallback}
+                else:
+                    yield "error", {"message": ERROR_ANSWER}
+            except Exception as e:
+                print("ERROR streaming assistant:", e)
+                if not chunks:
+                    chunks.append(ERROR_ANSWER)
+                yield "error", {"message": ERROR_ANSWER}
+
+        if not chunks:
+            chunks.append(NO_ANSWER)
+            yield "chunk", {"text": NO_ANSWER}
+        yield "done", {"answer": "".join(chunks)}
+    finally:
+        # Runs on normal completion and on client disconnect alike.
+        with anyio.CancelScope(shield=True):
+            await checkpoint()
+
+
+@app.post("/ask/stream")
+async def ask_health_question_stream(
+    q: Question,
+    request: Request,
+    session_user: Optional[int] = Depends(session_user_id),
+):
+    """
+    Same as /ask, but sends the answer as it is generated.
+    Events: "chunk" ({"text"}), "error" ({"message"}) and a final "done" ({"answer"}).
+    """
+    user_id = resolve_user(q.user_id, session_user)
+    emergency = is_emergency(q.question)
+    if not emergency:
+        await enforce_limit(ask_limiter, client_key(request, user_id), "ask")
+
+    async def events():
+        async with aclosing(answer_events(q.question, user_id, emergency)) as answer:
+            async for event, data in answer:
+                yield sse_event(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------- Chat WebSocket ----------
+# Close codes: 4401 the token is missing or expired (log in again), 1013
+# this process is at WS_MAX_CONNECTIONS, 1008 the client stopped reading,
+# 1003 a message that is not a JSON object, 1000 idle for WS_IDLE_TIMEOUT.
+WS_CLOSE_UNAUTHORIZED = 4401
+
+
+class ChatSockets:
+    """
+    Counts for /stats of the /ws/chat connections of this process.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.opened = 0
+        self.refused = 0
+        self.closed_idle = 0
+        self.closed_slow = 0
+        self.questions = 0
+
+    def stats(self) -> dict:
+        return dict(vars(self))
+
+
+chat_sockets = ChatSockets()
+
+
+class ChatSession:
+    """
+    What the server keeps for one /ws/chat connection while it is open.
+    The user's assistant thread id is already cached per process by
+    assistant.py, so it is not repeated here.
+    """
+
+    __slots__ = ("websocket", "user_id", "last_seen_id")
+
+    def __init__(self, websocket: WebSocket, user_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        # Newest history row the client has; None until it loads a page,
+        # so clients that never show history are not sent deltas.
+        self.last_seen_id: Optional[int] = None
+
+    async def send(self, message: dict):
+        # A client that stops reading fills the socket buffers and stalls
+        # this send; past WS_SEND_TIMEOUT it is dropped (asyncio.TimeoutError)
+        # rather than holding an assistant stream open for it.
+        await asyncio.wait_for(self.websocket.send_json(message), WS_SEND_TIMEOUT)
+
+    def _seen(self, rows: List[dict]):
+        self.last_seen_id = max(self.last_seen_id or 0, rows[-1]["id"] if rows else 0)
+
+    async def page(self, before_id: Optional[int], limit: int):
+        rows = await run_in_threadpool(load_history, self.user_id, before_id, None, limit)
+        if before_id is None:
+            self._seen(rows)
+        await self.send({"type": "page", "before_id": before_id, "messages": rows})
+
+    async def push_history(self):
+        if self.last_seen_id is None:
+            return
+        rows = await run_in_threadpool(load_history, self.user_id, None, self.last_seen_id, HISTORY_MAX_PAGE_SIZE)
+        self._seen(rows)
+        if rows:
+            await self.send({"type": "history", "messages": rows})
+
+    async def ask(self, question: str):
+        chat_sockets.questions += 1
+        emergency = is_emergency(question)
+        if not emergency:
+            wait = await ask_limiter.take(client_key(self.websocket, self.user_id))
+            if wait:
+                RATE_LIMITED.inc("ask")
+                await self.send({"type": "done", "answer": RATE_LIMIT_MESSAGES["ask"], "retry_after": math.ceil(wait)})
+                return
+        async with aclosing(answer_events(question, self.user_id, emergency)) as answer:
+            async for event, data in answer:
+                await self.send({"type": event, **data})
+        await self.push_history()
+
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """
+    A logged-in user's chat over one connection. Every message is a JSON
+    object with a "type".
+
+    The client first sends {"type": "auth", "token", "last_seen_id"} and
+    gets {"type": "ready"}; last_seen_id is the newest history row it
+    already shows, if any. Then, one at a time:
+      {"type": "ask", "question"}   -> "chunk", "error" and a final "done"
+                                       event as in /ask/stream, then a
+                                       "history" push of the rows saved
+      {"type": "page", "before_id", "limit"}
+                                    -> {"type": "page", "messages"}, as /history
+      {"type": "ping"}              -> {"type": "pong"}
+
+    "history" pushes ({"messages"}) carry the rows added since the newest
+    one the client was sent, so it never re-fetches what it has.
+    """
+    await websocket.accept()
+    if chat_sockets.open >= WS_MAX_CONNECTIONS:
+        chat_sockets.refused += 1
+        await websocket.close(code=1013)
+        return
+
+    # Counted from accept(), so sockets still waiting to authenticate hold
+    # a place under WS_MAX_CONNECTIONS too.
+    chat_sockets.open += 1
+    chat_sockets.opened += 1
+    try:
+        try:
+            hello = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+            token = hello.get("token") if isinstance(hello, dict) and hello.get("type") == "auth" else None
+        except (asyncio.TimeoutError, ValueError, KeyError):
+            token = None
+        user_id = verify_session_token(token) if isinstance(token, str) else None
+        if user_id is None:
+            await websocket.close(code=WS_CLOSE_UNAUTHORIZED)
+            return
+
+        session = ChatSession(websocket, user_id)
+        if isinstance(hello.get("last_seen_id"), int):
+            session.last_seen_id = hello["last_seen_id"]
+        await session.send({"type": "ready"})
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                chat_sockets.closed_idle += 1
+                await websocket.close(code=1000, reason="idle")
+                return
+            except (ValueError, KeyError):
+                await websocket.close(code=1003)
+                return
+            if not isinstance(message, dict):
+                await websocket.close(code=1003)
+                return
+
+            kind = message.get("type")
+            if kind == "ask":
+                question = message.get("question")
+                if isinstance(question, str) and question.strip():
+                    await session.ask(question)
+                else:
+                    await session.send({"type": "done", "answer": "Please type a question."})
+            elif kind == "page":
+                before_id = message.get("before_id")
+                limit = message.get("limit")
+                await session.page(
+                    before_id if isinstance(before_id, int) else None,
+                    min(max(limit, 1), HISTORY_MAX_PAGE_SIZE) if isinstance(limit, int) else HISTORY_PAGE_SIZE,
+                )
+            elif kind == "ping":
+                await session.send({"type": "pong"})
+    except asyncio.TimeoutError:
+        chat_sockets.closed_slow += 1
+        with anyio.CancelScope(shield=True):
+            try:
+                await asyncio.wait_for(websocket.close(code=1008), 1)
+            except Exception:
+                pass
+    except WebSocketDisconnect:
+        pass
+    finally:
+        chat_sockets.open -= 1
@@ -0,0 +1,323 @@
+"""
+Keeps the history database from growing without bound.
+
+One pass of run_maintenance():
+  1. retention: rows older than RETENTION_DAYS are deleted (after being
+     appended to a gzip NDJSON file in RETENTION_ARCHIVE_DIR, if set);
+  2. compression: assistant answers older than COMPRESS_AFTER_DAYS and
+     longer than COMPRESS_MIN_BYTES are stored as zlib BLOBs, read back
+     transparently by storage.decode_message();
+  3. incremental vacuum: free pages are returned to the filesystem.
+
+Steps 1 and 2 work through the table in id order, MAINTENANCE_BATCH_ROWS
+rows per write transaction, sleeping MAINTENANCE_PAUSE_MS between
+batches so the history writer is never locked out for long. They rely on
+ids growing with created_at (true for everything the app writes) and
+stop at the first batch with nothing old enough.
+"""
+import gzip
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from archive import to_ndjson
+from metrics import SQLITE_QUERY_SECONDS
+
+# ---------- Settings ----------
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", "0"))  # 0 keeps everything
+RETENTION_ARCHIVE_DIR = os.environ.get("RETENTION_ARCHIVE_DIR", "")
+COMPRESS_AFTER_DAYS = float(os.environ.get("COMPRESS_AFTER_DAYS", "0"))  # 0 disables
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+BATCH_ROWS = int(os.environ.get("MAINTENANCE_BATCH_ROWS", "250"))
+PAUSE = float(os.environ.get("MAINTENANCE_PAUSE_MS", "20")) / 1000
+VACUUM_PAGES = int(os.environ.get("MAINTENANCE_VACUUM_PAGES", "500"))  # per step
+INTERVAL = float(os.environ.get("MAINTENANCE_INTERVAL", "3600"))  # 0 disables the background job
+
+
+class Report:
+    """
+    What one maintenance pass did. Every field is a number, so the last
+    report can be published through /stats and /metrics.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self.rows_deleted = 0
+        self.rows_archived = 0
+        self.rows_compressed = 0
+        self.bytes_saved_by_compression = 0
+        self.batches = 0
+        self.batch_lock_ms_max = 0.0
+        self.batch_lock_ms_total = 0.0
+        self.pages_vacuumed = 0
+        self.free_pages_left = 0
+        self.file_bytes_before = 0
+        self.file_bytes_after = 0
+
+    def lock_held(self, seconds: float):
+        ms = seconds * 1000
+        self.batches += 1
+        self.batch_lock_ms_total += ms
+        self.batch_lock_ms_max = max(self.batch_lock_ms_max, ms)
+        SQLITE_QUERY_SECONDS.observe(seconds, "maintenance_batch")
+
+    def as_dict(self) -> dict:
+        data = dict(vars(self))
+        data["batch_lock_ms_avg"] = self.batch_lock_ms_total / self.batches if self.batches else 0.0
+        data["bytes_reclaimed"] = self.file_bytes_before - self.file_bytes_after
+        return {k: round(v, 3) if isinstance(v, float) else v for k, v in data.items()}
+
+
+def _file_bytes(pool) -> int:
+    with pool.connection() as conn:
+        (pages,) = conn.execute("PRAGMA page_count").fetchone()
+        (size,) = conn.execute("PRAGMA page_size").fetchone()
+    return pages * size
+
+
+def _old_rows_batches(
+    pool,
+    report: Report,
+    select_sql: str,
+    params: tuple,
+    days: float,
+    apply: Callable,
+    after_id: int = 0,
+    stop: Optional[threading.Event] = None,
+) -> int:
+    """
+    Walk the table in id order from after_id, BATCH_ROWS ids at a time.
+    select_sql gets (after_id, last_id, cutoff modifier, *params) and
+    returns the rows of that window that need work; apply(conn, rows) does
+    it in the same transaction. Stops after the window holding the first
+    row newer than the cutoff (or once stop is set), and returns the last
+    id handled: every row up to it has been dealt with.
+    """
+    modifier = f"-{days} days"
+    while True:
+        start = time.perf_counter()
+        with pool.connection() as conn:
+            first_id, last_id, first_new_id = conn.execute(
+                """
+                SELECT MIN(id), MAX(id), MIN(CASE WHEN created_at >= datetime('now', ?) THEN id END) FROM
+                (SELECT id, created_at FROM messages WHERE id > ? ORDER BY id LIMIT ?)
+                """,
+                (modifier, after_id, BATCH_ROWS),
+            ).fetchone()
+            if last_id is None or first_new_id == first_id:
+                return after_id
+            if first_new_id is not None:
+                last_id = first_new_id - 1
+            rows = conn.execute(select_sql, (after_id, last_id, modifier, *params)).fetchall()
+            if rows:
+                apply(conn, rows)
+        if rows:
+            report.lock_held(time.perf_counter() - start)
+        after_id = last_id
+        if first_new_id is not None or (stop is not None and stop.is_set()):
+            return after_id
+        time.sleep(PAUSE)
+
+
+def _marker(pool, name: str) -> int:
+    with pool.connection() as conn:
+        row = conn.execute("SELECT value FROM maintenance_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_marker(pool, name: str, value: int):
+    with pool.connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO maintenance_state (name, value) VALUES (?, ?)", (name, value))
+
+
+def _archive_path(archive_dir: str, now: float) -> str:
+    day = datetime.fromtimestamp(now, timezone.utc).strftime("%Y%m%d")
+    return os.path.join(archive_dir, f"messages-archive-{day}.ndjson.gz")
+
+
+def apply_retention(
+    pool,
+    report: Report,
+    days: float = RETENTION_DAYS,
+    archive_dir: str = RETENTION_ARCHIVE_DIR,
+    stop: Optional[threading.Event] = None,
+):
+    if days <= 0:
+        return
+    # Appending gzip members keeps each day's file readable as one stream.
+    path = _archive_path(archive_dir, report.started_at) if archive_dir else None
+
+    def delete(conn, rows):
+        if path is not None:
+            with gzip.open(path, "ab") as f:
+                for chunk in to_ndjson(rows):
+                    f.write(chunk)
+            report.rows_archived += len(rows)
+        conn.executemany("DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows])
+        report.rows_deleted += len(rows)
+
+    _old_rows_batches(
+        pool,
+        report,
+        """
+        SELECT id, user_id, role, message, created_at FROM messages
+        WHERE id > ? AND id <= ? AND created_at < datetime('now', ?)
+        ORDER BY id
+        """,
+        (),
+        days,
+        delete,
+        stop=stop,
+    )
+
+
+def compress_message(text: str) -> Optional[bytes]:
+    """
+    The zlib BLOB for text, or None if compressing would not pay.
+    """
+    blob = zlib.compress(text.encode(), 6)
+    return blob if len(blob) < len(text.encode()) * 0.9 else None
+
+
+def apply_compression(
+    pool,
+    report: Report,
+    days: float = COMPRESS_AFTER_DAYS,
+    min_bytes: int = COMPRESS_MIN_BYTES,
+    stop: Optional[threading.Event] = None,
+):
+    """
+    Each pass starts after the last id the previous one got through
+    ("compressed_through"), so rows already compressed (or too short) are
+    not read again. Lowering COMPRESS_MIN_BYTES therefore only affects
+    newer rows.
+    """
+    if days <= 0:
+        return
+
+    def compress(conn, rows):
+        updates: List[tuple] = []
+        for id_, message in rows:
+            blob = compress_message(message)
+            if blob is not None:
+                updates.append((blob, id_))
+                report.bytes_saved_by_compression += len(message.encode()) - len(blob)
+        conn.executemany("UPDATE messages SET message = ? WHERE id = ?", updates)
+        report.rows_compressed += len(updates)
+
+    done = _old_rows_batches(
+        pool,
+        report,
+        """
+        SELECT id, message FROM messages
+        WHERE id > ? AND id <= ? AND created_at < datetime('now', ?)
+          AND role = 'assistant' AND typeof(message) = 'text' AND length(CAST(message AS BLOB)) >= ?
+        """,
+        (min_bytes,),
+        days,
+        compress,
+        _marker(pool, "compressed_through"),
+        stop,
+    )
+    _set_marker(pool, "compressed_through", done)
+
+
+def incremental_vacuum(
+    pool, report: Report, pages_per_step: int = VACUUM_PAGES, stop: Optional[threading.Event] = None
+):
+    """
+    Hand free pages back in steps of pages_per_step, each its own short
+    write. Needs auto_vacuum = INCREMENTAL (see `manage.py vacuum`).
+    """
+    with pool.connection() as conn:
+        (mode,) = conn.execute("PRAGMA auto_vacuum").fetchone()
+    while True:
+        with pool.connection() as conn:
+            (free,) = conn.execute("PRAGMA freelist_count").fetchone()
+            if mode != 2 or free == 0 or (stop is not None and stop.is_set()):
+                report.free_pages_left = free
+                return
+            start = time.perf_counter()
+            # execute() would step the pragma once, freeing a single page;
+            # executescript() runs it to completion.
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages_per_step)})")
+            (left,) = conn.execute("PRAGMA freelist_count").fetchone()
+        report.lock_held(time.perf_counter() - start)
+        report.pages_vacuumed += free - left
+        time.sleep(PAUSE)
+
+
+def run_maintenance(
+    pool,
+    retention_days: float = RETENTION_DAYS,
+    archive_dir: str = RETENTION_ARCHIVE_DIR,
+    compress_after_days: float = COMPRESS_AFTER_DAYS,
+    stop: Optional[threading.Event] = None,
+) -> Report:
+    """
+    One pass. Setting stop ends it early, after the batch in progress;
+    the next pass picks up where it left off.
+    """
+    report = Report()
+    report.file_bytes_before = _file_bytes(pool)
+    apply_retention(pool, report, retention_days, archive_dir, stop)
+    apply_compression(pool, report, compress_after_days, stop=stop)
+    incremental_vacuum(pool, report, stop=stop)
+    report.file_bytes_after = _file_bytes(pool)
+    report.seconds = time.time() - report.started_at
+    return report
+
+
+class MaintenanceJob:
+    """
+    Runs run_maintenance() every `interval` seconds on a background
+    thread. With several workers, the `state` lock lets only one of them
+    run each pass; the others skip it.
+    """
+
+    def __init__(self, pool, state, interval: float = INTERVAL):
+        self.pool = pool
+        self.state = state
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+        self.runs = 0
+        self.failures = 0
+        self.last_report: dict = {}
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """
+        Stop, letting a pass in progress finish its current batch, so
+        nothing writes to the pool once this returns.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            if not self.state.add("maintenance_lock", "1", self.interval):
+                continue
+            try:
+                self.last_report = run_maintenance(self.pool, stop=self._stopping).as_dict()
+                self.runs += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"Maintenance pass failed: {e!r}")
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "failures": self.failures, **self.last_report}
@@ -0,0 +1,184 @@
+"""
+Maintenance commands, run against HEALTH_DB_PATH.
+
+    python manage.py init-db
+    python manage.py backfill-search [--batch-size 10000]
+    python manage.py export [--user-id N] [--output FILE] [--gzip]
+    python manage.py import FILE [--user-id N] [--keep-ids]
+    python manage.py maintenance [--retention-days D] [--archive-dir DIR] [--compress-after-days D]
+    python manage.py vacuum
+    python manage.py warm-faq [--questions FILE] [--mine ROWS --top N] [--concurrency N]
+
+Exports are NDJSON, one message per line in id order; a FILE ending in
+.gz is read or written gzip-compressed. Without --output the export goes
+to stdout.
+
+`maintenance` runs one pass of what the server's background job does
+(see maintenance.py) and prints its report as JSON; the options override
+RETENTION_DAYS, RETENTION_ARCHIVE_DIR and COMPRESS_AFTER_DAYS. `vacuum`
+rebuilds the whole file, locking out writers while it runs; it is only
+needed once, to switch a database created before incremental vacuum
+existed over to it.
+
+`warm-faq` answers the questions in FILE (one per line, # comments), plus
+with --mine the --top questions asked by the most users among the last
+ROWS messages, and swaps the answers into FAQ_STORE_PATH; running
+servers pick the new version up within FAQ_RELOAD_INTERVAL (see faq.py).
+Questions the emergency detector flags are left out.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+
+from archive import MessageImporter, export_ndjson
+from assistant import close_client
+from emergency import DEFAULT_PHRASES_PATH, load_detector
+from faq import CONCURRENCY as FAQ_CONCURRENCY, MIN_USERS as FAQ_MIN_USERS, STORE_PATH as FAQ_STORE_PATH
+from faq import build_store, frequent_questions, read_questions
+from maintenance import COMPRESS_AFTER_DAYS, RETENTION_ARCHIVE_DIR, RETENTION_DAYS, run_maintenance
+from search import BACKFILL_BATCH_SIZE, backfill_search_index
+from storage import DB_PATH, init_db, pool, schema_version
+
+
+def cmd_init_db(args):
+    init_db()
+    print(f"Schema up to date (version {schema_version()}):", DB_PATH)
+
+
+def cmd_backfill_search(args):
+    init_db()
+    start = time.perf_counter()
+
+    def progress(done, total, added):
+        print(f"\r{done}/{total} ids scanned, {added} rows indexed", end="", file=sys.stderr, flush=True)
+
+    added = backfill_search_index(args.batch_size, progress)
+    print(file=sys.stderr)
+    print(f"Indexed {added} messages in {time.perf_counter() - start:.1f}s")
+
+
+def cmd_export(args):
+    compress = args.gzip or (args.output or "").endswith(".gz")
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    start = time.perf_counter()
+    written = 0
+    try:
+        for chunk in export_ndjson(pool, args.user_id, compress):
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Exported {written} bytes in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+def cmd_import(args):
+    init_db()
+    opener = gzip.open if args.file.endswith(".gz") else open
+    importer = MessageImporter(pool, user_id=args.user_id, keep_ids=args.keep_ids)
+    start = time.perf_counter()
+    with opener(args.file, "rb") as f:
+        importer.feed(f)
+    importer.close()
+    stats = importer.stats()
+    print(
+        f"Imported {stats['imported']} messages ({stats['skipped']} already present) "
+        f"in {stats['transactions']} transactions, {time.perf_counter() - start:.1f}s"
+    )
+
+
+def cmd_maintenance(args):
+    init_db()
+    report = run_maintenance(pool, args.retention_days, args.archive_dir, args.compress_after_days)
+    print(json.dumps(report.as_dict(), indent=2))
+
+
+def cmd_vacuum(args):
+    init_db()
+    with pool.connection() as conn:
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+    print(f"Vacuumed {DB_PATH}: {before} -> {after} pages, incremental vacuum on")
+
+
+def cmd_warm_faq(args):
+    if not args.output:
+        sys.exit("FAQ_STORE_PATH is empty; pass --output.")
+    questions = read_questions(args.questions) if args.questions else []
+    if args.mine:
+        init_db()
+        questions += frequent_questions(pool, args.mine, args.top, args.min_users)
+    # The same detector /ask runs first; its answers never come from the store.
+    detector = load_detector(
+        os.environ.get("EMERGENCY_PHRASES_PATH", DEFAULT_PHRASES_PATH),
+        threshold=float(os.environ.get("EMERGENCY_THRESHOLD", "1.0")),
+    )
+    questions = [q for q in questions if detector.scan(q).score < detector.threshold]
+    if not questions:
+        sys.exit("No questions to answer; pass --questions FILE and/or --mine ROWS.")
+
+    def progress(done, total):
+        print(f"\r{done}/{total} questions answered", end="", file=sys.stderr, flush=True)
+
+    async def build():
+        try:
+            return await build_store(questions, args.output, args.concurrency, progress)
+        finally:
+            await close_client()
+
+    report = asyncio.run(build())
+    print(file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("init-db", help="create or update the schema").set_defaults(run=cmd_init_db)
+
+    backfill = commands.add_parser("backfill-search", help="add existing messages to the search index")
+    backfill.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    backfill.set_defaults(run=cmd_backfill_search)
+
+    export = commands.add_parser("export", help="write messages as NDJSON")
+    export.add_argument("--user-id", type=int, help="only this user's messages")
+    export.add_argument("--output", "-o", help="file to write (default: stdout)")
+    export.add_argument("--gzip", action="store_true", help="compress (implied by a .gz output)")
+    export.set_defaults(run=cmd_export)
+
+    load = commands.add_parser("import", help="load messages from an NDJSON export")
+    load.add_argument("file")
+    load.add_argument("--user-id", type=int, help="assign every message to this user")
+    load.add_argument("--keep-ids", action="store_true", help="keep message ids, skipping ones already present")
+    load.set_defaults(run=cmd_import)
+
+    maintain = commands.add_parser("maintenance", help="apply retention and compression, then vacuum")
+    maintain.add_argument("--retention-days", type=float, default=RETENTION_DAYS, help="0 keeps everything")
+    maintain.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR, help="keep deleted rows here as .ndjson.gz")
+    maintain.add_argument("--compress-after-days", type=float, default=COMPRESS_AFTER_DAYS, help="0 disables")
+    maintain.set_defaults(run=cmd_maintenance)
+
+    commands.add_parser("vacuum", help="rebuild the database file").set_defaults(run=cmd_vacuum)
+
+    warm = commands.add_parser("warm-faq", help="precompute answers to common questions")
+    warm.add_argument("--questions", help="file of curated questions, one per line")
+    warm.add_argument("--mine", type=int, default=0, help="also mine the last ROWS messages for common questions")
+    warm.add_argument("--top", type=int, default=200, help="most mined questions to keep")
+    warm.add_argument("--min-users", type=int, default=FAQ_MIN_USERS, help="distinct askers a mined question needs")
+    warm.add_argument("--concurrency", type=int, default=FAQ_CONCURRENCY)
+    warm.add_argument("--output", default=FAQ_STORE_PATH, help="store file to replace")
+    warm.set_defaults(run=cmd_warm_faq)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# ---------- Settings ----------
+# Request and upstream latencies (seconds).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# SQLite statements are mostly well under a millisecond.
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# ---------- Registry ----------
+class Registry:
+    """
+    Metrics rendered by /metrics, in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric"):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = registry):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+# ---------- Metric Types ----------
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}" for labels, v in items]
+
+
+class Gauge(_Metric):
+    """
+    A value read at scrape time. callback returns either a number or, for
+    labelled gauges, a {label tuple: number} dict.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, *args, callback: Callable[[], object], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}"
+            for labels, v in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """
+    Fixed buckets. Each label combination gets one preallocated list of
+    per-bucket counts (plus +Inf and the sum), so observe() is a bisect and
+    two additions.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # len(buckets) slots, then +Inf, then the running sum.
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+def timed(histogram: Histogram, *labels: str):
+    """
+    Decorator: observe how long each call of a (sync) function takes.
+    """
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+
+        return wrapper
+
+    return decorate
+
+
+# ---------- Application Metrics ----------
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the last response byte, by route template.",
+    ("method", "route", "status"),
+)
+ASSISTANT_STAGE_SECONDS = Histogram(
+    "assistant_stage_duration_seconds",
+    "Time spent in each stage of an assistant call.",
+    ("stage",),
+)
+ASSISTANT_CALLS = Counter(
+    "assistant_calls_total",
+    "Assistant calls started, by mode (ask or stream).",
+    ("mode",),
+)
+ASSISTANT_ERRORS = Counter(
+    "assistant_errors_total",
+    "Failed assistant calls, by exception type or run status.",
+    ("error",),
+)
+SQLITE_QUERY_SECONDS = Histogram(
+    "sqlite_query_duration_seconds",
+    "Time spent in SQLite, by query.",
+    ("query",),
+    buckets=QUERY_BUCKETS,
+)
+RATE_LIMITED = Counter(
+    "rate_limited_total",
+    "Requests refused with 429, by limit.",
+    ("limit",),
+)
+EMERGENCY_DETECTIONS = Counter(
+    "emergency_detections_total",
+    "Questions flagged as emergencies, by matched phrase category.",
+    ("category",),
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "assistant_circuit_transitions_total",
+    "Assistant circuit breaker state changes, by the state entered.",
+    ("state",),
+)
+UPSTREAM_RETRIES = Counter(
+    "assistant_upstream_retries_total",
+    "Assistants API calls retried after a transient error, by operation.",
+    ("op",),
+)
+UPSTREAM_HEDGES = Counter(
+    "assistant_upstream_hedges_total",
+    "Hedged Assistants API reads: sent, and won by the hedge.",
+    ("op", "outcome"),
+)
+DEGRADED_ANSWERS = Counter(
+    "assistant_degraded_answers_total",
+    "Questions answered while the circuit was open, by source (cache or fallback).",
+    ("source",),
+)
+
+
+# ---------- ASGI Middleware ----------
+class MetricsMiddleware:
+    """
+    Records HTTP_REQUEST_SECONDS for every HTTP request. Streaming
+    responses are timed until their last chunk is sent. Requests that
+    match no route are grouped under "unmatched" to keep the label set
+    bounded.
+    """
+
+    def __init__(self, app, histogram: Histogram = HTTP_REQUEST_SECONDS):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.histogram.observe(time.perf_counter() - start, scope["method"], route, str(status))
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimited(Exception):
+    """
+    Admission was refused; retry_after is a hint in seconds.
+    """
+
+    def __init__(self, retry_after: float, reason: str = "rate_limited"):
+        super().__init__(f"{reason}, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key: up to `burst` requests at once, refilled at
+    `rate` tokens per second. A rate of 0 disables the limiter.
+
+    Each key costs one [tokens, updated] pair in an OrderedDict kept in
+    last-use order. A bucket idle for burst / rate seconds is full again,
+    which is the same as not having one, so those are dropped from the
+    cold end as new requests arrive (amortised O(1)). max_keys caps
+    memory if that is not enough.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._idle_after = self.burst / rate if rate > 0 else float("inf")
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+
+    def acquire(self, key: str, cost: float = 1) -> float:
+        """
+        Take `cost` tokens from key's bucket. Returns 0 if allowed,
+        otherwise the seconds until enough tokens will be available.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets
+            # Room is only needed for a new key: a limiter with max_keys=1
+            # must keep its one bucket.
+            room = 0 if key in buckets else 1
+            while buckets:
+                oldest = next(iter(buckets.values()))
+                if now - oldest[1] < self._idle_after and len(buckets) + room <= self.max_keys:
+                    break
+                buckets.popitem(last=False)
+                self.evicted += 1
+
+            bucket = buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+                bucket = buckets[key] = [tokens, now]
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                buckets.move_to_end(key)
+            bucket[1] = now
+
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                self.allowed += 1
+                return 0.0
+            bucket[0] = tokens
+            self.limited += 1
+            return (cost - tokens) / self.rate
+
+    async def take(self, key: str, cost: float = 1) -> float:
+        """
+        acquire() for async callers, as SharedTokenBucketLimiter.take().
+        """
+        return self.acquire(key, cost)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "evicted": self.evicted,
+        }
+
+
+class SharedTokenBucketLimiter:
+    """
+    TokenBucketLimiter with its buckets in a shared_state store, so every
+    worker process draws on the same buckets: the rate and burst hold for
+    the whole deployment, whichever worker a client's requests land on.
+    Each bucket is one row that expires once the bucket is full again.
+    """
+
+    def __init__(self, state, name: str, rate: float, burst: float):
+        self.state = state
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+
+        self.allowed = 0
+        self.limited = 0
+
+    async def take(self, key: str, cost: float = 1) -> float:
+        """
+        Take `cost` tokens from key's bucket. Returns 0 if allowed,
+        otherwise the seconds until enough tokens will be available.
+        """
+        if self.rate <= 0:
+            return 0.0
+        wait = await self.state.run(self.state.take, f"bucket:{self.name}:{key}", cost, self.rate, self.burst)
+        if wait:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "limited": self.limited}
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` holders at a time. Up to `max_queue` more callers wait
+    (each for at most `max_wait` seconds); anyone beyond that is refused
+    straight away, so overload turns into fast rejections instead of an
+    ever-growing queue.
+    """
+
+    def __init__(self, limit: int, max_queue: int, max_wait: float, retry_after: float = 1.0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self._sem = asyncio.Semaphore(limit)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def acquire(self):
+        if not self._sem.locked():
+            # Free slot: take it without counting as a waiter.
+            await self._sem.acquire()
+            self.in_flight += 1
+            return
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RateLimited(self.retry_after, "queue_full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise RateLimited(self.retry_after, "queue_timeout") from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._sem.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
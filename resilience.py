@@ -0,0 +1,263 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from metrics import CIRCUIT_TRANSITIONS, UPSTREAM_HEDGES, UPSTREAM_RETRIES
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """
+    Upstream is considered down; the call was not attempted.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"circuit open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Errors worth retrying and counting against upstream health: timeouts,
+    connection problems, 429s and 5xx. Anything else (404, 400, auth) is
+    an answer from a healthy upstream.
+    """
+    # Imported here so importing this module does not load the SDK; by the
+    # time there is an error to classify, the client has loaded it.
+    import openai
+
+    return isinstance(
+        error,
+        (asyncio.TimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError),
+    )
+
+
+def _not_processed(error: BaseException) -> bool:
+    # Safe to resend a non-idempotent call only if upstream said it did not
+    # act on it.
+    import openai
+
+    return isinstance(error, openai.APIStatusError) and error.status_code in (429, 503)
+
+
+def _retry_after_header(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+# ---------- Circuit Breaker ----------
+class CircuitBreaker:
+    """
+    Opens when at least failure_ratio of the last `window` calls failed
+    (and at least min_calls were seen). While open, calls fail at once
+    with CircuitOpen; after open_seconds one trial call is let through
+    (half-open) and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(
+        self,
+        failure_ratio: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        open_seconds: float = 30,
+    ):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._results: deque = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def check(self):
+        """
+        Raise CircuitOpen while open; unlike allow(), takes no trial slot.
+        """
+        if self.state == OPEN:
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpen(remaining)
+
+    def allow(self):
+        """
+        Raise CircuitOpen unless a call may go ahead now.
+        """
+        if self.state == OPEN:
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpen(remaining)
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trial_running:
+                raise CircuitOpen(1.0)
+            self._trial_running = True
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self._transition(CLOSED)
+        elif self.state == CLOSED:
+            self._results.append(True)
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            self._transition(OPEN)
+        elif self.state == CLOSED:
+            self._results.append(False)
+            calls = len(self._results)
+            failures = calls - sum(self._results)
+            if calls >= self.min_calls and failures >= self.failure_ratio * calls:
+                self._transition(OPEN)
+
+    def abandon(self):
+        """
+        The allowed call was cancelled before it produced an outcome.
+        """
+        self._trial_running = False
+
+    def _transition(self, state: str):
+        self.state = state
+        self._results.clear()
+        self._trial_running = False
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        CIRCUIT_TRANSITIONS.inc(state)
+        print("Assistant circuit breaker is now", state)
+
+
+# ---------- Hedging ----------
+class LatencyTracker:
+    """
+    Recent latencies of one kind of call, for a hedging threshold.
+    The quantile is recomputed every `refresh` observations.
+    """
+
+    def __init__(self, size: int = 200, quantile: float = 0.95, min_samples: int = 20, refresh: int = 16):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self._samples: deque = deque(maxlen=size)
+        self._since_refresh = 0
+        self._threshold: Optional[float] = None
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+        self._since_refresh += 1
+        if self._since_refresh >= self.refresh and len(self._samples) >= self.min_samples:
+            ordered = sorted(self._samples)
+            self._threshold = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+            self._since_refresh = 0
+
+    def threshold(self) -> Optional[float]:
+        return self._threshold
+
+
+async def hedged(op: str, make_call: Callable[[], Awaitable], delay: float):
+    """
+    Start make_call(); if it has not finished after `delay` seconds, start
+    a second copy and return whichever succeeds first. Only for calls that
+    are safe to send twice.
+    """
+    first = asyncio.ensure_future(make_call())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    UPSTREAM_HEDGES.inc(op, "sent")
+    second = asyncio.ensure_future(make_call())
+    tasks = {first, second}
+    try:
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        UPSTREAM_HEDGES.inc(op, "won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in (first, second):
+            if not task.done():
+                task.cancel()
+
+
+# ---------- Upstream Calls ----------
+class Upstream:
+    """
+    Every Assistants API call goes through call(): the circuit breaker,
+    per-attempt timeouts, jittered exponential backoff for transient
+    errors, and (for idempotent reads, when enabled) hedging at the
+    call's recent latency quantile.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        hedge_quantile: float = 0.0,
+    ):
+        self.breaker = breaker
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_quantile = hedge_quantile
+        self._latency: Dict[str, LatencyTracker] = {}
+
+    async def call(self, op: str, make_call: Callable[[], Awaitable], timeout: float, idempotent: bool = False):
+        self.breaker.allow()
+        try:
+            result = await self._with_retries(op, make_call, timeout, idempotent)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except Exception as e:
+            # Non-transient errors (404, 400...) still mean upstream answered.
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _with_retries(self, op, make_call, timeout, idempotent):
+        retryable = is_transient if idempotent else _not_processed
+        for attempt in range(self.attempts):
+            try:
+                return await self._attempt(op, make_call, timeout, idempotent)
+            except Exception as e:
+                if attempt == self.attempts - 1 or not retryable(e):
+                    raise
+                UPSTREAM_RETRIES.inc(op)
+                # Full jitter, but never sooner than upstream asked us to wait.
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                hinted = _retry_after_header(e)
+                if hinted is not None:
+                    delay = max(delay, min(hinted, self.max_delay))
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, op, make_call, timeout, idempotent):
+        tracker = self._latency.get(op)
+        if tracker is None:
+            tracker = self._latency[op] = LatencyTracker(quantile=self.hedge_quantile or 0.95)
+
+        start = time.perf_counter()
+        hedge_after = tracker.threshold() if idempotent and self.hedge_quantile > 0 else None
+        if hedge_after is not None and hedge_after < timeout:
+            result = await asyncio.wait_for(hedged(op, make_call, hedge_after), timeout)
+        else:
+            result = await asyncio.wait_for(make_call(), timeout)
+        tracker.observe(time.perf_counter() - start)
+        return result
@@ -0,0 +1,133 @@
+import html
+import os
+import re
+from typing import List, Optional
+
+from metrics import SQLITE_QUERY_SECONDS, timed
+from storage import SEARCH_ROWID_SHIFT, decode_message, pool, search_rowid
+
+# ---------- Settings ----------
+# Words of context around the matches in each result.
+SNIPPET_TOKENS = int(os.environ.get("SEARCH_SNIPPET_TOKENS", "24"))
+# Longer queries are cut to their first N words.
+MAX_QUERY_TERMS = int(os.environ.get("SEARCH_MAX_QUERY_TERMS", "12"))
+BACKFILL_BATCH_SIZE = int(os.environ.get("SEARCH_BACKFILL_BATCH_SIZE", "10000"))
+
+# snippet() marks matches with these, and they are turned into <mark> tags
+# after the rest of the text is HTML-escaped.
+_OPEN, _CLOSE = "\ue000", "\ue001"
+_WORD = re.compile(r"\w+")
+
+# Words in nearly every message. bm25() reads a term's whole doclist (all
+# users) to weigh it, so these would cost the most while ranking nothing;
+# they are dropped from queries that have other words.
+STOPWORDS = frozenset(
+    """
+    a about am an and are as at be been but by can could did do does for from had has have how i if in
+    is it its me my no not of on or so than that the their them then there these they this to too us
+    was we were what when where which who why will with would you your
+    """.split()
+)
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    An FTS5 query for rows containing every word of `query` (bar
+    stopwords). User input never reaches FTS5 syntax: words are extracted
+    and quoted. Returns None when the query has no words.
+    """
+    words = _WORD.findall(query.lower())
+    words = [w for w in words if w not in STOPWORDS] or words
+    words = words[:MAX_QUERY_TERMS]
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+@timed(SQLITE_QUERY_SECONDS, "history_search")
+def search_history(user_id: int, query: str, limit: int, offset: int = 0) -> List[dict]:
+    """
+    The user's messages matching `query`, best match first (BM25 over the
+    message text), with an HTML snippet around the matches.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+
+    # The rowid range limits FTS5 to this user's part of each doclist, and
+    # the ranked page is picked inside FTS5 first, so snippets are built
+    # and messages rows read only for the rows returned.
+    with pool.connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT m.id, m.role, m.created_at, hits.snippet
+            FROM (
+                SELECT rowid, rank, snippet(messages_fts, 0, ?, ?, '…', ?) AS snippet
+                FROM messages_fts
+                WHERE messages_fts MATCH ? AND rowid BETWEEN ? AND ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            ) AS hits
+            JOIN messages m ON m.id = hits.rowid & ?
+            ORDER BY hits.rank
+            """,
+            (
+                _OPEN,
+                _CLOSE,
+                SNIPPET_TOKENS,
+                expression,
+                search_rowid(user_id, 0),
+                search_rowid(user_id + 1, 0) - 1,
+                limit,
+                offset,
+                (1 << SEARCH_ROWID_SHIFT) - 1,
+            ),
+        ).fetchall()
+
+    return [
+        {"id": id_, "role": role, "created_at": created_at, "snippet": _highlight(snippet)}
+        for (id_, role, created_at, snippet) in rows
+    ]
+
+
+# ---------- Backfill ----------
+def backfill_search_index(batch_size: int = BACKFILL_BATCH_SIZE, progress=None) -> int:
+    """
+    Index messages saved before messages_fts existed. Works through the
+    table in id ranges, one short transaction each, skipping rows that
+    are already indexed, so it can run against a live database and be
+    interrupted and rerun. Returns the number of rows added.
+    """
+    with pool.connection() as conn:
+        (top,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()
+
+    added = 0
+    for start in range(0, top, batch_size):
+        with pool.connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT (user_id << ?) | id, message
+                FROM messages AS m
+                WHERE id > ? AND id <= ?
+                  AND NOT EXISTS (SELECT 1 FROM messages_fts WHERE rowid = (m.user_id << ?) | m.id)
+                """,
+                (SEARCH_ROWID_SHIFT, start, start + batch_size, SEARCH_ROWID_SHIFT),
+            ).fetchall()
+            conn.executemany(
+                "INSERT INTO messages_fts (rowid, message) VALUES (?, ?)",
+                [(rowid, decode_message(message)) for rowid, message in rows],
+            )
+            added += len(rows)
+        if progress is not None:
+            progress(min(start + batch_size, top), top, added)
+
+    if added:
+        # Merge the index segments written batch by batch, so queries
+        # read one b-tree instead of many.
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+    return added
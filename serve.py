@@ -0,0 +1,60 @@
+"""
+Production entry point: migrate the database once, then serve main:app
+from several uvicorn worker processes.
+
+    python serve.py
+
+Settings (environment):
+  PORT               listen port (default 8000)
+  HOST               listen address (default 0.0.0.0)
+  WEB_CONCURRENCY    worker processes (default: one per CPU core)
+  WS_PER_MESSAGE_DEFLATE  compress /ws/chat frames (default 0: each
+                     idle socket then holds ~46 KB instead of ~81 KB)
+
+With more than one worker, state that must agree across processes moves
+out of process memory: SHARED_STATE_PATH (pending runs, run/record
+claims, rate limit buckets, the upstream run budget) and ANSWER_CACHE_DB default to a shared SQLite file next to
+HEALTH_DB_PATH, and a SESSION_SECRET is generated for this launch if
+none is set, so a token issued by one worker is accepted by the others.
+Set SESSION_SECRET explicitly to keep sessions valid across restarts.
+"""
+import os
+import secrets
+
+import uvicorn
+
+from storage import DB_PATH, init_db
+
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8000"))
+WS_PER_MESSAGE_DEFLATE = os.environ.get("WS_PER_MESSAGE_DEFLATE", "0") == "1"
+
+
+def main():
+    init_db()
+    # Workers inherit this environment; the schema is already up to date,
+    # and the assistant concurrency cap is split WEB_CONCURRENCY ways.
+    os.environ["RUN_MIGRATIONS"] = "0"
+    os.environ["WEB_CONCURRENCY"] = str(WORKERS)
+
+    if WORKERS > 1:
+        shared_path = os.path.splitext(DB_PATH)[0] + "_shared.db"
+        os.environ.setdefault("SHARED_STATE_PATH", shared_path)
+        os.environ.setdefault("ANSWER_CACHE_DB", shared_path)
+        os.environ.setdefault("SESSION_SECRET", secrets.token_hex(32))
+
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WORKERS,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+        log_level=os.environ.get("LOG_LEVEL", "info"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from storage import ConnectionPool
+
+# ---------- Settings ----------
+# Set (serve.py does this when starting several workers) to share state
+# between processes through this SQLite file. Unset, state stays in-process.
+SHARED_STATE_PATH = os.environ.get("SHARED_STATE_PATH") or None
+
+
+def _take_tokens(full_at: float, now: float, cost: float, rate: float, burst: float) -> Tuple[Optional[float], float]:
+    """
+    Token bucket as one number (GCRA): the time the bucket will be full
+    again. Returns (new full_at, 0) when cost tokens are taken, otherwise
+    (None, seconds until they will be there).
+    """
+    full_at = max(full_at, now)
+    missing = (full_at - now) * rate + cost - burst
+    if missing > 0:
+        return None, missing / rate
+    return full_at + cost / rate, 0.0
+
+
+class LocalState:
+    """
+    In-process key/value store with per-key TTLs and counters. Same API as
+    SharedState, for single-process deployments.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        """
+        Call one of this store's methods from async code.
+        """
+        return fn(*args)
+
+    def _live(self, key: str, now: float) -> Optional[Tuple[str, Optional[float]]]:
+        item = self._values.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._values[key]
+            return None
+        return item
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._live(key, time.time())
+            return item[0] if item else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """
+        Set key only if it is absent (or expired). True if this call set it.
+        """
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._values[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key: str, amount: float = 1, ttl: Optional[float] = None) -> float:
+        """
+        Add amount to a counter and return the new value. ttl applies when
+        the counter is created, so it can serve as a fixed window.
+        """
+        now = time.time()
+        with self._lock:
+            item = self._live(key, now)
+            if item is None:
+                value, expires = float(amount), (now + ttl if ttl else None)
+            else:
+                value, expires = float(item[0]) + amount, item[1]
+            self._values[key] = (str(value), expires)
+            return value
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        """
+        Take cost tokens from key's bucket (refilled at rate per second, up
+        to burst). Returns 0, or the seconds until cost tokens will be
+        available (nothing is taken then). A full bucket's key expires.
+        """
+        now = time.time()
+        with self._lock:
+            item = self._live(key, now)
+            full_at, wait = _take_tokens(float(item[0]) if item else now, now, cost, rate, burst)
+            if full_at is not None:
+                self._values[key] = (str(full_at), full_at)
+            return wait
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, exp) in self._values.items() if exp is not None and exp <= now]
+            for key in expired:
+                del self._values[key]
+        return len(expired)
+
+
+class SharedState(LocalState):
+    """
+    The same store in a SQLite file, so every worker process on the host
+    sees the same values. Each call is one short transaction; WAL lets
+    readers proceed while another worker writes.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.pool = ConnectionPool(path, size=pool_size)
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        # SQLite calls can wait on another worker's write; keep them off
+        # the event loop.
+        return await asyncio.to_thread(fn, *args)
+
+    def _connection(self):
+        if not self._schema_ready:
+            with self._schema_lock, self.pool.connection() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS shared_state (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        expires_at REAL
+                    ) WITHOUT ROWID;
+                    """
+                )
+                self._schema_ready = True
+        return self.pool.connection()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl if ttl else None),
+            )
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM shared_state WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None),
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: float = 1, ttl: Optional[float] = None) -> float:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM shared_state WHERE key = ? AND expires_at <= ?", (key, now))
+            row = conn.execute(
+                """
+                INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = CAST(value AS REAL) + excluded.value
+                RETURNING value
+                """,
+                (key, amount, now + ttl if ttl else None),
+            ).fetchone()
+        return float(row[0])
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> float:
+        now = time.time()
+        with self._connection() as conn:
+            # Read and update under the write lock, so two workers cannot
+            # both spend the same tokens.
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT value FROM shared_state WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            full_at, wait = _take_tokens(float(row[0]) if row else now, now, cost, rate, burst)
+            if full_at is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, str(full_at), full_at),
+                )
+            return wait
+
+    def purge_expired(self) -> int:
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+shared_state = SharedState(SHARED_STATE_PATH) if SHARED_STATE_PATH else LocalState()
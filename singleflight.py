@@ -0,0 +1,90 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one upstream call.
+
+    The first caller for a key (the leader) starts the call as its own task,
+    so a leader that disconnects does not cancel it for everyone else.
+    Followers wait up to max_wait seconds for the leader's result; if the
+    wait times out, the leader raises, or is_failure() rejects the result,
+    they fall back to making their own call. Exceptions listed in
+    share_errors are re-raised to do() followers instead.
+    """
+
+    def __init__(
+        self,
+        max_wait: float = 60,
+        is_failure: Callable[[Any], bool] = lambda result: False,
+        share_errors: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.max_wait = max_wait
+        self.is_failure = is_failure
+        self.share_errors = share_errors
+        self._calls: Dict[str, asyncio.Task] = {}
+
+        self.leaders = 0
+        self.shared = 0
+        self.fallbacks = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if key in self._calls:
+            result = await self._wait(key)
+            if result is not None:
+                return result
+            self.fallbacks += 1
+            return await fn()
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        self.leaders += 1
+        return await asyncio.shield(task)
+
+    async def join(self, key: str) -> Optional[Any]:
+        """
+        Wait for an in-flight call for key. Returns None when there is none
+        or it did not produce a usable result in time.
+        """
+        try:
+            return await self._wait(key)
+        except self.share_errors:
+            return None
+
+    async def _wait(self, key: str) -> Optional[Any]:
+        task = self._calls.get(key)
+        if task is None:
+            return None
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.max_wait)
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except self.share_errors:
+            self.shared += 1
+            raise
+        except Exception:
+            return None
+
+        if self.is_failure(result):
+            return None
+        self.shared += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "fallbacks": self.fallbacks,
+        }
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
@@ -0,0 +1,500 @@
+const authLoggedOut = document.getElementById('auth-logged-out');
+const authLoggedIn = document.getElementById('auth-logged-in');
+const authMsg = document.getElementById('authMessage');
+const currentUserLabel = document.getElementById('currentUserLabel');
+const historyBox = document.getElementById('historyBox');
+const HISTORY_PAGE_SIZE = 50;
+
+function getCurrentUser() {
+    const userId = localStorage.getItem('health_user_id');
+    const username = localStorage.getItem('health_username');
+    const token = localStorage.getItem('health_token');
+    if (userId && username && token) {
+        return { userId: parseInt(userId), username, token };
+    }
+    return null;
+}
+
+function setCurrentUser(userId, username, token) {
+    localStorage.setItem('health_user_id', String(userId));
+    localStorage.setItem('health_username', username);
+    localStorage.setItem('health_token', token);
+    closeChat();
+    historyLoaded = false;
+    updateAuthUI();
+}
+
+function clearCurrentUser() {
+    localStorage.removeItem('health_user_id');
+    localStorage.removeItem('health_username');
+    localStorage.removeItem('health_token');
+    closeChat();
+    historyLoaded = false;
+    updateAuthUI();
+}
+
+// Requests act for the logged-in user through their session token.
+function authHeaders(headers = {}) {
+    const user = getCurrentUser();
+    return user ? { ...headers, 'Authorization': 'Bearer ' + user.token } : headers;
+}
+
+// An expired or invalid session: log out locally so the user can log in again.
+function handleUnauthorized(res) {
+    if (res.status !== 401) return false;
+    clearCurrentUser();
+    showAuthMessage("Your session has expired. Please log in again.");
+    return true;
+}
+
+function updateAuthUI() {
+    const user = getCurrentUser();
+    authMsg.textContent = '';
+    if (user) {
+        authLoggedOut.style.display = 'flex';
+        authLoggedOut.style.visibility = 'hidden';
+        authLoggedOut.style.position = 'absolute';
+        authLoggedIn.style.display = 'flex';
+        currentUserLabel.textContent = user.username;
+    } else {
+        authLoggedOut.style.display = 'flex';
+        authLoggedOut.style.visibility = 'visible';
+        authLoggedOut.style.position = 'static';
+        authLoggedIn.style.display = 'none';
+        currentUserLabel.textContent = '';
+        historyBox.innerHTML = '<em>History will appear here after you log in and click "Load history".</em>';
+    }
+}
+
+function showAuthMessage(text) {
+    authMsg.textContent = text;
+}
+
+async function signup() {
+    const username = document.getElementById('authUsername').value.trim();
+    const password = document.getElementById('authPassword').value;
+
+    if (!username || !password) {
+        showAuthMessage("Please enter username and password.");
+        return;
+    }
+
+    try {
+        const res = await fetch('/signup', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username, password })
+        });
+        const data = await res.json();
+        showAuthMessage(data.message || data.detail || '');
+        if (data.success) {
+            setCurrentUser(data.user_id, data.username, data.token);
+        }
+    } catch (err) {
+        console.error(err);
+        showAuthMessage("Error during signup.");
+    }
+}
+
+async function login() {
+    const username = document.getElementById('authUsername').value.trim();
+    const password = document.getElementById('authPassword').value;
+
+    if (!username || !password) {
+        showAuthMessage("Please enter username and password.");
+        return;
+    }
+
+    try {
+        const res = await fetch('/login', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username, password })
+        });
+        const data = await res.json();
+        showAuthMessage(data.message || data.detail || '');
+        if (data.success) {
+            setCurrentUser(data.user_id, data.username, data.token);
+        }
+    } catch (err) {
+        console.error(err);
+        showAuthMessage("Error during login.");
+    }
+}
+
+function logout() {
+    clearCurrentUser();
+    showAuthMessage("Logged out.");
+}
+
+// Keyset cursors for the history panel: the oldest id shown (for
+// paging back on scroll) and the newest id shown (for deltas).
+let historyOldestId = null;
+let historyNewestId = null;
+let historyHasMore = false;
+let historyLoading = false;
+let historyLoaded = false;
+
+function renderHistoryEntry(entry) {
+    const div = document.createElement('div');
+    div.className = 'history-entry';
+    const who = entry.role === 'user' ? 'You' : 'Assistant';
+    const label = document.createElement('strong');
+    label.textContent = who + ":";
+    div.appendChild(label);
+    div.appendChild(document.createTextNode(" " + entry.message));
+    return div;
+}
+
+async function fetchHistory(params) {
+    const socket = await connectChat();
+    if (socket) {
+        try {
+            return await requestPage(socket, params);
+        } catch (err) {
+            console.error(err);  // socket closed; fall back to HTTP
+        }
+    }
+    const query = new URLSearchParams(params);
+    const res = await fetch('/history?' + query.toString(), { headers: authHeaders() });
+    if (handleUnauthorized(res)) throw new Error("Not logged in");
+    return await res.json();
+}
+
+async function loadHistory() {
+    const user = getCurrentUser();
+    if (!user) {
+        showAuthMessage("You must be logged in to load history.");
+        return;
+    }
+
+    try {
+        const data = await fetchHistory({ limit: HISTORY_PAGE_SIZE });
+
+        historyBox.innerHTML = "";
+        historyOldestId = null;
+        historyNewestId = null;
+        historyHasMore = false;
+        historyLoaded = true;
+        if (!data || data.length === 0) {
+            historyBox.innerHTML = "<em>No saved history yet. Ask a question and I'll start saving your chats.</em>";
+            return;
+        }
+
+        for (const entry of data) {
+            historyBox.appendChild(renderHistoryEntry(entry));
+        }
+        historyOldestId = data[0].id;
+        historyNewestId = data[data.length - 1].id;
+        historyHasMore = data.length === HISTORY_PAGE_SIZE;
+        historyBox.scrollTop = historyBox.scrollHeight;
+    } catch (err) {
+        console.error(err);
+        if (getCurrentUser()) {
+            showAuthMessage("Error loading history.");
+        }
+    }
+}
+
+// Page older entries in lazily when the user scrolls to the top.
+async function loadOlderHistory() {
+    if (!historyHasMore || historyLoading || historyOldestId === null || !getCurrentUser()) {
+        return;
+    }
+    historyLoading = true;
+    try {
+        const data = await fetchHistory({ before_id: historyOldestId, limit: HISTORY_PAGE_SIZE });
+        const previousHeight = historyBox.scrollHeight;
+        const first = historyBox.firstChild;
+        for (const entry of data) {
+            historyBox.insertBefore(renderHistoryEntry(entry), first);
+        }
+        if (data.length > 0) {
+            historyOldestId = data[0].id;
+        }
+        historyHasMore = data.length === HISTORY_PAGE_SIZE;
+        historyBox.scrollTop += historyBox.scrollHeight - previousHeight;
+    } catch (err) {
+        console.error(err);
+    } finally {
+        historyLoading = false;
+    }
+}
+
+function appendHistory(data) {
+    if (data.length === 0) return;
+    if (historyNewestId === null) {
+        historyBox.innerHTML = "";  // drop the "no saved history" note
+        historyOldestId = data[0].id;
+    }
+    for (const entry of data) {
+        historyBox.appendChild(renderHistoryEntry(entry));
+    }
+    historyNewestId = data[data.length - 1].id;
+    historyBox.scrollTop = historyBox.scrollHeight;
+}
+
+// Pull only the rows added since the newest one on screen.
+async function refreshHistory() {
+    if (historyNewestId === null || !getCurrentUser()) {
+        return;
+    }
+    try {
+        const query = new URLSearchParams({ after_id: historyNewestId, limit: HISTORY_PAGE_SIZE });
+        const res = await fetch('/history?' + query.toString(), { headers: authHeaders() });
+        if (handleUnauthorized(res)) return;
+        appendHistory(await res.json());
+    } catch (err) {
+        console.error(err);
+    }
+}
+
+// ---------- Chat socket ----------
+// Logged-in users keep one WebSocket to /ws/chat: questions, answers
+// and history pages go over it, and the server pushes new history rows
+// after each answer. If it cannot be opened (or drops before an answer
+// starts), the page falls back to the HTTP endpoints.
+let chatSocket = null;         // open and authenticated
+let chatConnecting = null;     // Promise while connecting
+let chatAnswer = null;         // the question in flight: { answerDiv, started, resolve }
+const pageRequests = [];       // { resolve, reject } per "page" request, in order
+
+function connectChat() {
+    const user = getCurrentUser();
+    if (!user || !('WebSocket' in window)) return Promise.resolve(null);
+    if (chatSocket) return Promise.resolve(chatSocket);
+    if (chatConnecting) return chatConnecting;
+
+    chatConnecting = new Promise(resolve => {
+        const scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+        let socket;
+        try {
+            socket = new WebSocket(scheme + location.host + '/ws/chat');
+        } catch (err) {
+            console.error(err);
+            resolve(null);
+            return;
+        }
+        socket.onopen = () => {
+            socket.send(JSON.stringify({
+                type: 'auth',
+                token: user.token,
+                last_seen_id: historyLoaded ? (historyNewestId ?? 0) : null
+            }));
+        };
+        socket.onmessage = (msg) => {
+            const data = JSON.parse(msg.data);
+            if (data.type === 'ready') {
+                chatSocket = socket;
+                resolve(socket);
+            } else {
+                handleChatMessage(data);
+            }
+        };
+        socket.onclose = (event) => {
+            if (chatSocket === socket) chatSocket = null;
+            resolve(null);
+            for (const request of pageRequests.splice(0)) {
+                request.reject(new Error("Chat socket closed"));
+            }
+            if (chatAnswer) {
+                // Started answers are not asked again over HTTP.
+                if (chatAnswer.started) {
+                    chatAnswer.answerDiv.textContent += "\n\n[Connection lost before the answer finished.]";
+                }
+                chatAnswer.resolve(chatAnswer.started);
+                chatAnswer = null;
+            }
+            if (event.code === 4401 && getCurrentUser()) {
+                clearCurrentUser();
+                showAuthMessage("Your session has expired. Please log in again.");
+            }
+        };
+    }).finally(() => {
+        chatConnecting = null;
+    });
+    return chatConnecting;
+}
+
+function closeChat() {
+    if (chatSocket) {
+        chatSocket.close();
+        chatSocket = null;
+    }
+}
+
+function handleChatMessage(data) {
+    if (data.type === 'page') {
+        const request = pageRequests.shift();
+        if (request) request.resolve(data.messages);
+    } else if (data.type === 'history') {
+        if (historyLoaded) appendHistory(data.messages);
+    } else if (chatAnswer && data.type === 'chunk') {
+        if (!chatAnswer.started) {
+            chatAnswer.answerDiv.textContent = "";
+            chatAnswer.started = true;
+        }
+        chatAnswer.answerDiv.textContent += data.text;
+    } else if (chatAnswer && data.type === 'error') {
+        if (!chatAnswer.started) {
+            chatAnswer.answerDiv.textContent = data.message;
+            chatAnswer.started = true;
+        }
+    } else if (chatAnswer && data.type === 'done') {
+        chatAnswer.answerDiv.textContent = data.answer;
+        chatAnswer.resolve(true);
+        chatAnswer = null;
+    }
+}
+
+function requestPage(socket, params) {
+    return new Promise((resolve, reject) => {
+        pageRequests.push({ resolve, reject });
+        socket.send(JSON.stringify({ type: 'page', ...params }));
+    });
+}
+
+// Resolves true once the answer is shown, false if the socket closed
+// before any of it arrived.
+function askOverSocket(socket, question, answerDiv) {
+    return new Promise(resolve => {
+        chatAnswer = { answerDiv, started: false, resolve };
+        socket.send(JSON.stringify({ type: 'ask', question }));
+    });
+}
+
+historyBox.addEventListener('scroll', () => {
+    if (historyBox.scrollTop < 40) {
+        loadOlderHistory();
+    }
+});
+
+async function ask() {
+    const questionEl = document.getElementById('question');
+    const answerDiv = document.getElementById('answer');
+    const text = questionEl.value.trim();
+
+    if (!text) {
+        answerDiv.textContent = "Please type a question.";
+        return;
+    }
+
+    answerDiv.textContent = "Thinking...";
+    const body = { question: text };
+
+    const loggedIn = getCurrentUser() !== null;
+    const socket = chatAnswer ? null : await connectChat();
+    if (loggedIn && !getCurrentUser()) {
+        answerDiv.textContent = "Please log in again to keep your history.";
+        return;
+    }
+    if (socket && await askOverSocket(socket, text, answerDiv)) {
+        return;  // new history rows are pushed over the socket
+    }
+
+    let res;
+    try {
+        res = await fetch('/ask/stream', {
+            method: 'POST',
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify(body)
+        });
+    } catch (err) {
+        console.error(err);
+    }
+    if (res && handleUnauthorized(res)) {
+        answerDiv.textContent = "Please log in again to keep your history.";
+        return;
+    }
+    if (res && res.status === 429) {
+        // Rate limited: retrying without streaming would only be refused too.
+        const data = await res.json();
+        answerDiv.textContent = data.detail;
+        return;
+    }
+    if (!res || !res.ok || !res.body) {
+        await askWithoutStreaming(body, answerDiv);
+    } else {
+        try {
+            await readAnswerStream(res.body, answerDiv);
+        } catch (err) {
+            console.error(err);
+            answerDiv.textContent += "\n\n[Connection lost before the answer finished.]";
+        }
+    }
+
+    await refreshHistory();
+}
+
+// Render Server-Sent Events from /ask/stream as they arrive.
+async function readAnswerStream(stream, answerDiv) {
+    const reader = stream.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let started = false;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) !== -1) {
+            const raw = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+
+            let event = "message";
+            let data = "";
+            for (const line of raw.split("\n")) {
+                if (line.startsWith("event: ")) event = line.slice(7);
+                else if (line.startsWith("data: ")) data += line.slice(6);
+            }
+            if (!data) continue;
+            const payload = JSON.parse(data);
+
+            if (event === "chunk") {
+                if (!started) {
+                    answerDiv.textContent = "";
+                    started = true;
+                }
+                answerDiv.textContent += payload.text;
+            } else if (event === "error" && !started) {
+                answerDiv.textContent = payload.message;
+                started = true;
+            } else if (event === "done") {
+                answerDiv.textContent = payload.answer;
+            }
+        }
+    }
+}
+
+async function askWithoutStreaming(body, answerDiv) {
+    try {
+        const res = await fetch('/ask', {
+            method: 'POST',
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify(body)
+        });
+        if (handleUnauthorized(res)) {
+            answerDiv.textContent = "Please log in again to keep your history.";
+            return;
+        }
+        let data = await res.json();
+        answerDiv.textContent = data.answer || data.detail || "I couldn't generate a response. Please try again.";
+
+        // Slow runs come back as a token; poll for the answer.
+        while (data.pending && data.token) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            const poll = await fetch('/ask/result/' + encodeURIComponent(data.token));
+            if (!poll.ok) break;
+            data = await poll.json();
+            answerDiv.textContent = data.answer || data.detail || "I couldn't generate a response. Please try again.";
+        }
+    } catch (err) {
+        console.error(err);
+        answerDiv.textContent = "There was an error contacting the server. Please try again.";
+    }
+}
+
+// Initialize auth UI on load
+updateAuthUI();
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import os
+import re
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+}
+
+# Hashed asset URLs never change content, so browsers may keep them forever.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The page itself must be revalidated, which is a cheap 304 via its ETag.
+PAGE_CACHE_CONTROL = "no-cache"
+
+
+# ---------- Minification ----------
+# Deliberately conservative: only whitespace and comments that can't be
+# inside strings are touched.
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE = re.compile(r"\s*([{};:,>])\s*")
+_JS_LINE_COMMENT = re.compile(r"^\s*//.*$", re.M)
+_HTML_COMMENT = re.compile(r"<!--.*?-->", re.S)
+
+
+def minify_css(text: str) -> str:
+    text = _CSS_COMMENT.sub("", text)
+    text = " ".join(text.split())
+    return _CSS_SPACE.sub(r"\1", text).replace(";}", "}")
+
+
+def minify_js(text: str) -> str:
+    text = _JS_LINE_COMMENT.sub("", text)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip()) + "\n"
+
+
+def minify_html(text: str) -> str:
+    text = _HTML_COMMENT.sub("", text)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip()) + "\n"
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js, ".html": minify_html}
+
+
+# ---------- Built Assets ----------
+class Asset:
+    """
+    One file, minified and pre-compressed once, with a strong ETag per
+    encoding.
+    """
+
+    __slots__ = ("name", "content_type", "digest", "bodies")
+
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.bodies: Dict[str, bytes] = {"identity": body}
+
+        gz = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gz) < len(body):
+            self.bodies["gzip"] = gz
+        if brotli is not None:
+            br = brotli.compress(body, quality=11)
+            if len(br) < len(body):
+                self.bodies["br"] = br
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}-{encoding}"'
+
+    def choose_encoding(self, accept_encoding: str) -> str:
+        accepted = {
+            part.split(";")[0].strip().lower()
+            for part in accept_encoding.split(",")
+            if part.strip() and not part.strip().endswith(";q=0")
+        }
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding
+        return "identity"
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return any(self.etag(encoding) in tags for encoding in self.bodies)
+
+
+class StaticBundle:
+    """
+    The index page plus its CSS/JS. Assets are published under
+    content-hashed names (app.<hash>.css) and the page's {{app.css}}-style
+    placeholders are rewritten to point at them.
+    """
+
+    def __init__(self, directory: str = STATIC_DIR, url_prefix: str = "/static/"):
+        self.assets: Dict[str, Asset] = {}
+        urls = {}
+
+        for filename in sorted(os.listdir(directory)):
+            stem, ext = os.path.splitext(filename)
+            if filename == "index.html" or ext not in MINIFIERS:
+                continue
+            with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                body = MINIFIERS[ext](f.read()).encode("utf-8")
+            asset = Asset(filename, body)
+            hashed = f"{stem}.{asset.digest[:10]}{ext}"
+            asset.name = hashed
+            self.assets[hashed] = asset
+            urls[filename] = url_prefix + hashed
+
+        with open(os.path.join(directory, "index.html"), encoding="utf-8") as f:
+            page = minify_html(f.read())
+        for filename, url in urls.items():
+            page = page.replace("{{" + filename + "}}", url)
+        self.index = Asset("index.html", page.encode("utf-8"))
@@ -0,0 +1,331 @@
+import os
+import queue
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+
+from metrics import SQLITE_QUERY_SECONDS, timed
+
+# ---------- Settings ----------
+DB_PATH = os.environ.get("HEALTH_DB_PATH", "health_ai.db")
+
+POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("SQLITE_POOL_TIMEOUT", "10"))
+JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "20000"))
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+STATEMENT_CACHE_SIZE = int(os.environ.get("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+
+
+# ---------- Connection Pool ----------
+class ConnectionPool:
+    """
+    Thread-safe pool of SQLite connections with the pragmas applied once
+    per connection. Connections are opened lazily up to `size`; callers
+    beyond that wait up to `timeout` seconds for one to be returned.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = POOL_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        journal_mode: str = JOURNAL_MODE,
+        synchronous: str = SYNCHRONOUS,
+        cache_size_kb: int = CACHE_SIZE_KB,
+        busy_timeout_ms: int = BUSY_TIMEOUT_MS,
+        statement_cache_size: int = STATEMENT_CACHE_SIZE,
+    ):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.statement_cache_size = statement_cache_size
+
+        # LIFO keeps the most recently used (warmest) connections in play.
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {-self.cache_size_kb}")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no SQLite connection free after {self.timeout} seconds")
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection. The transaction is committed when the block
+        exits normally and rolled back if it raises.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
+
+
+pool = ConnectionPool(DB_PATH)
+
+
+# ---------- Schema ----------
+# messages_fts rowids put the user id above the message id, leaving room
+# for 2**36 message ids and 2**27 users.
+SEARCH_ROWID_SHIFT = 36
+
+
+def search_rowid(user_id: int, message_id: int) -> int:
+    return (user_id << SEARCH_ROWID_SHIFT) | message_id
+
+
+def decode_message(value) -> str:
+    """
+    messages.message is TEXT, or for old long answers compressed by
+    maintenance.py, a zlib BLOB. Every reader goes through this.
+    """
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+
+def _create_tables(c):
+    # Users table
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        );
+        """
+    )
+
+    # Messages table (chat/history)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            role TEXT NOT NULL,        -- "user" or "assistant"
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        """
+    )
+
+    # One Assistants conversation thread per logged-in user
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS assistant_threads (
+            user_id INTEGER PRIMARY KEY,
+            thread_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        """
+    )
+
+    # History is always read per user in id order (keyset pagination).
+    c.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_user_id_id
+        ON messages (user_id, id);
+        """
+    )
+
+
+def _create_search_index(c):
+    # Full-text index over history (see search.py). It keeps its own
+    # (uncompressed) copy of the text, for snippets, and is kept in sync
+    # by triggers; rows saved before it existed are added by `python
+    # manage.py backfill-search`. Its rowid is search_rowid(user_id, id),
+    # so each user's rows form one rowid range that searches are confined to.
+    had_index = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+    ).fetchone()
+    c.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message,
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        );
+        """
+    )
+    c.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message)
+            VALUES ((new.user_id << {SEARCH_ROWID_SHIFT}) | new.id, new.message);
+        END;
+        """
+    )
+    c.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            DELETE FROM messages_fts WHERE rowid = (old.user_id << {SEARCH_ROWID_SHIFT}) | old.id;
+        END;
+        """
+    )
+    if not had_index and c.execute("SELECT 1 FROM messages LIMIT 1").fetchone():
+        print("History search index created; run `python manage.py backfill-search` to index existing messages.")
+
+
+def _create_search_update_trigger(c):
+    # Compressing a message (a BLOB) leaves the indexed text as it is.
+    c.execute("DROP TRIGGER IF EXISTS messages_fts_update")
+    c.execute(
+        f"""
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF message ON messages
+        WHEN typeof(new.message) = 'text' BEGIN
+            UPDATE messages_fts SET message = new.message
+            WHERE rowid = (old.user_id << {SEARCH_ROWID_SHIFT}) | old.id;
+        END;
+        """
+    )
+
+
+def _create_maintenance_state(c):
+    # Progress markers of maintenance.py that must outlive the process.
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        """
+    )
+
+
+# Schema changes, in order. PRAGMA user_version records how many a
+# database has had; init_db() applies the rest. Each one must also be
+# harmless on a database that already has its changes, since databases
+# created before versioning start at 0. Append, never edit or reorder.
+MIGRATIONS = [
+    _create_tables,
+    _create_search_index,
+    _create_search_update_trigger,
+    _create_maintenance_state,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version() -> int:
+    with pool.connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db():
+    """
+    Bring the schema up to date. When it already is, this is a single
+    read, so every process can call it at startup.
+    """
+    if schema_version() >= SCHEMA_VERSION:
+        return
+
+    with pool.connection() as conn:
+        # Lets maintenance.py hand freed pages back to the OS a few at a
+        # time. The WAL pragma has already written the file header, so even
+        # a new database needs a VACUUM for this to stick (instant while it
+        # is empty); existing ones switch on `python manage.py vacuum`.
+        if not conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+
+        # Holding the write lock from here on, a second process migrating
+        # at the same time waits, then finds nothing left to do.
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for migrate in MIGRATIONS[version:]:
+            migrate(conn)
+        conn.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+
+
+# ---------- Assistant Threads ----------
+@timed(SQLITE_QUERY_SECONDS, "get_user_thread")
+def get_user_thread(user_id: int) -> Optional[str]:
+    with pool.connection() as conn:
+        row = conn.execute(
+            "SELECT thread_id FROM assistant_threads WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+    return row[0] if row else None
+
+
+@timed(SQLITE_QUERY_SECONDS, "claim_user_thread")
+def claim_user_thread(user_id: int, thread_id: str) -> str:
+    """
+    Store thread_id as the user's thread unless one is stored already, and
+    return whichever is stored: another worker may have got there first.
+    """
+    with pool.connection() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO assistant_threads (user_id, thread_id) VALUES (?, ?)",
+            (user_id, thread_id),
+        )
+        return conn.execute("SELECT thread_id FROM assistant_threads WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+@timed(SQLITE_QUERY_SECONDS, "replace_user_thread")
+def replace_user_thread(user_id: int, old_thread_id: str, thread_id: str) -> str:
+    """
+    Swap the user's thread from old_thread_id to thread_id, unless another
+    worker has already replaced it, and return whichever is stored.
+    """
+    with pool.connection() as conn:
+        conn.execute(
+            "UPDATE assistant_threads SET thread_id = ? WHERE user_id = ? AND thread_id = ?",
+            (thread_id, user_id, old_thread_id),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO assistant_threads (user_id, thread_id) VALUES (?, ?)",
+            (user_id, thread_id),
+        )
+        return conn.execute("SELECT thread_id FROM assistant_threads WHERE user_id = ?", (user_id,)).fetchone()[0]
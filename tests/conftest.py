@@ -0,0 +1,41 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app is a set of top-level modules run from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read at import time: point everything at a scratch
+# directory and leave background jobs off before any test imports main.
+_scratch = tempfile.mkdtemp(prefix="health-ai-tests-")
+os.environ.setdefault("HEALTH_DB_PATH", os.path.join(_scratch, "health_ai.db"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("MAINTENANCE_INTERVAL", "0")
+
+_usernames = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def database():
+    import storage
+
+    storage.init_db()
+    return storage.pool
+
+
+@pytest.fixture
+def new_user(database):
+    """
+    Factory: a new user in the test database, as (user_id, auth headers).
+    """
+    import auth
+    import main
+
+    def create():
+        user_id = main.create_user(f"user{next(_usernames)}", "not-a-real-hash")
+        return user_id, {"Authorization": f"Bearer {auth.create_session_token(user_id)}"}
+
+    return create
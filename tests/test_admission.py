@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import assistant
+from ratelimit import ConcurrencyLimiter, RateLimited, TokenBucketLimiter
+
+
+def test_a_request_refused_a_slot_spends_no_upstream_budget(monkeypatch):
+    budget = TokenBucketLimiter(rate=1 / 60, burst=2, max_keys=1)
+    slots = ConcurrencyLimiter(1, max_queue=0, max_wait=1)
+    monkeypatch.setattr(assistant, "_upstream_budget", budget)
+    monkeypatch.setattr(assistant, "_slots", slots)
+
+    async def run():
+        await assistant._admit()  # holds the only slot
+        for _ in range(5):
+            with pytest.raises(RateLimited) as refused:
+                await assistant._admit()
+            assert refused.value.reason == "queue_full"
+        slots.release()
+        await assistant._admit()  # the second budget token is still there
+        slots.release()
+
+    asyncio.run(run())
+    assert budget.stats()["allowed"] == 2
+    assert budget.stats()["limited"] == 0
+
+
+def test_a_request_refused_budget_gives_its_slot_back(monkeypatch):
+    monkeypatch.setattr(assistant, "_upstream_budget", TokenBucketLimiter(rate=1 / 60, burst=1, max_keys=1))
+    slots = ConcurrencyLimiter(1, max_queue=0, max_wait=1)
+    monkeypatch.setattr(assistant, "_slots", slots)
+
+    async def run():
+        await assistant._admit()
+        slots.release()
+        with pytest.raises(RateLimited) as refused:
+            await assistant._admit()
+        assert refused.value.reason == "upstream_budget"
+
+    asyncio.run(run())
+    assert slots.in_flight == 0
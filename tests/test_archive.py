@@ -0,0 +1,93 @@
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from maintenance import compress_message
+
+ADMIN = {"X-Admin-Token": "test-admin-token"}
+LONG_ANSWER = "Stay hydrated, rest, and see a doctor if the fever lasts more than three days. " * 40
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", ADMIN["X-Admin-Token"])
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def history(new_user, database):
+    """
+    A user with a short conversation, an accented message and an old
+    answer already compressed to a BLOB by maintenance.
+    """
+    user_id, headers = new_user()
+    main.save_messages(
+        [
+            (user_id, "user", "I have a fever, what should I do?"),
+            (user_id, "assistant", LONG_ANSWER),
+            (user_id, "user", "¿Y si tengo dolor de cabeza? 🤒\nSecond line."),
+            (user_id, "assistant", "Try resting in a dark room."),
+        ]
+    )
+    with database.connection() as conn:
+        conn.execute(
+            "UPDATE messages SET message = ? WHERE user_id = ? AND message = ?",
+            (compress_message(LONG_ANSWER), user_id, LONG_ANSWER),
+        )
+        (blobs,) = conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE user_id = ? AND typeof(message) = 'blob'", (user_id,)
+        ).fetchone()
+    assert blobs == 1
+    return user_id, headers
+
+
+def lines(body: bytes):
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+def conversation(records):
+    return [(r["role"], r["message"], r["created_at"]) for r in records]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_export_then_import_reproduces_the_history(client, new_user, history, compressed):
+    user_id, headers = history
+    exported = client.get("/history/export", params={"gzip": compressed}, headers=headers)
+    assert exported.status_code == 200
+    body = gzip.decompress(exported.content) if compressed else exported.content
+    records = lines(body)
+    assert [r["user_id"] for r in records] == [user_id] * 4
+    assert records[1]["message"] == LONG_ANSWER  # the BLOB row exports as text
+
+    copy_id, copy_headers = new_user()
+    upload_headers = {**ADMIN, "Content-Encoding": "gzip"} if compressed else ADMIN
+    imported = client.post(
+        "/admin/import", params={"user_id": copy_id}, content=exported.content, headers=upload_headers
+    )
+    assert imported.status_code == 200
+    assert imported.json()["imported"] == 4
+
+    copy = lines(client.get("/history/export", headers=copy_headers).content)
+    assert conversation(copy) == conversation(records)
+    original_page = client.get("/history", headers=headers).json()
+    copy_page = client.get("/history", headers=copy_headers).json()
+    assert [(m["role"], m["message"]) for m in copy_page] == [(m["role"], m["message"]) for m in original_page]
+
+
+def test_import_with_keep_ids_skips_rows_that_exist(client, history):
+    user_id, headers = history
+    exported = client.get("/admin/export", params={"user_id": user_id}, headers=ADMIN)
+    assert exported.status_code == 200
+
+    again = client.post("/admin/import", params={"keep_ids": True}, content=exported.content, headers=ADMIN)
+    assert again.json()["imported"] == 0
+    assert again.json()["skipped"] == 4
+    assert lines(client.get("/history/export", headers=headers).content) == lines(exported.content)
+
+
+def test_admin_endpoints_need_the_token(client):
+    assert client.get("/admin/export").status_code == 403
+    assert client.get("/admin/export", headers={"X-Admin-Token": "wrong"}).status_code == 403
@@ -0,0 +1,33 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+EMERGENCY = {"question": "I think I am having a heart attack"}
+
+
+@pytest.fixture(scope="module")
+def client():
+    # No lifespan: emergency answers never reach the assistant, and
+    # anonymous ones are not saved.
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize(
+    "path, body",
+    [
+        ("/ask", EMERGENCY),
+        ("/ask/stream", EMERGENCY),
+        ("/ask/batch", {"questions": [EMERGENCY]}),
+    ],
+)
+@pytest.mark.parametrize("authorization", ["Bearer not-a-token", "Basic dXNlcjpwdw==", "Bearer "])
+def test_invalid_authorization_is_refused(client, path, body, authorization):
+    response = client.post(path, json=body, headers={"Authorization": authorization})
+    assert response.status_code == 401
+
+
+def test_no_authorization_is_anonymous(client):
+    response = client.post("/ask", json=EMERGENCY)
+    assert response.status_code == 200
+    assert response.json()["answer"] == main.EMERGENCY_ANSWER
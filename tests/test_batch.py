@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from assistant import ERROR_ANSWER, RunPending
+from ratelimit import RateLimited, TokenBucketLimiter
+
+# Question -> how the fake assistant handles it. Later questions finish
+# first, so completion order is the reverse of question order.
+QUESTIONS = [
+    "What is a normal resting heart rate?",
+    "I think I'm having a heart attack",
+    "fail: how much sleep do teenagers need?",
+    "busy: is coffee dehydrating?",
+    "pending: what causes hiccups?",
+    "fallback: are eggs bad for cholesterol?",
+    "How often should I stretch?",
+]
+EXPECTED = ["ok", "emergency", "error", "busy", "pending", "fallback", "ok"]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def answer_question(question, user_id=None):
+        await asyncio.sleep(0.03 * (len(QUESTIONS) - QUESTIONS.index(question)))
+        kind = question.split(":")[0]
+        if kind == "fail":
+            raise RuntimeError("upstream broke")
+        if kind == "busy":
+            raise RateLimited(5, "upstream_budget")
+        if kind == "pending":
+            raise RunPending("token-123")
+        if kind == "fallback":
+            return ERROR_ANSWER
+        return f"Answer to: {question}"
+
+    monkeypatch.setattr(main, "answer_question", answer_question)
+    monkeypatch.setattr(main, "ask_batch_limiter", TokenBucketLimiter(rate=0, burst=1))
+    return TestClient(main.app)
+
+
+def body():
+    return {"questions": [{"question": q} for q in QUESTIONS]}
+
+
+def check(results):
+    by_index = {r["index"]: r for r in results}
+    assert sorted(by_index) == list(range(len(QUESTIONS)))
+    assert [by_index[i]["status"] for i in range(len(QUESTIONS))] == EXPECTED
+    assert by_index[0]["answer"] == f"Answer to: {QUESTIONS[0]}"
+    assert by_index[1]["answer"] == main.EMERGENCY_ANSWER
+    assert by_index[2]["answer"] == main.ERROR_ANSWER
+    assert by_index[3]["retry_after"] == 5
+    assert by_index[4]["token"] == "token-123"
+    assert by_index[5]["answer"] == ERROR_ANSWER
+
+
+def test_results_come_back_in_question_order(client):
+    response = client.post("/ask/batch", json=body())
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == list(range(len(QUESTIONS)))
+    check(results)
+
+
+def test_streamed_results_arrive_as_they_finish(client):
+    response = client.post("/ask/batch", params={"stream": True}, json=body())
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    check(results)
+    # The emergency is answered up front; the rest in completion order.
+    assert [r["index"] for r in results] == [1, 6, 5, 4, 3, 2, 0]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_answered_questions_are_saved_in_question_order(client, new_user, stream):
+    _, headers = new_user()
+    response = client.post("/ask/batch", params={"stream": stream}, json=body(), headers=headers)
+    assert response.status_code == 200
+    response.read()
+
+    saved = [m["message"] for m in client.get("/history", headers=headers).json()]
+    # ok, emergency and fallback results are saved; error, busy and
+    # pending ones are not.
+    kept = [i for i, status in enumerate(EXPECTED) if status in ("ok", "emergency", "fallback")]
+    assert saved[::2] == [QUESTIONS[i] for i in kept]
@@ -0,0 +1,35 @@
+from cache import AnswerCache
+
+
+def test_peek_never_reads_sqlite_and_lookup_does(tmp_path):
+    path = str(tmp_path / "cache.db")
+    # Two caches on one file stand in for two worker processes.
+    writer = AnswerCache(db_path=path)
+    reader = AnswerCache(db_path=path)
+    writer.put("How much water should I drink?", "About 2 litres.")
+
+    assert reader.peek("how much water should I drink") is None
+    assert reader.lookup("how much water should I drink") == "About 2 litres."
+    assert reader.peek("how much water should I drink") == "About 2 litres."
+    assert reader.stats()["shared_hits"] == 1
+
+
+def test_get_is_peek_then_lookup():
+    cache = AnswerCache()
+    assert cache.get("unknown") is None
+    cache.put("Known?", "Yes.")
+    assert cache.get("known") == "Yes."
+    assert cache.stats()["misses"] == 1
+
+
+def test_constructor_opens_nothing_until_load(tmp_path):
+    path = str(tmp_path / "answers.db")
+    AnswerCache(db_path=path).put("What is a normal heart rate?", "60 to 100 beats a minute.")
+
+    cache = AnswerCache(db_path=str(tmp_path / "other.db"))
+    assert not (tmp_path / "other.db").exists()
+
+    cache = AnswerCache(db_path=path)
+    assert cache.stats()["entries"] == 0
+    cache.load()
+    assert cache.peek("what is a normal heart rate") == "60 to 100 beats a minute."
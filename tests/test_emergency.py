@@ -0,0 +1,91 @@
+import pytest
+
+from emergency import load_detector
+
+# The substring list /ask checked before emergency.py. Anything it flagged
+# must still be flagged.
+LEGACY_PHRASES = [
+    "not breathing",
+    "can't breathe",
+    "cannot breathe",
+    "bleeding a lot",
+    "overdose",
+    "suicidal",
+    "kill myself",
+    "want to hurt myself",
+    "heart attack",
+    "stroke",
+    "chest pain",
+    "passed out",
+    "unconscious",
+]
+
+TEMPLATES = [
+    "{}",
+    "I think I am having {} right now",
+    "My dad says he has {}, what do I do?",
+    "HELP: {}!!!",
+]
+
+# Inflected and compound forms the old substring scan caught.
+VARIANTS = [
+    "I have chest pains",
+    "I think I am having chest pains right now",
+    "both my uncles had heart attacks",
+    "he is having strokes",
+    "she stroked out last night",
+    "I overdosed on my pills",
+    "multiple overdoses in the house",
+    "she's not breathing properly",
+    "I cannot breathe",
+    "my cut is bleeding a lot",
+    "my friend passed out at the gym",
+    "signs of heatstroke in a toddler",
+    "brief unconsciousness after a fall",
+]
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return load_detector()
+
+
+def legacy_scan(text):
+    text = text.lower()
+    return any(phrase in text for phrase in LEGACY_PHRASES)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [template.format(phrase) for phrase in LEGACY_PHRASES for template in TEMPLATES] + VARIANTS,
+)
+def test_everything_the_legacy_scan_caught_is_caught(detector, message):
+    assert legacy_scan(message)
+    assert detector.is_emergency(message)
+
+
+@pytest.mark.parametrize(
+    "message", ["he is overdosing", "I keep thinking about killing myself", "my grandpa stopped breathing"]
+)
+def test_listed_verb_forms_are_caught(detector, message):
+    assert detector.is_emergency(message)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "How much water should I drink a day?",
+        "Is it normal to feel tired after a long run?",
+        "What does a heart rate of 60 mean?",
+        "Tips for painting my kitchen",
+        # Near misses: other forms of an emergency phrase's words.
+        "Why do I feel like I might pass out when I stand up?",
+        "Is stroking a cat good for lowering blood pressure?",
+        "I was stroking my beard",
+        "Why do scalp cuts bleed a lot?",
+        "do nosebleeds bleed a lot",
+        "can not breathe through my nose at night when I have a cold",
+    ],
+)
+def test_ordinary_questions_are_not_flagged(detector, message):
+    assert not detector.is_emergency(message)
@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+def page(client, headers, **params):
+    response = client.get("/history", params=params, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_before_id_pages_through_everything_once(client, new_user):
+    user_id, headers = new_user()
+    other_id, _ = new_user()
+    rows = []
+    for n in range(23):
+        rows.append((user_id, "user", f"question {n}"))
+        rows.append((other_id, "user", f"someone else's question {n}"))
+    main.save_messages(rows)
+
+    seen = []
+    before_id = None
+    while True:
+        params = {"limit": 5} if before_id is None else {"limit": 5, "before_id": before_id}
+        messages = page(client, headers, **params)
+        if not messages:
+            break
+        ids = [m["id"] for m in messages]
+        assert ids == sorted(ids)  # oldest first within a page
+        seen = messages + seen
+        before_id = ids[0]
+
+    assert [m["message"] for m in seen] == [f"question {n}" for n in range(23)]
+    assert len({m["id"] for m in seen}) == 23
+
+
+def test_cursor_is_stable_while_rows_are_added(client, new_user):
+    user_id, headers = new_user()
+    main.save_messages([(user_id, "user", f"old {n}") for n in range(12)])
+
+    newest = page(client, headers, limit=5)
+    assert [m["message"] for m in newest] == [f"old {n}" for n in range(7, 12)]
+
+    # New rows arrive while the client is scrolling back.
+    main.save_messages([(user_id, "user", f"new {n}") for n in range(4)])
+
+    older = page(client, headers, limit=5, before_id=newest[0]["id"])
+    assert [m["message"] for m in older] == [f"old {n}" for n in range(2, 7)]
+    oldest = page(client, headers, limit=5, before_id=older[0]["id"])
+    assert [m["message"] for m in oldest] == ["old 0", "old 1"]
+
+    # after_id picks up exactly the rows added since the newest one seen.
+    since = page(client, headers, after_id=newest[-1]["id"])
+    assert [m["message"] for m in since] == [f"new {n}" for n in range(4)]
+    assert page(client, headers, after_id=since[-1]["id"]) == []
+
+
+def test_history_needs_a_session(client):
+    assert client.get("/history").status_code == 401
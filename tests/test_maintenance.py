@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+import maintenance
+from maintenance import MaintenanceJob, Report, apply_compression
+from shared_state import LocalState
+from storage import MIGRATIONS, ConnectionPool
+
+LONG_ANSWER = "Drink water regularly through the day. " * 100
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(maintenance, "BATCH_ROWS", 10)
+    monkeypatch.setattr(maintenance, "PAUSE", 0)
+    pool = ConnectionPool(str(tmp_path / "history.db"))
+    with pool.connection() as conn:
+        for migrate in MIGRATIONS:
+            migrate(conn)
+    yield pool
+    pool.close()
+
+
+def add_answers(pool, count: int, days_ago: int):
+    with pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO messages (user_id, role, message, created_at) VALUES (1, 'assistant', ?, datetime('now', ?))",
+            [(LONG_ANSWER, f"-{days_ago} days")] * count,
+        )
+
+
+def blob_count(pool) -> int:
+    with pool.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM messages WHERE typeof(message) = 'blob'").fetchone()[0]
+
+
+def test_later_passes_start_after_what_was_already_compressed(pool):
+    add_answers(pool, 45, days_ago=60)
+    add_answers(pool, 5, days_ago=1)
+
+    first = Report()
+    apply_compression(pool, first, days=30)
+    assert first.rows_compressed == 45
+    assert blob_count(pool) == 45
+
+    # Nothing new is old enough: the next pass reads no window at all.
+    second = Report()
+    apply_compression(pool, second, days=30)
+    assert second.batches == 0
+
+    # Rows that age past the cutoff later are still picked up.
+    with pool.connection() as conn:
+        conn.execute("UPDATE messages SET created_at = datetime('now', '-40 days') WHERE typeof(message) = 'text'")
+    third = Report()
+    apply_compression(pool, third, days=30)
+    assert third.rows_compressed == 5
+    assert blob_count(pool) == 50
+
+
+def test_a_stopped_pass_ends_after_its_batch_and_resumes_later(pool):
+    add_answers(pool, 45, days_ago=60)
+    stop = threading.Event()
+    stop.set()
+
+    first = Report()
+    apply_compression(pool, first, days=30, stop=stop)
+    assert first.batches == 1
+    assert blob_count(pool) == 10
+
+    rest = Report()
+    apply_compression(pool, rest, days=30)
+    assert rest.rows_compressed == 35
+
+
+def test_stop_waits_for_the_pass_in_progress(monkeypatch):
+    events = []
+
+    def slow_pass(pool, stop=None):
+        events.append("started")
+        while not stop.is_set():
+            time.sleep(0.01)
+        time.sleep(0.1)  # the batch in progress
+        events.append("finished")
+        return Report()
+
+    monkeypatch.setattr(maintenance, "run_maintenance", slow_pass)
+    job = MaintenanceJob(pool=None, state=LocalState(), interval=0.01)
+    job.start()
+    while not events:
+        time.sleep(0.01)
+    job.stop()
+    assert events == ["started", "finished"]
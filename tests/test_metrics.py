@@ -0,0 +1,87 @@
+import math
+import re
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$")
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+
+
+def parse_labels(text: str) -> dict:
+    labels, end = {}, 0
+    for match in LABEL.finditer(text or ""):
+        assert match.start() == end, f"bad label syntax: {text!r}"
+        labels[match.group(1)] = match.group(2)
+        end = match.end()
+    assert end == len(text or ""), f"bad label syntax: {text!r}"
+    return labels
+
+
+def parse(text: str):
+    """
+    Prometheus text format -> ({family: type}, [(name, labels, value)]).
+    """
+    types, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, family, kind = line.split(" ", 3)
+            types[family] = kind
+        elif line.startswith("#") or not line:
+            continue
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"unparseable sample line: {line!r}"
+            name, labels, value = match.groups()
+            samples.append((name, parse_labels(labels), float(value)))
+    return types, samples
+
+
+@pytest.fixture(scope="module")
+def exposition():
+    client = TestClient(main.app)
+    # Traffic first, so the request and query histograms have series.
+    for _ in range(3):
+        client.post("/ask", json={"question": "I think I am having a heart attack"})
+        client.get("/stats")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return parse(response.text)
+
+
+def test_every_sample_belongs_to_a_declared_family(exposition):
+    types, samples = exposition
+    assert samples
+    for name, _, value in samples:
+        family = name
+        if family not in types:
+            family = re.sub(r"_(bucket|count|sum)$", "", name)
+            assert types.get(family) == "histogram", f"{name} has no # TYPE line"
+        assert not math.isnan(value)
+
+
+def test_histograms_are_cumulative_and_consistent(exposition):
+    types, samples = exposition
+    buckets = defaultdict(list)
+    counts = {}
+    for name, labels, value in samples:
+        if name.endswith("_bucket"):
+            le = labels.pop("le")
+            series = (name[: -len("_bucket")], tuple(sorted(labels.items())))
+            buckets[series].append((float(le), value))
+        elif name.endswith("_count") and types.get(name[: -len("_count")]) == "histogram":
+            counts[(name[: -len("_count")], tuple(sorted(labels.items())))] = value
+
+    assert buckets, "no histogram series rendered"
+    assert set(buckets) == set(counts)
+    for series, points in buckets.items():
+        bounds = [le for le, _ in points]
+        assert bounds == sorted(bounds), f"{series}: le out of order"
+        assert bounds[-1] == math.inf, f"{series}: no +Inf bucket"
+        values = [v for _, v in points]
+        assert all(a <= b for a, b in zip(values, values[1:])), f"{series}: buckets not monotonic"
+        assert counts[series] == values[-1], f"{series}: _count != +Inf bucket"
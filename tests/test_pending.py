@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import assistant
+from assistant import PendingRun, RunPending, collect_pending_run
+
+
+@pytest.fixture
+def retrieves(monkeypatch):
+    calls = []
+
+    async def retrieve_run(thread_id, run_id):
+        calls.append(run_id)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(id=run_id, status="in_progress")
+
+    monkeypatch.setattr(assistant, "_retrieve_run", retrieve_run)
+    monkeypatch.setattr(assistant, "RESULT_WAIT", 0.2)
+    return calls
+
+
+def test_concurrent_polls_of_one_token_share_one_upstream_poll(retrieves):
+    token = "shared-token"
+    assistant._pending_runs[token] = PendingRun("thread", "run", None, "question")
+
+    async def poll():
+        try:
+            await collect_pending_run(token)
+        except RunPending as pending:
+            return pending.token
+
+    async def run():
+        alone = await poll()
+        polls_alone = len(retrieves)
+        retrieves.clear()
+        together = await asyncio.gather(*(poll() for _ in range(20)))
+        return alone, polls_alone, together
+
+    try:
+        alone, polls_alone, together = asyncio.run(run())
+    finally:
+        assistant._pending_runs.pop(token, None)
+
+    assert alone == token
+    assert together == [token] * 20
+    assert len(retrieves) == polls_alone
@@ -0,0 +1,47 @@
+import asyncio
+
+from ratelimit import SharedTokenBucketLimiter, TokenBucketLimiter
+from shared_state import LocalState, SharedState
+
+
+def take_many(limiter, key, count):
+    async def run():
+        return [await limiter.take(key) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_workers_sharing_a_store_share_the_burst(tmp_path):
+    # Two stores on one file stand in for two worker processes.
+    path = str(tmp_path / "shared.db")
+    first = SharedTokenBucketLimiter(SharedState(path), "ask", rate=1 / 60, burst=5)
+    second = SharedTokenBucketLimiter(SharedState(path), "ask", rate=1 / 60, burst=5)
+
+    waits = take_many(first, "ip:1", 3) + take_many(second, "ip:1", 3)
+
+    assert waits[:5] == [0] * 5
+    assert 0 < waits[5] <= 60
+    assert take_many(second, "ip:2", 1) == [0]
+
+
+def test_take_refills_at_rate():
+    state = LocalState()
+    assert state.take("k", 2, rate=1, burst=2) == 0
+    wait = state.take("k", 1, rate=1, burst=2)
+    assert 0.9 < wait <= 1
+    # Refused takes spend nothing.
+    assert 0.9 < state.take("k", 1, rate=1, burst=2) <= 1
+
+
+def test_full_bucket_expires():
+    state = LocalState()
+    state.take("k", 1, rate=1000, burst=1)
+    asyncio.run(asyncio.sleep(0.01))
+    assert state.purge_expired() == 1
+
+
+def test_a_single_key_limiter_keeps_its_bucket():
+    limiter = TokenBucketLimiter(rate=1 / 60, burst=2, max_keys=1)
+    assert [limiter.acquire("upstream") for _ in range(2)] == [0, 0]
+    assert limiter.acquire("upstream") > 0
+    assert limiter.stats()["evicted"] == 0
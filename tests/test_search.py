@@ -0,0 +1,81 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from search import match_expression
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+def search(client, headers, q, **params):
+    response = client.get("/history/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_results_come_only_from_the_users_own_history(client, new_user):
+    # Adjacent user ids: their rows sit next to each other in the index.
+    (alice, alice_headers), (bob, bob_headers), (carol, _) = new_user(), new_user(), new_user()
+    main.save_messages(
+        [
+            (alice, "user", "Is turmeric good for joint pain?"),
+            (bob, "user", "Does turmeric stain teeth?"),
+            (carol, "user", "turmeric latte recipe"),
+            (bob, "assistant", "Turmeric can stain, brush afterwards."),
+        ]
+    )
+
+    alice_hits = search(client, alice_headers, "turmeric")
+    assert [hit["snippet"] for hit in alice_hits] == ["Is <mark>turmeric</mark> good for joint pain?"]
+    assert len(search(client, bob_headers, "turmeric")) == 2
+
+    # Asking for someone else's history is refused, not answered.
+    response = client.get("/history/search", params={"q": "turmeric", "user_id": bob}, headers=alice_headers)
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        'ginger" OR "turmeric',
+        "ginger AND NOT turmeric",
+        "ginger*",
+        "NEAR(ginger turmeric)",
+        "message: ginger",
+        "ginger) OR (",
+        "-ginger ^tea {x}",
+        "<script>ginger</script>",
+    ],
+)
+def test_query_syntax_is_never_passed_to_fts5(client, new_user, query):
+    # Raw, any of these is an FTS5 syntax error or a different query.
+    _, headers = new_user()
+    assert search(client, headers, query) == []
+
+
+def test_special_characters_are_matched_as_words_and_escaped(client, new_user):
+    user_id, headers = new_user()
+    main.save_messages([(user_id, "user", "Is <b>ginger</b> tea & honey OK?")])
+
+    hits = search(client, headers, 'GINGER" OR "x')
+    assert hits == []  # "x" is a word of the query too, and no row has it
+    (hit,) = search(client, headers, "<ginger> & tea!")
+    assert hit["snippet"] == "Is &lt;b&gt;<mark>ginger</mark>&lt;/b&gt; <mark>tea</mark> &amp; honey OK?"
+
+
+def test_match_expression_quotes_every_word():
+    assert match_expression('Ginger" OR "tea* NEAR(x)') == '"ginger" "tea" "near" "x"'
+    assert match_expression("???") is None
+
+
+def test_offset_is_capped(client, new_user):
+    _, headers = new_user()
+    params = {"q": "ginger", "offset": main.SEARCH_MAX_OFFSET}
+    assert client.get("/history/search", params=params, headers=headers).status_code == 200
+    params["offset"] += 1
+    assert client.get("/history/search", params=params, headers=headers).status_code == 422
+    params = {"q": "ginger", "limit": main.SEARCH_MAX_PAGE_SIZE + 1}
+    assert client.get("/history/search", params=params, headers=headers).status_code == 422
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+import main
+from singleflight import SingleFlight
+
+
+class Shared(Exception):
+    pass
+
+
+def test_concurrent_calls_share_one_result():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(20))), flight
+
+    results, flight = asyncio.run(run())
+    assert results == ["answer"] * 20
+    assert len(calls) == 1
+    assert flight.stats()["shared"] == 19
+
+
+def test_a_shared_error_reaches_every_waiter():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise Shared("upstream down")
+
+    async def run():
+        flight = SingleFlight(share_errors=(Shared,))
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(10)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, Shared) for r in results)
+    assert len(calls) == 1
+
+
+def test_other_errors_make_waiters_try_for_themselves():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        if len(calls) == 1:
+            raise RuntimeError("leader failed")
+        return "answer"
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[0], RuntimeError)
+    assert results[1:] == ["answer"] * 4
+    assert len(calls) == 5  # the failed leader, then one call per follower
+
+
+def test_a_cancelled_leader_request_does_not_cancel_the_call():
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.do("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers), flight
+
+    results, flight = asyncio.run(run())
+    assert results == ["answer"] * 3
+    assert flight.stats()["leaders"] == 1
+    assert flight.stats()["fallbacks"] == 0
+
+
+def test_a_cancelled_call_releases_every_waiter():
+    async def fetch():
+        await asyncio.sleep(10)
+
+    async def run():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        call = flight._calls["key"]
+        joined = [asyncio.ensure_future(flight.join("key")) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(asyncio.gather(*joined), 1)
+
+    assert asyncio.run(run()) == [None] * 3
+
+
+def test_identical_questions_make_one_assistant_call(monkeypatch):
+    calls = []
+
+    async def call_health_assistant(question, user_id=None):
+        calls.append(question)
+        await asyncio.sleep(0.05)
+        return "Drink water and rest."
+
+    monkeypatch.setattr(main, "call_health_assistant", call_health_assistant)
+    questions = [
+        "What helps a mild sunburn heal?",
+        "what helps a mild sunburn heal",
+        "WHAT HELPS A MILD SUNBURN HEAL??",
+    ]
+
+    async def run():
+        return await asyncio.gather(*(main.answer_question(questions[n % 3]) for n in range(12)))
+
+    assert asyncio.run(run()) == ["Drink water and rest."] * 12
+    assert len(calls) == 1
@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One worker process: both steps start at a wall-clock time shared with the
+# other process, with thread creation slow enough for their calls to overlap.
+WORKER = """
+import asyncio, json, os, sys, time
+import assistant
+
+start = float(sys.argv[1])
+created, deleted = [], []
+
+async def create_thread():
+    await asyncio.sleep(0.2)
+    created.append(f"thread-{os.getpid()}-{len(created)}")
+    return created[-1]
+
+async def delete_thread(thread_id):
+    deleted.append(thread_id)
+
+assistant._create_thread = create_thread
+assistant._delete_thread = delete_thread
+
+async def main():
+    await asyncio.sleep(start - time.time())
+    user_thread = await assistant._user_thread_id(1)
+    await asyncio.sleep(0.1)  # let the orphan deletion run
+
+    await asyncio.sleep(start + 1 - time.time())
+    async with assistant._conversation(1) as (run_thread, renew):
+        await asyncio.sleep(0.5)
+    print(json.dumps({"user_thread": user_thread, "run_thread": run_thread, "created": created, "deleted": deleted}))
+
+asyncio.run(main())
+"""
+
+
+def test_two_workers_agree_on_one_thread_and_never_share_a_run(tmp_path):
+    env = {
+        **os.environ,
+        "HEALTH_DB_PATH": str(tmp_path / "health_ai.db"),
+        "SHARED_STATE_PATH": str(tmp_path / "shared_state.db"),
+        "PYTHONPATH": ROOT,
+    }
+    subprocess.run([sys.executable, "-c", "import storage; storage.init_db()"], env=env, check=True)
+
+    start = str(time.time() + 2)
+    workers = [
+        subprocess.Popen([sys.executable, "-c", WORKER, start], env=env, stdout=subprocess.PIPE, text=True)
+        for _ in range(2)
+    ]
+    results = [json.loads(worker.communicate(timeout=30)[0]) for worker in workers]
+
+    # Both created a thread; the one that lost the claim deleted its own.
+    stored = results[0]["user_thread"]
+    assert results[1]["user_thread"] == stored
+    assert sorted(d for r in results for d in r["deleted"]) == [
+        r["created"][0] for r in results if r["created"][0] != stored
+    ]
+
+    # Concurrent runs: one gets the user's thread, the other a throwaway.
+    run_threads = sorted(r["run_thread"] for r in results)
+    assert stored in run_threads
+    assert run_threads[0] != run_threads[1]
@@ -0,0 +1,40 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "WS_MAX_CONNECTIONS", 1)
+    return TestClient(main.app)
+
+
+def test_unauthenticated_sockets_count_toward_the_cap(client):
+    open_before = main.chat_sockets.open
+    with client.websocket_connect("/ws/chat") as waiting:
+        # Accepted but not yet authenticated: it already holds the only place.
+        with client.websocket_connect("/ws/chat") as refused:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                refused.receive_json()
+            assert closed.value.code == 1013
+
+        waiting.send_json({"type": "auth", "token": "not-a-token"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            waiting.receive_json()
+        assert closed.value.code == main.WS_CLOSE_UNAUTHORIZED
+
+    assert main.chat_sockets.open == open_before
+
+
+def test_a_socket_dropped_before_auth_is_released(client):
+    open_before = main.chat_sockets.open
+    with client.websocket_connect("/ws/chat") as socket:
+        socket.close()
+    with client.websocket_connect("/ws/chat") as socket:
+        socket.send_json({"type": "auth"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            socket.receive_json()
+        assert closed.value.code == main.WS_CLOSE_UNAUTHORIZED
+    assert main.chat_sockets.open == open_before
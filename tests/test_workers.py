@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CPUS = os.cpu_count() or 1
+MIN_SPEEDUP = 1.3
+
+
+@pytest.mark.skipif(CPUS < 2, reason="worker scaling needs at least 2 CPUs")
+def test_throughput_scales_with_workers():
+    # Starts serve.py with 1 and then N workers against the fake upstream
+    # and compares requests/s on the CPU-bound scenarios.
+    workers = min(4, CPUS)
+    result = subprocess.run(
+        [
+            sys.executable, os.path.join(ROOT, "bench", "bench_workers.py"),
+            "--workers", f"1,{workers}",
+            "--requests", "1000",
+            "--history-rows", "5000",
+        ],
+        cwd=ROOT, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, result.stderr
+    speedup = json.loads(result.stdout)[f"speedup_{workers}_vs_1"]
+    for scenario, factor in speedup.items():
+        assert factor >= MIN_SPEEDUP, f"{scenario}: {workers} workers gave only {factor}x"
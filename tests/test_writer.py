@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from storage import MIGRATIONS, ConnectionPool
+from writer import MessageWriter
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "history.db"))
+    with pool.connection() as conn:
+        for migrate in MIGRATIONS:
+            migrate(conn)
+    yield pool
+    pool.close()
+
+
+def stored(pool):
+    with pool.connection() as conn:
+        return conn.execute("SELECT user_id, role, message FROM messages ORDER BY id").fetchall()
+
+
+def conversation(user_id: int, n: int):
+    return [(user_id, "user", f"question {n}"), (user_id, "assistant", f"answer {n}")]
+
+
+def test_stop_flushes_everything_queued(pool):
+    # The batch is still filling when stop() is called.
+    writer = MessageWriter(pool, batch_size=10_000, flush_interval=0.5)
+    writer.start()
+    for n in range(100):
+        assert writer.submit(conversation(1, n))
+    writer.stop()
+
+    assert stored(pool) == [record for n in range(100) for record in conversation(1, n)]
+    assert writer.stats()["written"] == 200
+    assert not writer.submit(conversation(1, 100))
+
+
+def test_one_bad_record_only_loses_its_own_submit(pool):
+    writer = MessageWriter(pool, flush_interval=0.2, retry_delay=0)
+    writer.start()
+    writer.submit(conversation(1, 1))
+    writer.submit([(2, "user", "question"), (2, "assistant", None)])  # message is NOT NULL
+    writer.submit(conversation(3, 3))
+    writer.stop()
+
+    assert stored(pool) == conversation(1, 1) + conversation(3, 3)
+    stats = writer.stats()
+    assert stats["written"] == 4
+    assert stats["failed"] == 2
+    assert stats["retried"] == writer.retry_attempts
+
+
+def test_a_transient_failure_is_retried(pool, monkeypatch):
+    writer = MessageWriter(pool, retry_delay=0)
+    insert = writer._insert
+    failures = iter([sqlite3.OperationalError("database is locked")])
+
+    def flaky_insert(records):
+        for error in failures:
+            raise error
+        insert(records)
+
+    monkeypatch.setattr(writer, "_insert", flaky_insert)
+    writer.start()
+    writer.submit(conversation(1, 1))
+    writer.stop()
+
+    assert stored(pool) == conversation(1, 1)
+    assert writer.stats()["retried"] == 1
+    assert writer.stats()["failed"] == 0
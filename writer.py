@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+from typing import List, Tuple
+
+from metrics import SQLITE_QUERY_SECONDS
+
+Record = Tuple[int, str, str]  # (user_id, role, message)
+
+INSERT_SQL = "INSERT INTO messages (user_id, role, message) VALUES (?, ?, ?)"
+
+
+class MessageWriter:
+    """
+    Write-behind persistence for history rows.
+
+    Requests hand records to a bounded queue and return immediately; one
+    background thread drains it and inserts up to batch_size records per
+    transaction with executemany, flushing at least every flush_interval
+    seconds. submit() returns False when the writer is not running or the
+    queue is full, so the caller can fall back to a synchronous write.
+
+    A batch that fails is retried retry_attempts times with doubling
+    delays (a busy database usually clears). If it still fails, each
+    submit()'s records are written in a transaction of their own, so one
+    bad record only loses the records submitted with it.
+    """
+
+    def __init__(
+        self,
+        pool,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        retry_attempts: int = 3,
+        retry_delay: float = 0.05,
+    ):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_attempts = retry_attempts
+        self.retry_delay = retry_delay
+        self._queue: "queue.Queue[List[Record]]" = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = threading.Event()
+
+        self.written = 0
+        self.batches = 0
+        self.rejected = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """
+        Stop accepting work and flush everything already queued.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, records: List[Record]) -> bool:
+        # Records of one submit() always land in the same transaction.
+        if self._thread is None or self._stopping.is_set():
+            self.rejected += 1
+            return False
+        try:
+            self._queue.put_nowait(records)
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "written": self.written,
+            "batches": self.batches,
+            "rejected": self.rejected,
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+        }
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                groups = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            size = len(groups[0])
+            deadline = time.monotonic() + self.flush_interval
+            while size < self.batch_size:
+                try:
+                    groups.append(self._queue.get_nowait())
+                    size += len(groups[-1])
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    groups.append(self._queue.get(timeout=remaining))
+                    size += len(groups[-1])
+                except queue.Empty:
+                    break
+
+            self._flush(groups)
+
+    def _flush(self, groups: List[List[Record]]):
+        batch = [record for group in groups for record in group]
+        start = time.perf_counter()
+        delay = self.retry_delay
+        for attempt in range(self.retry_attempts + 1):
+            try:
+                self._insert(batch)
+                break
+            except Exception as e:
+                print("ERROR writing message batch:", e)
+                if attempt == self.retry_attempts:
+                    self._flush_groups(groups)
+                    return
+                self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+        elapsed = time.perf_counter() - start
+        SQLITE_QUERY_SECONDS.observe(elapsed, "writer_flush")
+        self.last_flush_ms = elapsed * 1000
+        self.last_batch_size = len(batch)
+        self.written += len(batch)
+        self.batches += 1
+
+    def _flush_groups(self, groups: List[List[Record]]):
+        # The batch keeps failing: find the submit() at fault by writing
+        # each one alone.
+        for group in groups:
+            try:
+                self._insert(group)
+            except Exception as e:
+                self.failed += len(group)
+                print("ERROR writing messages, dropped", len(group), "records:", e)
+                continue
+            self.written += len(group)
+            self.batches += 1
+
+    def _insert(self, records: List[Record]):
+        with self.pool.connection() as conn:
+            conn.executemany(INSERT_SQL, records)